@@ -1,8 +1,14 @@
 import os
+import argparse
 import asyncio
 from dotenv import load_dotenv
 from pydantic_ai import Agent
 
+from history_store import build_history_store
+from instrumentation import run_agent, stream_agent
+from metrics import dump_metrics
+from models import aprewarm, build_model
+
 # --- Configuration ---
 load_dotenv()
 
@@ -13,12 +19,12 @@ if not os.environ.get("OPENAI_API_KEY"):
 # PydanticAI allows defining the model directly in the Agent constructor.
 # We use 'openai:gpt-3.5-turbo' to match the previous examples.
 agent = Agent(
-    'openai:gpt-5-nano',
+    build_model('openai:gpt-5-nano'),
     system_prompt='You are a helpful assistant.',
 )
 
 # --- Execution ---
-async def main():
+async def main(stream_mode: str = "tokens", session: str = "default"):
     print("Starting PydanticAI Agent...")
     
     if not os.environ.get("OPENAI_API_KEY"):
@@ -33,18 +39,35 @@ async def main():
     
     # PydanticAI's `run` method returns a result which contains new messages.
     # We can pass these messages back to the next run call to maintain context.
+    # The history store keeps a token-budgeted window of them in memory and the rest on disk,
+    # so a session can be resumed later with --session.
     
-    messages = []
+    history = build_history_store(session)
+
+    # Builds the models (and opens MODEL_PREWARM connections) before the first turn
+    await aprewarm()
 
     while True:
         try:
             user_input = input("\nUser: ")
             if user_input.lower() in ["quit", "exit", "q"]:
+                print(f"History stats: {history.stats()}")
+                dump_metrics()
                 print("Goodbye!")
                 break
 
+            if stream_mode == "tokens":
+                # Forward token deltas as they arrive
+                async with stream_agent("chat", agent, user_input, message_history=history.messages) as result:
+                    print("Agent: ", end="", flush=True)
+                    async for delta in result.stream_text(delta=True):
+                        print(delta, end="", flush=True)
+                    print()
+                await history.add(result.new_messages())
+                continue
+
             # Run the agent with the user input and the accumulated message history
-            result = await agent.run(user_input, message_history=messages)
+            result = await run_agent("chat", agent, user_input, message_history=history.messages)
             
             # Print the response
             # Handle potential attribute differences in pydantic-ai versions
@@ -57,8 +80,7 @@ async def main():
             # Update history with the new messages from this turn
             # result.new_messages() returns the messages exchanged in this run (User + Model)
             if hasattr(result, 'new_messages'):
-                print(f"Debug: New messages - {result.new_messages()}")
-                messages.extend(result.new_messages())
+                await history.add(result.new_messages())
             
         except KeyboardInterrupt:
             print("\nGoodbye!")
@@ -68,4 +90,9 @@ async def main():
             break
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stream-mode", choices=["tokens", "final"], default="tokens",
+                        help="Print token deltas as they arrive (default) or only the final answer")
+    parser.add_argument("--session", default="default", help="Conversation to resume from HISTORY_DIR")
+    args = parser.parse_args()
+    asyncio.run(main(args.stream_mode, args.session))
@@ -0,0 +1,65 @@
+"""
+Batch runner.
+
+Runs every request of a JSONL file through `agent` or `meal_agent` with a
+bounded number of requests in flight, writing one JSON result per line as
+each finishes. Progress is checkpointed next to the output file, so rerunning
+the same command after a crash resumes where it stopped (see batch.py).
+
+Input lines are JSON objects with the request text in `prompt` (or the field
+named by --field) and an optional `id`. Each request is a fresh conversation.
+Output lines carry the input line number, the id, the reply (or the error)
+and the latency.
+
+Usage:
+    uv run batch_runner.py meal_agent requests.jsonl results.jsonl --concurrency 20
+    uv run batch_runner.py agent requests.jsonl results.jsonl --restart
+"""
+import argparse
+import asyncio
+import importlib
+import json
+
+from batch import BatchRun
+from metrics import metrics
+from models import aprewarm
+from session_runner import TARGETS, max_rss_mb
+
+
+def agent_handler(module, run_turn, field: str):
+    async def handle(record: dict) -> dict:
+        reply, _ = await run_turn(module, record[field], [])
+        return {"reply": reply}
+    return handle
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of requests through an agent")
+    parser.add_argument("module", choices=sorted(TARGETS), help="Agent module to run")
+    parser.add_argument("input", help="JSONL file with one request object per line")
+    parser.add_argument("output", help="JSONL file the results are appended to")
+    parser.add_argument("--field", default="prompt", help="Field holding the request text")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum requests in flight")
+    parser.add_argument("--timeout", type=float, default=None, help="Seconds allowed per request")
+    parser.add_argument("--progress", type=float, default=10.0, help="Seconds between progress lines (0 = off)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the first line")
+    args = parser.parse_args()
+
+    module = importlib.import_module(args.module)
+    await aprewarm()
+    run = BatchRun(
+        agent_handler(module, TARGETS[args.module], args.field), args.input, args.output,
+        concurrency=args.concurrency, timeout=args.timeout, progress_every=args.progress,
+    )
+    try:
+        summary = await run.run(resume=not args.restart)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    summary["max_rss_mb"] = max_rss_mb()
+    print(json.dumps(summary, indent=2))
+    print(metrics.report())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
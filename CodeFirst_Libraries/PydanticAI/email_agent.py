@@ -1,11 +1,17 @@
 import os
+import argparse
 import asyncio
-import smtplib
 from email.message import EmailMessage
 from dotenv import load_dotenv
 from pydantic_ai import Agent, RunContext
 import nest_asyncio
 
+from history_store import build_history_store
+from instrumentation import instrument_tool, run_agent
+from mail_pool import get_mail_pool
+from metrics import dump_metrics
+from models import aprewarm, build_model
+
 # Apply nest_asyncio to allow nested event loops if necessary
 nest_asyncio.apply()
 
@@ -14,7 +20,7 @@ load_dotenv()
 
 # --- Agent Definition ---
 agent = Agent(
-    'openai:gpt-5-nano',
+    build_model('openai:gpt-5-nano'),
     system_prompt='You are a helpful email assistant. You can send emails using the defined tools.',
     deps_type=str # We can use deps to pass dependencies if needed, or simple type
  
@@ -22,6 +28,7 @@ agent = Agent(
 
 # --- Tool Definition ---
 @agent.tool
+@instrument_tool
 def send_email(ctx: RunContext[str], recipient: str, subject: str, body: str) -> str:
     """
     Send an email using Gmail SMTP.
@@ -49,21 +56,23 @@ def send_email(ctx: RunContext[str], recipient: str, subject: str, body: str) ->
     msg["To"] = recipient
 
     try:
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(sender, password)
-            server.send_message(msg)
+        # Sent on a pooled, already logged-in Gmail SMTP session (see mail_pool.py)
+        get_mail_pool().smtp(sender, password, lambda server: server.send_message(msg), operation="send_email")
         return f"Email sent successfully to {recipient}"
     except Exception as e:
         return f"Error sending email: {str(e)}"
 
 # --- Execution ---
-async def main():
+async def main(session: str = "email"):
     print("Starting Email Agent...")
     print("Ensure GMAIL_PASSWORD is set in your .env file.")
     
-    messages = []
+    # Token-budgeted window in memory, full log on disk (resumable with --session)
+    history = build_history_store(session)
     
+    # Builds the models (and opens MODEL_PREWARM connections) before the first turn
+    await aprewarm()
+
     while True:
         try:
             user_input = input("\nUser (or 'q' to quit): ")
@@ -71,12 +80,12 @@ async def main():
                 break
                 
             # Run the agent
-            result = await agent.run(user_input, message_history=messages)
+            result = await run_agent("email", agent, user_input, message_history=history.messages)
             
             print(f"Agent: {result.data}")
             
             # Update history
-            messages.extend(result.new_messages())
+            await history.add(result.new_messages())
             
         except KeyboardInterrupt:
             break
@@ -84,5 +93,10 @@ async def main():
             print(f"Error: {e}")
             break
 
+    print(f"Mail pool stats: {get_mail_pool().stats()}")
+    dump_metrics()
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--session", default="email", help="Conversation to resume from HISTORY_DIR")
+    asyncio.run(main(parser.parse_args().session))
@@ -0,0 +1,179 @@
+"""
+Token-budgeted, disk-backed message history.
+
+Keeps only the most recent turns that fit in HISTORY_MAX_TOKENS in memory and
+passes them as `message_history=`. Every turn is appended to a per-session
+JSONL log as it happens; turns evicted from memory can be folded into a
+running summary by a cheap model, and the summary is logged too. A session is
+resumed from its log lazily, the first time its history is needed, reading the
+log line by line so memory stays bounded however long the session has run.
+
+PydanticAI only adds the agent's system prompt when the history is empty, so
+the system prompt parts are kept separately and always lead the window.
+"""
+import json
+import os
+from collections import deque
+from dataclasses import replace
+from pathlib import Path
+from typing import Optional
+
+from pydantic_ai import Agent
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelMessagesTypeAdapter,
+    ModelRequest,
+    SystemPromptPart,
+)
+
+from models import build_model
+
+SUMMARY_PROMPT = """You keep a running summary of a conversation between a user and an assistant.
+Update the summary with the new part of the conversation. Keep facts, preferences, sent emails and open requests the assistant may need later; drop small talk.
+Respond with the updated summary only, in at most 200 words."""
+
+
+def _dump(messages: list[ModelMessage]) -> list:
+    return ModelMessagesTypeAdapter.dump_python(messages, mode="json")
+
+
+def _load(data: list) -> list[ModelMessage]:
+    return ModelMessagesTypeAdapter.validate_python(data)
+
+
+def transcript(messages: list[ModelMessage]) -> str:
+    lines = []
+    for message in messages:
+        for part in message.parts:
+            kind = part.part_kind
+            if kind == "user-prompt":
+                lines.append(f"User: {part.content}")
+            elif kind == "text":
+                lines.append(f"Assistant: {part.content}")
+            elif kind == "tool-call":
+                lines.append(f"Assistant called {part.tool_name}({part.args_as_json_str()})")
+            elif kind == "tool-return":
+                lines.append(f"Tool {part.tool_name} returned: {part.content}")
+    return "\n".join(lines)
+
+
+def estimate_tokens(messages: list[ModelMessage]) -> int:
+    """Rough token count (~4 characters per token of the conversation text)."""
+    return len(transcript(messages)) // 4 + 1
+
+
+class HistoryStore:
+    def __init__(self, path: Path, max_tokens: int = 4000, summarizer: Optional[Agent] = None):
+        self.path = Path(path)
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer
+        self.system_parts: list[SystemPromptPart] = []
+        self.summary = ""
+        self.evicted_turns = 0
+        self._turns: deque[tuple[list[ModelMessage], int]] = deque()  # (turn messages, estimated tokens)
+        self._tokens = 0
+        self._loaded = False
+
+    # --- Disk Log ---
+    def _append(self, record: dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def _load_log(self):
+        """Rebuilds the in-memory window from the log, keeping at most the budget in memory while reading."""
+        self._loaded = True
+        if not self.path.exists():
+            return
+        with open(self.path) as f:
+            for line in f:
+                record = json.loads(line)
+                if record["type"] == "system":
+                    self.system_parts = [SystemPromptPart(content=c) for c in record["parts"]]
+                elif record["type"] == "summary":
+                    self.summary = record["text"]
+                elif record["type"] == "turn":
+                    self._push(_load(record["messages"]))
+                    self._evict()
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self._load_log()
+
+    # --- Window ---
+    def _push(self, turn: list[ModelMessage]):
+        tokens = estimate_tokens(turn)
+        self._turns.append((turn, tokens))
+        self._tokens += tokens
+
+    def _evict(self) -> list[ModelMessage]:
+        """Drops the oldest turns (never the latest) until the window fits the budget; returns them."""
+        evicted = []
+        while len(self._turns) > 1 and self._tokens > self.max_tokens:
+            turn, tokens = self._turns.popleft()
+            self._tokens -= tokens
+            self.evicted_turns += 1
+            evicted.extend(turn)
+        return evicted
+
+    def _strip_system_parts(self, messages: list[ModelMessage]) -> list[ModelMessage]:
+        """Moves the system prompt parts of a session's first run out of its turn and into the log header."""
+        stripped = []
+        for message in messages:
+            if isinstance(message, ModelRequest) and any(isinstance(p, SystemPromptPart) for p in message.parts):
+                parts = [p for p in message.parts if isinstance(p, SystemPromptPart)]
+                if not self.system_parts:
+                    self.system_parts = parts
+                    self._append({"type": "system", "parts": [p.content for p in parts]})
+                message = replace(message, parts=[p for p in message.parts if not isinstance(p, SystemPromptPart)])
+            stripped.append(message)
+        return stripped
+
+    @property
+    def messages(self) -> list[ModelMessage]:
+        """The history to pass as `message_history=`: system prompt and summary, then the kept turns."""
+        self._ensure_loaded()
+        lead = list(self.system_parts)
+        if self.summary:
+            lead.append(SystemPromptPart(content=f"Summary of the earlier conversation:\n{self.summary}"))
+        window = [m for turn, _ in self._turns for m in turn]
+        return ([ModelRequest(parts=lead)] if lead else []) + window
+
+    async def add(self, new_messages: list[ModelMessage]):
+        """Records one run's new messages, spilling and summarizing turns that no longer fit."""
+        self._ensure_loaded()
+        turn = self._strip_system_parts(new_messages)
+        self._append({"type": "turn", "messages": _dump(turn)})
+        self._push(turn)
+        evicted = self._evict()
+        if evicted and self.summarizer is not None:
+            previous = f"Current summary:\n{self.summary}\n\n" if self.summary else ""
+            result = await self.summarizer.run(f"{previous}New conversation:\n{transcript(evicted)}")
+            self.summary = result.output
+            self._append({"type": "summary", "text": self.summary})
+
+    def stats(self) -> dict:
+        self._ensure_loaded()
+        return {
+            "turns_in_memory": len(self._turns),
+            "tokens_in_memory": self._tokens,
+            "evicted_turns": self.evicted_turns,
+            "summary_chars": len(self.summary),
+            "log_bytes": self.path.stat().st_size if self.path.exists() else 0,
+        }
+
+
+# --- Factories ---
+# HISTORY_DIR holds one <session>.jsonl log per session; HISTORY_SUMMARY=0 drops evicted turns without summarizing.
+def build_history_store(session: str = "default") -> HistoryStore:
+    summarizer = None
+    if os.environ.get("HISTORY_SUMMARY", "1") != "0":
+        try:
+            summarizer = Agent(build_model(os.environ.get("HISTORY_SUMMARY_MODEL", "openai:gpt-5-nano")), system_prompt=SUMMARY_PROMPT)
+        except Exception as e:
+            print(f"Error initializing the history summary agent: {e}")
+    return HistoryStore(
+        Path(os.environ.get("HISTORY_DIR", ".history")) / f"{session}.jsonl",
+        max_tokens=int(os.environ.get("HISTORY_MAX_TOKENS", "4000")),
+        summarizer=summarizer,
+    )
@@ -0,0 +1,72 @@
+"""
+PydanticAI instrumentation.
+
+Wrappers that report agent runs and tool calls to the metrics registry:
+`run_agent` for `agent.run`, `stream_agent` for `agent.run_stream` and the
+`instrument_tool` decorator for tool functions. Token counts come from
+the run usage, which covers every model request of the run, including
+tool-call round trips.
+"""
+import functools
+import inspect
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from pydantic_ai import Agent
+
+from metrics import metrics
+
+
+def model_name(agent: Agent) -> str:
+    return getattr(agent.model, "model_name", None) or str(agent.model)
+
+
+def usage_tokens(result) -> tuple[int, int]:
+    """
+    (input, output) tokens of a run result. `usage` is a method or a property depending on the
+    PydanticAI version, and older versions call the counts request/response tokens.
+    """
+    usage = result.usage() if callable(result.usage) else result.usage
+    input_tokens = getattr(usage, "input_tokens", None)
+    if input_tokens is None:
+        input_tokens = getattr(usage, "request_tokens", 0)
+    output_tokens = getattr(usage, "output_tokens", None)
+    if output_tokens is None:
+        output_tokens = getattr(usage, "response_tokens", 0)
+    return input_tokens or 0, output_tokens or 0
+
+
+async def run_agent(name: str, agent: Agent, *args, queued_at: Optional[float] = None, **kwargs):
+    """`agent.run(*args, **kwargs)`, recorded as an agent span called `name`."""
+    with metrics.span("agent", name, model_name(agent), queued_at=queued_at) as span:
+        result = await agent.run(*args, **kwargs)
+        span.usage(*usage_tokens(result))
+    return result
+
+
+@asynccontextmanager
+async def stream_agent(name: str, agent: Agent, *args, queued_at: Optional[float] = None, **kwargs):
+    """`agent.run_stream(*args, **kwargs)`, recorded once the stream has been consumed."""
+    with metrics.span("agent", name, model_name(agent), queued_at=queued_at) as span:
+        async with agent.run_stream(*args, **kwargs) as result:
+            yield result
+        span.usage(*usage_tokens(result))
+
+
+def instrument_tool(func):
+    """
+    Records every call of a tool function as a tool span. Apply it below `@agent.tool`
+    so the agent still sees the original signature and docstring.
+    """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            with metrics.span("tool", func.__name__):
+                return await func(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with metrics.span("tool", func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,310 @@
+"""
+Local intent router.
+
+Classifies a user request without a model call, using keyword rules first and
+a small TF-IDF + softmax classifier trained in memory second. When neither is
+confident enough the caller's LLM router is used as a fallback, and the router
+keeps count of how often each path was taken.
+"""
+import math
+import os
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, Optional
+
+# --- Seed Data ---
+MEAL_LABELS = ("BREAKFAST", "LUNCH", "DINNER", "OTHER")
+
+# A keyword names the label, so only words that can only be about food belong here: times of day
+# ("morning", "tonight") and verbs like "cook" or "roast" also appear in ordinary chat. Food words
+# still show up in chat ("I skipped lunch"), so a keyword only decides alongside a REQUEST_CUES match
+MEAL_KEYWORDS = {
+    "BREAKFAST": ("breakfast", "brunch", "pancake", "pancakes", "waffle", "waffles", "omelette", "omelet",
+                  "porridge", "oatmeal", "granola", "french toast", "scrambled eggs"),
+    "LUNCH": ("lunch", "lunchbox", "packed lunch", "sandwich", "bento"),
+    "DINNER": ("dinner", "supper", "evening meal", "sunday roast"),
+}
+
+MEAL_EXAMPLES = [
+    ("what can I cook for breakfast", "BREAKFAST"),
+    ("give me a quick breakfast recipe", "BREAKFAST"),
+    ("how do I make fluffy pancakes", "BREAKFAST"),
+    ("an energetic morning smoothie bowl", "BREAKFAST"),
+    ("eggs benedict for brunch", "BREAKFAST"),
+    ("overnight oats with berries", "BREAKFAST"),
+    ("something healthy to eat before work", "BREAKFAST"),
+    ("I need a lunch idea", "LUNCH"),
+    ("a light meal for midday", "LUNCH"),
+    ("quick salad to take to the office", "LUNCH"),
+    ("a sandwich I can pack for school", "LUNCH"),
+    ("easy noodle soup for lunch", "LUNCH"),
+    ("something fast to eat at my desk", "LUNCH"),
+    ("what should I cook for dinner", "DINNER"),
+    ("a hearty stew for tonight", "DINNER"),
+    ("comforting pasta bake for the family this evening", "DINNER"),
+    ("roast chicken with vegetables for supper", "DINNER"),
+    ("a romantic dinner for two", "DINNER"),
+    ("a substantial main course after a long day", "DINNER"),
+    ("hello how are you", "OTHER"),
+    ("what is the capital of france", "OTHER"),
+    ("tell me a joke", "OTHER"),
+    ("can you help me write an email", "OTHER"),
+    ("what is the weather like today", "OTHER"),
+    ("explain how a compiler works", "OTHER"),
+    ("thanks that was great", "OTHER"),
+    ("good morning how are you", "OTHER"),
+    ("what is on tv tonight", "OTHER"),
+    ("how do I fix my car", "OTHER"),
+    ("how do I make money fast", "OTHER"),
+    ("how do I reset my password", "OTHER"),
+    ("how do I change a flat tire", "OTHER"),
+]
+
+# Words that make a message an ask rather than a remark
+REQUEST_CUES = (
+    "recipe", "recipes", "cook", "make", "bake", "prepare", "whip up", "idea", "ideas", "suggest", "suggestion",
+    "recommend", "give me", "show me", "help me", "what should", "what can", "what to", "what's for",
+    "what is for", "i want", "i'd like", "i would like", "i need", "can you", "could you", "please",
+    "how do i", "how to", "quick", "easy", "healthy",
+)
+
+# Confidence of a keyword match with and without a request cue; the second is below any sensible
+# threshold, so "I had dinner with friends" goes to the LLM rather than to a chef
+KEYWORD_CONFIDENCE = 0.95
+UNCUED_KEYWORD_CONFIDENCE = 0.3
+
+RECIPE_LABELS = ("RECIPE", "OTHER")
+
+RECIPE_KEYWORDS = {
+    "RECIPE": ("recipe", "recipes", "bake", "baking", "ingredients"),
+}
+
+RECIPE_EXAMPLES = [
+    ("give me a recipe for lasagna", "RECIPE"),
+    ("how do I make bread at home", "RECIPE"),
+    ("what can I cook with chicken and rice", "RECIPE"),
+    ("I want to bake a chocolate cake", "RECIPE"),
+    ("a vegan curry please", "RECIPE"),
+    ("how to prepare sushi", "RECIPE"),
+    ("something tasty with leftover potatoes", "RECIPE"),
+    ("how do I make lasagna", "RECIPE"),
+    ("how do I cook rice properly", "RECIPE"),
+    ("how to roast a chicken", "RECIPE"),
+    ("how to grill salmon", "RECIPE"),
+    ("a soup I can make with lentils", "RECIPE"),
+    ("hello there", "OTHER"),
+    ("what is the capital of france", "OTHER"),
+    ("tell me a joke", "OTHER"),
+    ("can you help me write an email", "OTHER"),
+    ("how does the stock market work", "OTHER"),
+    ("what time is it in tokyo", "OTHER"),
+    ("how do I make money fast", "OTHER"),
+    ("how do I fix my car", "OTHER"),
+    ("roast my resume", "OTHER"),
+    ("what dish soap is best", "OTHER"),
+    ("how to make a website", "OTHER"),
+    ("how do I reset my password", "OTHER"),
+]
+
+# --- Classifier ---
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def _features(text: str) -> list[str]:
+    tokens = _TOKEN_RE.findall(text.lower())
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def _softmax(scores: list[float]) -> list[float]:
+    top = max(scores)
+    exps = [math.exp(s - top) for s in scores]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+@dataclass
+class RouteDecision:
+    label: str
+    confidence: float
+    source: str  # "rules", "model" or "llm"
+
+
+class LocalIntentRouter:
+    """
+    Keyword rules plus a TF-IDF / linear classifier, with an LLM fallback.
+
+    Args:
+        labels: The categories the router can return.
+        keywords: Phrases that name a label when only one label matches; they must only ever mean
+            that label. A match is confident only alongside one of `cues`.
+        examples: (text, label) pairs used to train the classifier.
+        cues: Phrases that mark a request (see REQUEST_CUES); None trusts keyword matches alone.
+        threshold: Minimum classifier confidence before falling back to the LLM.
+        default_label: Label used when there is no fallback and no confident guess.
+        enabled: When False every request goes straight to the fallback.
+    """
+
+    def __init__(
+        self,
+        labels: Iterable[str],
+        keywords: Optional[dict[str, Iterable[str]]] = None,
+        examples: Optional[list[tuple[str, str]]] = None,
+        cues: Optional[Iterable[str]] = None,
+        threshold: float = 0.6,
+        default_label: str = "OTHER",
+        epochs: int = 60,
+        learning_rate: float = 0.5,
+        enabled: bool = True,
+    ):
+        self.labels = list(labels)
+        self.threshold = threshold
+        self.default_label = default_label
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.enabled = enabled
+        self._keyword_patterns = {
+            label: re.compile(r"\b(?:" + "|".join(re.escape(k) for k in words) + r")\b")
+            for label, words in (keywords or {}).items() if words
+        }
+        self._cue_pattern = re.compile(r"\b(?:" + "|".join(re.escape(c) for c in cues) + r")\b") if cues else None
+        self._examples: list[tuple[str, str]] = []
+        self._idf: dict[str, float] = {}
+        self._weights: dict[str, list[float]] = {}
+        self._bias = [0.0] * len(self.labels)
+        self.counts = Counter()
+        self._local_seconds = 0.0
+        if examples:
+            self.train(examples)
+
+    # --- Training ---
+    def train(self, examples: Iterable[tuple[str, str]]):
+        """Add labelled examples and refit the classifier from scratch."""
+        self._examples.extend((text, label) for text, label in examples if label in self.labels)
+        if not self._examples:
+            return
+
+        docs = [_features(text) for text, _ in self._examples]
+        doc_freq = Counter(f for doc in docs for f in set(doc))
+        n_docs = len(docs)
+        self._idf = {f: math.log((1 + n_docs) / (1 + df)) + 1.0 for f, df in doc_freq.items()}
+        vectors = [self._vectorize(doc) for doc in docs]
+        targets = [self.labels.index(label) for _, label in self._examples]
+
+        n_labels = len(self.labels)
+        self._weights = {f: [0.0] * n_labels for f in self._idf}
+        self._bias = [0.0] * n_labels
+        for _ in range(self.epochs):
+            for vector, target in zip(vectors, targets):
+                probs = _softmax(self._scores(vector))
+                for k in range(n_labels):
+                    grad = probs[k] - (1.0 if k == target else 0.0)
+                    self._bias[k] -= self.learning_rate * grad
+                    for f, value in vector.items():
+                        self._weights[f][k] -= self.learning_rate * grad * value
+
+    def _vectorize(self, features: list[str]) -> dict[str, float]:
+        tf = Counter(f for f in features if f in self._idf)
+        vector = {f: count * self._idf[f] for f, count in tf.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {f: v / norm for f, v in vector.items()}
+
+    def _scores(self, vector: dict[str, float]) -> list[float]:
+        scores = list(self._bias)
+        for f, value in vector.items():
+            for k, w in enumerate(self._weights[f]):
+                scores[k] += w * value
+        return scores
+
+    # --- Prediction ---
+    def predict(self, text: str) -> RouteDecision:
+        """Classify locally, without any model call."""
+        lowered = text.lower()
+        matched = [label for label, pattern in self._keyword_patterns.items() if pattern.search(lowered)]
+        if len(matched) == 1:
+            # The keyword itself is no cue ("recipe" is both for the recipe router)
+            rest = self._keyword_patterns[matched[0]].sub(" ", lowered)
+            cued = self._cue_pattern is None or self._cue_pattern.search(rest)
+            # An uncued match is not left to the classifier either, which would follow the same food word
+            return RouteDecision(matched[0], KEYWORD_CONFIDENCE if cued else UNCUED_KEYWORD_CONFIDENCE, "rules")
+
+        if not self._weights:
+            return RouteDecision(self.default_label, 0.0, "model")
+
+        features = _features(text)
+        probs = _softmax(self._scores(self._vectorize(features)))
+        best = max(range(len(probs)), key=probs.__getitem__)
+        # Words never seen in training carry no signal, so a request made mostly of them ("how do I make
+        # new friends") would be decided by its few known words alone; scale the confidence down instead
+        words = [f for f in features if " " not in f]
+        coverage = sum(f in self._idf for f in words) / len(words) if words else 0.0
+        return RouteDecision(self.labels[best], probs[best] * coverage, "model")
+
+    def _local(self, text: str) -> RouteDecision:
+        start = time.perf_counter()
+        decision = self.predict(text)
+        self._local_seconds += time.perf_counter() - start
+        return decision
+
+    def _accept(self, decision: RouteDecision) -> bool:
+        if self.enabled and decision.confidence >= self.threshold:
+            self.counts[decision.source] += 1
+            return True
+        return False
+
+    def _from_llm(self, answer: str) -> RouteDecision:
+        self.counts["llm"] += 1
+        answer = (answer or "").strip().upper()
+        label = next((l for l in self.labels if l in answer), self.default_label)
+        return RouteDecision(label, 1.0, "llm")
+
+    def route(self, text: str, fallback: Optional[Callable[[str], str]] = None) -> RouteDecision:
+        """Classify locally, calling `fallback(text)` only when confidence is below the threshold."""
+        decision = self._local(text) if self.enabled else RouteDecision(self.default_label, 0.0, "model")
+        if self._accept(decision):
+            return decision
+        if fallback is None:
+            self.counts["unconfident"] += 1
+            return decision
+        return self._from_llm(fallback(text))
+
+    async def aroute(self, text: str, fallback: Optional[Callable[[str], Awaitable[str]]] = None) -> RouteDecision:
+        """Async variant of `route` for coroutine fallbacks."""
+        decision = self._local(text) if self.enabled else RouteDecision(self.default_label, 0.0, "model")
+        if self._accept(decision):
+            return decision
+        if fallback is None:
+            self.counts["unconfident"] += 1
+            return decision
+        return self._from_llm(await fallback(text))
+
+    def stats(self) -> dict:
+        """Hit / fallback counters and the average local decision time."""
+        local = self.counts["rules"] + self.counts["model"]
+        total = local + self.counts["llm"] + self.counts["unconfident"]
+        return {
+            "total": total,
+            "rules": self.counts["rules"],
+            "model": self.counts["model"],
+            "llm_fallback": self.counts["llm"],
+            "hit_rate": local / total if total else 0.0,
+            "avg_local_us": self._local_seconds / total * 1e6 if total else 0.0,
+        }
+
+
+# --- Factories ---
+# LOCAL_ROUTER=0 sends every request to the LLM router; LOCAL_ROUTER_THRESHOLD tunes the fallback point.
+def _options() -> dict:
+    return {
+        "threshold": float(os.environ.get("LOCAL_ROUTER_THRESHOLD", "0.6")),
+        "enabled": os.environ.get("LOCAL_ROUTER", "1") != "0",
+    }
+
+
+def build_meal_router() -> LocalIntentRouter:
+    return LocalIntentRouter(MEAL_LABELS, MEAL_KEYWORDS, MEAL_EXAMPLES, cues=REQUEST_CUES, **_options())
+
+
+def build_recipe_router() -> LocalIntentRouter:
+    return LocalIntentRouter(RECIPE_LABELS, RECIPE_KEYWORDS, RECIPE_EXAMPLES, cues=REQUEST_CUES, **_options())
@@ -0,0 +1,311 @@
+"""
+Mail session pool.
+
+Opening a Gmail session costs a TLS handshake and a login, which dominates
+short tool calls. `MailPool` keeps authenticated IMAP and SMTP sessions per
+account and hands each one to a single caller at a time:
+
+- at most MAIL_POOL_MAX_SIZE sessions per account and protocol (default 4);
+  callers wait for a free one (up to MAIL_POOL_WAIT seconds, default 30)
+- idle sessions get a NOOP every MAIL_POOL_KEEPALIVE seconds (default 60)
+  from a background thread, and are logged out after MAIL_POOL_IDLE_TIMEOUT
+  seconds unused (default 300)
+- sessions are keyed by account and a fingerprint of the password, so a
+  changed or wrong password never reuses a session logged in with another
+- a session that fails its NOOP is replaced before use, and an IMAP call that
+  fails because a reused session dropped is retried once on a new session.
+  SMTP calls are never retried: the message may already have gone out, and a
+  retry would send it twice. Instead an SMTP session gets a NOOP before every
+  reuse
+- every connection has a MAIL_TIMEOUT second socket timeout (default 30)
+- `stats()` counts, per operation, hits (reused sessions), misses (new
+  logins) and reconnects
+
+MAIL_POOL=0 opens a new session for every call.
+
+Shared by the Gmail MCP server (GMailMCP) and the PydanticAI email agent; the
+copies are kept identical.
+"""
+import atexit
+import hashlib
+import imaplib
+import os
+import smtplib
+import ssl
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Optional, TypeVar
+
+IMAP_HOST = "imap.gmail.com"
+SMTP_HOST = "smtp.gmail.com"
+SMTP_PORT = 587
+TIMEOUT = float(os.environ.get("MAIL_TIMEOUT", "30"))
+
+# Errors that mean the session itself is gone, as opposed to a command that failed
+CONNECTION_ERRORS = (
+    ConnectionError, TimeoutError, EOFError, ssl.SSLError,
+    imaplib.IMAP4.abort, smtplib.SMTPServerDisconnected,
+)
+
+T = TypeVar("T")
+
+
+def connect_imap(account: str, password: str) -> imaplib.IMAP4:
+    mail = imaplib.IMAP4_SSL(IMAP_HOST, timeout=TIMEOUT)
+    mail.login(account, password)
+    # imaplib reads the capabilities before login, when Gmail does not list ENABLE, CONDSTORE or UTF8=ACCEPT yet
+    status, data = mail.capability()
+    if status == "OK" and data and data[-1]:
+        mail.capabilities = tuple(data[-1].decode().upper().split())
+    return mail
+
+
+def connect_smtp(account: str, password: str) -> smtplib.SMTP:
+    # Note: This requires an App Password if 2FA is enabled
+    server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=TIMEOUT)
+    server.starttls()
+    server.login(account, password)
+    return server
+
+
+CONNECT = {"imap": connect_imap, "smtp": connect_smtp}
+# Whether a call that fails on a dropped, reused session may run again on a new one.
+# An SMTP send can fail after the server accepted the message, so it is never repeated.
+RETRY = {"imap": True, "smtp": False}
+
+
+def fingerprint(password: str) -> str:
+    """Tells passwords apart in pool keys without keeping them."""
+    return hashlib.sha256(password.encode()).hexdigest()[:16]
+
+
+def is_alive(kind: str, conn) -> bool:
+    try:
+        if kind == "imap":
+            return conn.noop()[0] == "OK"
+        return conn.noop()[0] == 250
+    except Exception:
+        return False
+
+
+def disconnect(kind: str, conn):
+    try:
+        if kind == "imap":
+            conn.logout()
+        else:
+            conn.quit()
+    except Exception:
+        pass
+
+
+@dataclass
+class _Session:
+    conn: object
+    last_used: float
+    last_checked: float
+
+
+class MailPool:
+    def __init__(self, max_size: int = 4, idle_timeout: float = 300.0, keepalive: float = 60.0,
+                 wait: float = 30.0, enabled: bool = True):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.wait = wait
+        self.enabled = enabled
+        self._cond = threading.Condition()
+        # (kind, account, password fingerprint) -> idle sessions, most recently used last
+        self._idle: dict[tuple[str, str, str], list[_Session]] = defaultdict(list)
+        # (kind, account, password fingerprint) -> sessions open, idle or in use
+        self._open: dict[tuple[str, str, str], int] = defaultdict(int)
+        self._calls: dict[str, dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0, "reconnects": 0})
+        self._evictions = 0
+        self._stop = threading.Event()
+        self._keepalive_thread: Optional[threading.Thread] = None
+
+    # --- Calls ---
+    def imap(self, account: str, password: str, fn: Callable[[imaplib.IMAP4], T], operation: str = "imap") -> T:
+        """Runs `fn` with a logged-in IMAP session for `account` and returns its result."""
+        return self._call("imap", account, password, fn, operation)
+
+    def smtp(self, account: str, password: str, fn: Callable[[smtplib.SMTP], T], operation: str = "smtp") -> T:
+        """Runs `fn` with a logged-in SMTP session for `account` and returns its result."""
+        return self._call("smtp", account, password, fn, operation)
+
+    def _call(self, kind: str, account: str, password: str, fn: Callable, operation: str):
+        key = (kind, account, fingerprint(password))
+        if not self.enabled:
+            conn = CONNECT[kind](account, password)
+            self._count(operation, "misses")
+            try:
+                return fn(conn)
+            finally:
+                disconnect(kind, conn)
+
+        session, reused = self._acquire(key, password, operation)
+        try:
+            return self._run(key, session, fn)
+        except CONNECTION_ERRORS:
+            if not reused or not RETRY[kind]:
+                raise
+            # The session dropped while idle: retry once on a new login
+            self._count(operation, "reconnects")
+            session, _ = self._acquire(key, password, operation, fresh=True)
+            return self._run(key, session, fn)
+
+    def _run(self, key: tuple[str, str, str], session: _Session, fn: Callable):
+        """Runs `fn` on a session, then returns the session to the pool, or closes it if the connection broke."""
+        try:
+            result = fn(session.conn)
+        except CONNECTION_ERRORS:
+            self._discard(key, session)
+            raise
+        except BaseException:
+            self._release(key, session)
+            raise
+        self._release(key, session)
+        return result
+
+    # --- Sessions ---
+    def _acquire(self, key: tuple[str, str, str], password: str, operation: str, fresh: bool = False) -> tuple[_Session, bool]:
+        """A session for `key` and whether it was reused; opens one when none is idle and the pool has room."""
+        kind, account, _ = key
+        deadline = time.monotonic() + self.wait
+        session = None
+        with self._cond:
+            while True:
+                if self._idle[key] and not fresh:
+                    session = self._idle[key].pop()
+                    break
+                if self._open[key] < self.max_size:
+                    self._open[key] += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    raise TimeoutError(f"No free {kind} session for {account} after {self.wait:.0f}s")
+
+        if session is not None:
+            # A session that cannot be retried on is checked every time
+            recent = RETRY[kind] and time.monotonic() - session.last_checked < self.keepalive
+            if recent or is_alive(kind, session.conn):
+                self._count(operation, "hits")
+                return session, True
+            # Dropped while idle: log in again in its place
+            disconnect(kind, session.conn)
+            self._count(operation, "reconnects")
+
+        try:
+            conn = CONNECT[kind](account, password)
+        except BaseException:
+            with self._cond:
+                self._open[key] -= 1
+                self._cond.notify()
+            raise
+        self._count(operation, "misses")
+        now = time.monotonic()
+        return _Session(conn, now, now), False
+
+    def _release(self, key: tuple[str, str, str], session: _Session):
+        kind = key[0]
+        if kind == "imap" and getattr(session.conn, "state", None) == "SELECTED":
+            # Back to the authenticated state, where the next caller can ENABLE before selecting
+            try:
+                session.conn.close()
+            except Exception:
+                self._discard(key, session)
+                return
+        session.last_used = session.last_checked = time.monotonic()
+        with self._cond:
+            self._idle[key].append(session)
+            self._cond.notify()
+        self._start_keepalive()
+
+    def _discard(self, key: tuple[str, str, str], session: _Session):
+        disconnect(key[0], session.conn)
+        with self._cond:
+            self._open[key] -= 1
+            self._cond.notify()
+
+    def _count(self, operation: str, outcome: str):
+        with self._cond:
+            self._calls[operation][outcome] += 1
+
+    # --- Keepalive ---
+    def _start_keepalive(self):
+        if self._keepalive_thread is not None:
+            return
+        with self._cond:
+            if self._keepalive_thread is None:
+                self._keepalive_thread = threading.Thread(target=self._keepalive_loop, name="mail-pool-keepalive", daemon=True)
+                self._keepalive_thread.start()
+
+    def _keepalive_loop(self):
+        while not self._stop.wait(min(self.keepalive, self.idle_timeout) / 2):
+            self.sweep()
+
+    def sweep(self):
+        """Logs out sessions idle for longer than idle_timeout and NOOPs the ones due a keepalive."""
+        now = time.monotonic()
+        due = []
+        with self._cond:
+            for key, sessions in self._idle.items():
+                keep = []
+                for session in sessions:
+                    if now - session.last_used > self.idle_timeout or now - session.last_checked >= self.keepalive:
+                        due.append((key, session))
+                    else:
+                        keep.append(session)
+                sessions[:] = keep
+
+        # Checked outside the lock; the sessions are out of the idle lists meanwhile, so no caller gets them
+        for key, session in due:
+            if now - session.last_used > self.idle_timeout or not is_alive(key[0], session.conn):
+                self._discard(key, session)
+                with self._cond:
+                    self._evictions += 1
+                continue
+            session.last_checked = time.monotonic()
+            with self._cond:
+                self._idle[key].insert(0, session)
+                self._cond.notify()
+
+    # --- Reporting ---
+    def stats(self) -> dict:
+        with self._cond:
+            # Summed over password fingerprints, which stay out of the report
+            open_sessions: dict[str, int] = defaultdict(int)
+            for (kind, account, _), n in self._open.items():
+                if n:
+                    open_sessions[f"{kind}:{account}"] += n
+            return {
+                "calls": {operation: dict(counts) for operation, counts in self._calls.items()},
+                "open": dict(open_sessions),
+                "idle": sum(len(sessions) for sessions in self._idle.values()),
+                "evictions": self._evictions,
+            }
+
+    def close(self):
+        """Logs out every idle session and stops the keepalive thread."""
+        self._stop.set()
+        with self._cond:
+            idle = [(key, session) for key, sessions in self._idle.items() for session in sessions]
+            self._idle.clear()
+        for key, session in idle:
+            self._discard(key, session)
+
+
+@lru_cache(maxsize=None)
+def get_mail_pool() -> MailPool:
+    """The process-wide pool, configured from the environment on first use; its sessions are logged out at exit."""
+    pool = MailPool(
+        max_size=int(os.environ.get("MAIL_POOL_MAX_SIZE", "4")),
+        idle_timeout=float(os.environ.get("MAIL_POOL_IDLE_TIMEOUT", "300")),
+        keepalive=float(os.environ.get("MAIL_POOL_KEEPALIVE", "60")),
+        wait=float(os.environ.get("MAIL_POOL_WAIT", "30")),
+        enabled=os.environ.get("MAIL_POOL", "1") != "0",
+    )
+    atexit.register(pool.close)
+    return pool
@@ -1,9 +1,17 @@
 import os
+import argparse
 import asyncio
-from typing import Literal
+from typing import Annotated, AsyncIterator, Literal, Optional, Union
 from dotenv import load_dotenv
 from pydantic_ai import Agent
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, TypeAdapter
+
+from instrumentation import model_name, run_agent, stream_agent
+from intent_router import RouteDecision, build_meal_router
+from metrics import dump_metrics
+from models import aprewarm, build_model
+from partial_output import PartialSnapshot, stream_partial
+from response_cache import build_response_cache
 
 # --- Configuration ---
 load_dotenv()
@@ -16,7 +24,7 @@ if not os.environ.get("OPENAI_API_KEY"):
 # 1. Router Agent
 # We can use a structured result type (Literal) to enforce the classification output.
 router_agent = Agent(
-    'openai:gpt-5-nano',
+    build_model('openai:gpt-5-nano'),
     system_prompt="""You are a routing assistant. Classify the user's request into one of the following categories:
     - BREAKFAST: If the user is asking for a breakfast recipe.
     - LUNCH: If the user is asking for a lunch recipe.
@@ -33,73 +41,259 @@ class chefResponse(BaseModel):
     instructions: list[str]
     energy_level: str
 
+BREAKFAST_CHEF_PROMPT = "You are a specialist Breakfast Chef. Provide a delicious and energetic breakfast recipe based on the user's request. Focus on morning ingredients. Start your response with 'Hi, I'm your breakfast chef.'"
+
 breakfast_chef_agent = Agent(
-    'openai:gpt-5-mini',
+    build_model('openai:gpt-5-mini'),
     output_type=chefResponse,
-    system_prompt="You are a specialist Breakfast Chef. Provide a delicious and energetic breakfast recipe based on the user's request. Focus on morning ingredients. Start your response with 'Hi, I'm your breakfast chef.'",
+    system_prompt=BREAKFAST_CHEF_PROMPT,
 )
 
 # 3. Lunch Chef Agent
+LUNCH_CHEF_PROMPT = "You are a specialist Lunch Chef. Provide a balanced and quick lunch recipe based on the user's request. Focus on midday sustenance. Start your response with 'Hi, I'm your lunch chef.'"
+
 lunch_chef_agent = Agent(
-    'openai:gpt-5-mini',
-    system_prompt="You are a specialist Lunch Chef. Provide a balanced and quick lunch recipe based on the user's request. Focus on midday sustenance. Start your response with 'Hi, I'm your lunch chef.'",
+    build_model('openai:gpt-5-mini'),
+    output_type=chefResponse,
+    system_prompt=LUNCH_CHEF_PROMPT,
 )
 
 # 4. Dinner Chef Agent
+DINNER_CHEF_PROMPT = "You are a specialist Dinner Chef. Provide a comforting and substantial dinner recipe based on the user's request. Focus on evening relaxation and flavor. Start your response with 'Hi, I'm your dinner chef.'"
+
 dinner_chef_agent = Agent(
-    'openai:gpt-4.1-mini',
-    system_prompt="You are a specialist Dinner Chef. Provide a comforting and substantial dinner recipe based on the user's request. Focus on evening relaxation and flavor. Start your response with 'Hi, I'm your dinner chef.'",
+    build_model('openai:gpt-4.1-mini'),
+    output_type=chefResponse,
+    system_prompt=DINNER_CHEF_PROMPT,
 )
 
 # 5. General Chat Agent
 general_chat_agent = Agent(
-    'openai:gpt-5-nano',
+    build_model('openai:gpt-5-nano'),
     system_prompt="You are a helpful assistant.",
 )
 
+# 6. Route-and-Cook Agent
+# Classifies and answers in a single call: the output is a recipe for one of the meals, or a chat answer.
+# PydanticAI offers each member of the union as its own output tool, so the tool the model calls picks the branch.
+class RecipeReply(BaseModel):
+    """A recipe from the chef of the requested meal."""
+    category: Literal['BREAKFAST', 'LUNCH', 'DINNER']
+    recipe: chefResponse
+
+class ChatReply(BaseModel):
+    """A plain answer to a request that is not asking for a recipe."""
+    category: Literal['OTHER']
+    answer: str
+
+MealReply = Annotated[Union[RecipeReply, ChatReply], Field(discriminator='category')]
+
+ROUTE_AND_COOK_PROMPT = """You are the front desk of a team of chefs. Decide which meal the user's request is about and answer it yourself:
+    - BREAKFAST, LUNCH or DINNER: reply with a recipe the way that meal's specialist chef would, focusing on energetic morning ingredients, balanced and quick midday dishes, or comforting and substantial evening dishes respectively. Start the greeting with "Hi, I'm your breakfast chef.", "Hi, I'm your lunch chef." or "Hi, I'm your dinner chef.".
+    - OTHER: for any other request, reply with a helpful plain answer."""
+
+route_and_cook_agent = Agent(
+    build_model('openai:gpt-5-mini'),
+    output_type=MealReply,
+    system_prompt=ROUTE_AND_COOK_PROMPT,
+)
+
+# --- Routing Mode ---
+# two-step (default): the router agent classifies, then the chef agent answers (two sequential calls).
+# single: route_and_cook_agent classifies and answers in one call. Either way the local intent
+# router below decides most requests without a model call; the mode only changes its fallback.
+MEAL_ROUTING = os.environ.get("MEAL_ROUTING", "two-step")
+
+# --- Intent Router ---
+# Keyword rules + a small in-memory classifier decide most requests locally.
+# The router agent is only called when the local confidence is below LOCAL_ROUTER_THRESHOLD.
+intent_router = build_meal_router()
+
+async def llm_route(user_input: str) -> str:
+    router_result = await run_agent("router", router_agent, user_input)
+    return router_result.output
+
+# --- Response Cache ---
+# Identical (or, with RESPONSE_CACHE_SIMILARITY, near-identical) requests reuse a previous recipe.
+response_cache = build_response_cache()
+
+async def run_chef(name: str, agent: Agent, system_prompt: str, user_input: str):
+    """
+    Runs a chef agent through the response cache and returns its output.
+    Structured outputs (models and unions of models) are cached as JSON and re-validated on a hit.
+    """
+    adapter = None if agent.output_type is str else TypeAdapter(agent.output_type)
+
+    async def call() -> str:
+        result = await run_agent(name, agent, user_input)
+        return adapter.dump_json(result.output).decode() if adapter else result.output
+
+    cached = await response_cache.aget_or_call(name, model_name(agent), system_prompt, user_input, call)
+    return adapter.validate_json(cached) if adapter else cached
+
+async def route(user_input: str) -> tuple[RouteDecision, Optional[MealReply]]:
+    """
+    Classifies a request. The local router decides most requests; when it is unsure, two-step
+    mode asks the router agent, and single mode asks route_and_cook_agent, whose answer is
+    returned along with the decision so it does not need a second call.
+    """
+    if MEAL_ROUTING != "single":
+        return await intent_router.aroute(user_input, llm_route), None
+
+    replies = []
+
+    async def route_and_cook(text: str) -> str:
+        reply = await run_chef("route_and_cook", route_and_cook_agent, ROUTE_AND_COOK_PROMPT, text)
+        replies.append(reply)
+        return reply.category
+
+    decision = await intent_router.aroute(user_input, route_and_cook)
+    return decision, replies[0] if replies else None
+
+async def stream_text_agent(name: str, agent: Agent, system_prompt: Optional[str], user_input: str) -> str:
+    """
+    Prints a text agent's output as token deltas arrive (run_stream) and returns the full text.
+    Chef outputs go through the response cache; a hit is printed in one go.
+    """
+    if system_prompt is not None:
+        cached = await response_cache.aget(name, model_name(agent), system_prompt, user_input)
+        if cached is not None:
+            print(cached)
+            return cached
+
+    async with stream_agent(name, agent, user_input) as result:
+        async for delta in result.stream_text(delta=True):
+            print(delta, end="", flush=True)
+        text = await result.get_output()
+    print()
+
+    if system_prompt is not None:
+        await response_cache.aput(name, model_name(agent), system_prompt, user_input, text)
+    return text
+
+# Agents with plain-text output that can be streamed token by token, per category
+TEXT_AGENTS = {
+    'OTHER': ("general_chat", general_chat_agent, None, "General Chat"),
+}
+
+# Chef agent per meal category: (metrics/cache name, agent, system prompt)
+CHEF_AGENTS = {
+    'BREAKFAST': ("breakfast_chef", breakfast_chef_agent, BREAKFAST_CHEF_PROMPT),
+    'LUNCH': ("lunch_chef", lunch_chef_agent, LUNCH_CHEF_PROMPT),
+    'DINNER': ("dinner_chef", dinner_chef_agent, DINNER_CHEF_PROMPT),
+}
+
+def format_recipe(category: str, chef: chefResponse) -> str:
+    if category == 'BREAKFAST':
+        return f"{chef.greeting}\n\n**{chef.recipe_name}**\nIngredients: {', '.join(chef.ingredients)}\nEnergy: {chef.energy_level}"
+    title = "Lunch Chef" if category == 'LUNCH' else "Dinner Chef"
+    return f"**{title}:**\n{chef.greeting}\nRecipe Name: {chef.recipe_name}\nIngredients: {', '.join(chef.ingredients)}\nInstructions: {' '.join(chef.instructions)}\nEnergy Level: {chef.energy_level}"
+
+def format_field(name: str, value) -> str:
+    """One line of a recipe, in the lunch/dinner layout, for printing fields as they complete."""
+    if name == 'greeting':
+        return value
+    if name == 'ingredients':
+        value = ', '.join(value)
+    elif name == 'instructions':
+        value = ' '.join(value)
+    return f"{name.replace('_', ' ').title()}: {value}"
+
+async def stream_recipe(category: str, user_input: str) -> AsyncIterator[PartialSnapshot[chefResponse]]:
+    """
+    Streams a chef's `chefResponse` as partially validated snapshots (see partial_output.py),
+    so consumers can act on a field, e.g. the ingredients, as soon as it is complete.
+    A response cache hit is yielded as a single final snapshot; a streamed recipe is cached once done.
+    """
+    name, agent, system_prompt = CHEF_AGENTS[category]
+    fields = tuple(chefResponse.model_fields)
+    cached = await response_cache.aget(name, model_name(agent), system_prompt, user_input)
+    if cached is not None:
+        yield PartialSnapshot(chefResponse.model_validate_json(cached), fields, fields, done=True)
+        return
+
+    async with stream_agent(name, agent, user_input) as result:
+        async for snapshot in stream_partial(result, chefResponse):
+            yield snapshot
+    await response_cache.aput(name, model_name(agent), system_prompt, user_input, snapshot.output.model_dump_json())
+
+async def stream_chef(category: str, user_input: str) -> chefResponse:
+    """Prints each recipe field as soon as the chef has finished generating it and returns the recipe."""
+    async for snapshot in stream_recipe(category, user_input):
+        for name in snapshot.new:
+            print(format_field(name, getattr(snapshot.output, name)), flush=True)
+    return snapshot.output
+
+def format_reply(reply: MealReply) -> str:
+    """Formats a route_and_cook_agent answer like the matching chef (or general chat) answer."""
+    if isinstance(reply, RecipeReply):
+        return format_recipe(reply.category, reply.recipe)
+    return f"**General Chat:**\n{reply.answer}"
+
+async def respond(category: str, user_input: str) -> str:
+    """
+    Runs the chef (or general chat) agent for a routed request and returns the formatted answer.
+    Used by the REPL in final mode and by `answer`.
+    """
+    if category in CHEF_AGENTS:
+        chef = await run_chef(*CHEF_AGENTS[category], user_input)
+        return format_recipe(category, chef)
+
+    # OTHER
+    result = await run_agent("general_chat", general_chat_agent, user_input)
+    return f"**General Chat:**\n{result.output}"
+
+async def answer(user_input: str) -> str:
+    """Routes and answers one request in the configured routing mode (used by session_runner.py)."""
+    decision, reply = await route(user_input)
+    if reply is not None:
+        return format_reply(reply)
+    return await respond(decision.label, user_input)
+
 # --- Execution ---
-async def main():
+async def main(stream_mode: str = "tokens"):
     print("Starting PydanticAI Meal Orchestrator Agent...")
     print("Ask for a breakfast, lunch, or dinner recipe!")
     
     if not os.environ.get("OPENAI_API_KEY"):
         print("Please set OPENAI_API_KEY environment variable.")
 
+    # Builds the models (and opens MODEL_PREWARM connections) before the first turn
+    await aprewarm()
+
     while True:
         try:
             user_input = input("\nUser: ")
             if user_input.lower() in ["quit", "exit", "q"]:
+                print(f"Router stats: {intent_router.stats()}")
+                print(f"Cache stats: {response_cache.stats()}")
+                dump_metrics()
                 print("Goodbye!")
                 break
 
             # Step 1: Route the request
-            # We run the router agent to classify the intent
+            # The local router classifies the intent, falling back to the router agent when unsure
+            # (or, in single routing mode, to route_and_cook_agent, which answers at the same time)
             print("...Routing...")
-            router_result = await router_agent.run(user_input)
-            category = router_result.output
-            print(f"Router classified the request as: {category}")
+            decision, reply = await route(user_input)
+            category = decision.label
+            print(f"Router classified the request as: {category} (via {decision.source})")
+            if reply is not None:
+                print(f"\n{format_reply(reply)}")
+                continue
 
             # Step 2: Dispatch to the appropriate agent
-            response_data = ""
-            
-            if category == 'BREAKFAST':
-                result = await breakfast_chef_agent.run(user_input)
-                chef = result.output
-                response_data = f"{chef.greeting}\n\n**{chef.recipe_name}**\nIngredients: {', '.join(chef.ingredients)}\nEnergy: {chef.energy_level}"
-                # response_data = f"**Breakfast Chef:**\n{result.output.greeting}\nRecipe Name: {result.output.recipe_name}\nIngredients: {', '.join(result.output.ingredients)}\nInstructions: {' '.join(result.output.instructions)}\nEnergy Level: {result.output.energy_level}"
-                
-            elif category == 'LUNCH':
-                result = await lunch_chef_agent.run(user_input)
-                response_data = f"**Lunch Chef:**\n{result.output.greeting}\nRecipe Name: {result.output.recipe_name}\nIngredients: {', '.join(result.output.ingredients)}\nInstructions: {' '.join(result.output.instructions)}\nEnergy Level: {result.output.energy_level}"
-                
-            elif category == 'DINNER':
-                result = await dinner_chef_agent.run(user_input)
-                response_data = f"**Dinner Chef:**\n{result.output.greeting}\nRecipe Name: {result.output.recipe_name}\nIngredients: {', '.join(result.output.ingredients)}\nInstructions: {' '.join(result.output.instructions)}\nEnergy Level: {result.output.energy_level}"
-                
-            else: # OTHER
-                result = await general_chat_agent.run(user_input)
-                response_data = f"**General Chat:**\n{result.output.content}"
+            if stream_mode == "tokens" and category in TEXT_AGENTS:
+                name, agent, system_prompt, label = TEXT_AGENTS[category]
+                print(f"\n**{label}:**")
+                await stream_text_agent(name, agent, system_prompt, user_input)
+                continue
+            if stream_mode == "tokens" and category in CHEF_AGENTS:
+                print(f"\n**{category.title()} Chef:**")
+                await stream_chef(category, user_input)
+                continue
 
+            response_data = await respond(category, user_input)
             print(f"\n{response_data}")
             
         except KeyboardInterrupt:
@@ -110,4 +304,11 @@ async def main():
             break
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stream-mode", choices=["tokens", "final"], default="tokens",
+                        help="Print answers as they are generated, chat token by token and recipes field by field (default), or only the final answer")
+    parser.add_argument("--routing", choices=["two-step", "single"], default=MEAL_ROUTING,
+                        help="Router agent then chef agent (default), or one route-and-cook call (MEAL_ROUTING)")
+    args = parser.parse_args()
+    MEAL_ROUTING = args.routing
+    asyncio.run(main(args.stream_mode))
@@ -0,0 +1,132 @@
+"""
+Shared model registry.
+
+`build_model('openai:gpt-5-nano')` returns a stand-in for the model
+PydanticAI would infer from the string. Creating an Agent with it opens
+nothing: the real model is built on the agent's first request, once per
+process for each name, and its OpenAI provider is shared by every model of
+that provider and sits on the shared HTTP pool (http_pool.py). So all agents
+reuse one set of keep-alive connections, importing an agent module creates no
+client, and model calls can be recorded or replayed with CASSETTE_MODE.
+
+The agents and runners call `aprewarm()` on startup. It builds every declared
+model, so the first turn does not pay for that, and with MODEL_PREWARM=<n> it
+also opens n keep-alive connections to the provider ahead of the first
+request, so the first turn skips the TCP and TLS handshakes too (0, the
+default, opens none).
+"""
+import asyncio
+import os
+import threading
+from typing import Optional
+
+from pydantic_ai.models import Model, infer_model
+from pydantic_ai.models.wrapper import WrapperModel
+from pydantic_ai.providers import Provider, infer_provider
+from pydantic_ai.providers.openai import OpenAIProvider
+
+from cassette import get_cassette
+from http_pool import aprewarm as aprewarm_pool
+from http_pool import get_async_http_client
+
+# Providers whose clients are built on the shared HTTP pool, and so can be pre-warmed
+POOLED_PROVIDERS = ("openai",)
+
+
+class LazyModel(WrapperModel):
+    """
+    Wraps the model for a 'provider:model' name without building it.
+    `model_name` and `system` come from the name; everything else
+    (requests, profile, settings) goes to the shared model, built on first use.
+    """
+
+    def __init__(self, registry: "ModelRegistry", name: str):
+        # WrapperModel.__init__ would infer (and build) the model right away
+        Model.__init__(self)
+        self._registry = registry
+        self.name = name
+
+    @property
+    def wrapped(self) -> Model:
+        return self._registry.get(self.name)
+
+    @property
+    def model_name(self) -> str:
+        return self.name.split(":", 1)[-1]
+
+    @property
+    def system(self) -> str:
+        return self.name.split(":", 1)[0] if ":" in self.name else self.wrapped.system
+
+    def __repr__(self) -> str:
+        return f"LazyModel({self.name!r})"
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._declared: dict[str, LazyModel] = {}
+        self._models: dict[str, Model] = {}
+        self._providers: dict[str, Provider] = {}
+
+    def build_model(self, name: str) -> LazyModel:
+        """Declares the model for a 'provider:model' name; equal names share one model."""
+        with self._lock:
+            return self._declared.setdefault(name, LazyModel(self, name))
+
+    def get(self, name: str) -> Model:
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = infer_model(name, provider_factory=self._provider)
+            return self._models[name]
+
+    def _provider(self, name: str) -> Provider:
+        # Called by infer_model while the lock is held
+        if name not in self._providers:
+            if name == "openai":
+                self._providers[name] = OpenAIProvider(http_client=get_async_http_client(name))
+            else:
+                self._providers[name] = infer_provider(name)
+        return self._providers[name]
+
+    def stats(self) -> dict:
+        return {"declared": len(self._declared), "built": len(self._models), "providers": len(self._providers)}
+
+    # --- Pre-warming ---
+    def build_all(self):
+        """Builds every declared model (and so its provider); failures surface on the model's first request."""
+        for name in list(self._declared):
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Error initializing model {name}: {e}")
+
+    async def aprewarm(self, connections: Optional[int] = None) -> int:
+        """
+        Builds every declared model in a thread, then opens `connections`
+        (default MODEL_PREWARM) keep-alive connections per pooled provider.
+        Returns the number of connections warmed. Nothing goes over the network
+        when model calls come from a cassette.
+        """
+        await asyncio.to_thread(self.build_all)
+        connections = int(os.environ.get("MODEL_PREWARM", "0")) if connections is None else connections
+        if connections == 0 or get_cassette() is not None:
+            return 0
+        targets = {name: p for name, p in self._providers.items() if name in POOLED_PROVIDERS}
+        warmed = await asyncio.gather(*(
+            aprewarm_pool(
+                f"{provider.base_url.rstrip('/')}/models", connections, provider=name,
+                headers={"Authorization": f"Bearer {provider.client.api_key}"},
+            )
+            for name, provider in targets.items()
+        ))
+        print(f"Pre-warmed {sum(warmed)} connection(s) for {len(targets)} provider(s)")
+        return sum(warmed)
+
+
+registry = ModelRegistry()
+build_model = registry.build_model
+aprewarm = registry.aprewarm
@@ -0,0 +1,94 @@
+"""
+Partial structured-output streaming.
+
+PydanticAI's `stream_output` only yields outputs that validate, and a model
+whose fields are all required (like `chefResponse`) does not validate until
+every field has been generated, so nothing shows before the whole object is
+done. `stream_partial` reads the output tool's arguments as they stream in
+instead, parses them as partial JSON and yields a `PartialSnapshot` after each
+delta: the fields generated so far, validated against a copy of the model
+whose fields are all optional, and which of them are complete.
+
+The model writes the JSON object one key at a time, so every field before the
+last one present is complete; the last one completes with the output. The
+final snapshot carries the output validated by the agent as usual.
+
+    async with stream_agent("breakfast_chef", agent, prompt) as result:
+        async for snapshot in stream_partial(result, chefResponse):
+            if "ingredients" in snapshot.new:
+                check(snapshot.output.ingredients)
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import AsyncIterator, Generic, Optional, TypeVar
+
+from pydantic import BaseModel, ValidationError, create_model
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart
+from pydantic_core import from_json
+
+T = TypeVar("T", bound=BaseModel)
+
+
+@dataclass
+class PartialSnapshot(Generic[T]):
+    """
+    One step of a structured output being generated.
+    output: The fields so far (a `partial_model` instance while streaming, the
+        validated output on the final snapshot). Fields not generated yet are None;
+        the field being generated may hold a truncated string or list.
+    completed: Fields that are fully generated, in generation order.
+    new: Fields completed since the previous snapshot.
+    done: True on the final snapshot.
+    """
+    output: BaseModel
+    completed: tuple[str, ...]
+    new: tuple[str, ...]
+    done: bool = False
+
+
+@lru_cache(maxsize=None)
+def partial_model(model: type[T]) -> type[BaseModel]:
+    """A copy of `model` whose fields are all optional, for validating incomplete outputs."""
+    fields = {
+        name: (Optional[field.annotation], None)
+        for name, field in model.model_fields.items()
+    }
+    return create_model(f"Partial{model.__name__}", **fields)
+
+
+def _arguments(response: ModelResponse) -> Optional[str]:
+    """The JSON generated so far: the output tool call's arguments, or the text for prompted/native output."""
+    for part in reversed(response.parts):
+        if isinstance(part, ToolCallPart):
+            return part.args if isinstance(part.args, str) else None
+        if isinstance(part, TextPart):
+            return part.content
+    return None
+
+
+async def stream_partial(result, output_type: type[T], debounce_by: Optional[float] = None) -> AsyncIterator[PartialSnapshot[T]]:
+    """
+    Yields a snapshot of `output_type` each time a `run_stream` result adds
+    arguments to its output, then a final one with the validated output.
+    Deltas that do not parse or validate yet are skipped.
+    """
+    partial = partial_model(output_type)
+    completed: tuple[str, ...] = ()
+    seen = None
+    async for response in result.stream_response(debounce_by=debounce_by):
+        arguments = _arguments(response)
+        if not arguments or arguments == seen:
+            continue
+        seen = arguments
+        try:
+            fields = from_json(arguments, allow_partial="trailing-strings")
+            output = partial.model_validate(fields)
+        except (ValueError, ValidationError):
+            continue
+        now = tuple(name for name in list(fields)[:-1] if name in output_type.model_fields)
+        new, completed = now[len(completed):], now
+        yield PartialSnapshot(output, completed, new)
+
+    output = await result.get_output()
+    final = tuple(output_type.model_fields)
+    yield PartialSnapshot(output, final, tuple(name for name in final if name not in completed), done=True)
@@ -0,0 +1,138 @@
+"""
+Concurrent session runner.
+
+Drives many independent conversations through one of the agents at once, the
+PydanticAI counterpart of the LangGraph session runner. The concurrency limit
+caps the number of in-flight turns.
+
+Targets:
+- agent: the chat agent, carrying each session's message history between turns
+- meal_agent: intent routing followed by the chef (or general chat) agent
+
+Usage:
+    uv run session_runner.py meal_agent --sessions 200 --concurrency 50 --prompt "Pancakes for breakfast"
+    uv run session_runner.py agent --input sessions.jsonl --concurrency 20 --json results.json
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import resource
+import statistics
+import sys
+import time
+
+from cassette import get_cassette
+from instrumentation import run_agent
+from metrics import metrics
+from models import aprewarm
+
+
+async def chat_turn(module, turn: str, history: list) -> tuple[str, list]:
+    result = await run_agent("chat", module.agent, turn, message_history=history)
+    return result.output, result.all_messages()
+
+
+async def meal_turn(module, turn: str, history: list) -> tuple[str, list]:
+    return await module.answer(turn), history
+
+
+# module -> function running one turn: (module, turn, history) -> (reply, history)
+TARGETS = {
+    "agent": chat_turn,
+    "meal_agent": meal_turn,
+}
+
+
+async def run_session(module, run_turn, turns: list[str], semaphore: asyncio.Semaphore) -> dict:
+    """
+    Runs one conversation turn by turn, carrying the message history between turns.
+    """
+    history = []
+    latencies = []
+    reply = ""
+    for turn in turns:
+        queued_at = time.perf_counter()
+        async with semaphore:
+            # Time spent waiting for the semaphore is recorded as the turn's queue time
+            with metrics.span("turn", "session", queued_at=queued_at):
+                start = time.perf_counter()
+                reply, history = await run_turn(module, turn, history)
+                latencies.append(time.perf_counter() - start)
+    return {"latencies": latencies, "reply": reply}
+
+
+async def run_sessions(module, run_turn, sessions: list[list[str]], concurrency: int = 50) -> list:
+    """
+    Runs every session concurrently with at most `concurrency` turns in flight.
+    Failed sessions are returned as exceptions instead of cancelling the others.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(
+        *(run_session(module, run_turn, turns, semaphore) for turns in sessions),
+        return_exceptions=True,
+    )
+
+
+def max_rss_mb() -> float:
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(results: list, wall_time: float) -> dict:
+    latencies = [l for r in results if isinstance(r, dict) for l in r["latencies"]]
+    errors = [r for r in results if isinstance(r, BaseException)]
+    summary = {
+        "sessions": len(results),
+        "turns": len(latencies),
+        "errors": len(errors),
+        "wall_time_s": round(wall_time, 3),
+        "turns_per_s": round(len(latencies) / wall_time, 2) if wall_time else 0.0,
+        "max_rss_mb": max_rss_mb(),
+    }
+    if len(latencies) >= 2:
+        cuts = statistics.quantiles(latencies, n=100)
+        summary.update(p50_s=round(cuts[49], 3), p95_s=round(cuts[94], 3), p99_s=round(cuts[98], 3))
+    if errors:
+        summary["first_error"] = repr(errors[0])
+    return summary
+
+
+def load_sessions(args) -> list[list[str]]:
+    if args.input:
+        with open(args.input) as f:
+            return [json.loads(line)["turns"] for line in f if line.strip()]
+    return [list(args.prompt) for _ in range(args.sessions)]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run many agent sessions concurrently")
+    parser.add_argument("module", choices=sorted(TARGETS), help="Agent module to drive")
+    parser.add_argument("--sessions", type=int, default=10, help="Number of sessions when using --prompt")
+    parser.add_argument("--prompt", action="append", default=None, help="A turn sent by every session (repeatable)")
+    parser.add_argument("--input", help='JSONL file with one {"turns": [...]} object per session')
+    parser.add_argument("--concurrency", type=int, default=50, help="Maximum turns in flight")
+    parser.add_argument("--json", help="Also write the summary and metrics rows to this file")
+    args = parser.parse_args()
+    if not args.input and not args.prompt:
+        parser.error("either --prompt or --input is required")
+
+    module = importlib.import_module(args.module)
+    sessions = load_sessions(args)
+    await aprewarm()
+
+    start = time.perf_counter()
+    results = await run_sessions(module, TARGETS[args.module], sessions, args.concurrency)
+    summary = summarize(results, time.perf_counter() - start)
+    print(json.dumps(summary, indent=2))
+    print(metrics.report())
+    if get_cassette() is not None:
+        print(f"Cassette stats: {get_cassette().stats()}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary, "metrics": metrics.summary()}, f)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
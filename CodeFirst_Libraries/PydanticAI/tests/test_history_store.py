@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelMessage, ModelRequest, ModelResponse, SystemPromptPart, TextPart, UserPromptPart
+from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+from history_store import HistoryStore, _dump
+
+SYSTEM = "You are a terse assistant."
+BUDGET = 80  # two turns
+
+
+def turn(n: int, system: bool = False) -> list[ModelMessage]:
+    """One run's new messages, about 36 estimated tokens; the first run of a session carries the system prompt."""
+    parts = [SystemPromptPart(content=SYSTEM)] if system else []
+    return [
+        ModelRequest(parts=parts + [UserPromptPart(content=f"Question {n}: what should I cook tonight, given what is in the fridge?")]),
+        ModelResponse(parts=[TextPart(content=f"Answer {n}: a quick omelette with the leftover vegetables.")]),
+    ]
+
+
+def prompts(messages: list[ModelMessage]) -> list[str]:
+    return [p.content for m in messages for p in m.parts if isinstance(p, UserPromptPart)]
+
+
+class Summarizer:
+    """A summary agent on FunctionModel that counts its calls."""
+
+    def __init__(self):
+        self.calls = 0
+        self.agent = Agent(FunctionModel(self.summarize))
+
+    def summarize(self, messages, info: AgentInfo) -> ModelResponse:
+        self.calls += 1
+        return ModelResponse(parts=[TextPart(content=f"Summary {self.calls}: the user keeps asking what to cook.")])
+
+
+def filled_store(path, turns: int = 6) -> tuple[HistoryStore, Summarizer]:
+    summarizer = Summarizer()
+    store = HistoryStore(path, max_tokens=BUDGET, summarizer=summarizer.agent)
+    for n in range(1, turns + 1):
+        asyncio.run(store.add(turn(n, system=n == 1)))
+    return store, summarizer
+
+
+# --- Window ---
+def test_window_keeps_the_latest_turns_after_the_system_prompt_and_summary(tmp_path):
+    store, summarizer = filled_store(tmp_path / "s.jsonl")
+    stats = store.stats()
+    assert stats["turns_in_memory"] == 2 and stats["evicted_turns"] == 4
+    assert stats["tokens_in_memory"] <= BUDGET and summarizer.calls == 4
+
+    lead, *window = store.messages
+    assert [p.content for p in lead.parts] == [SYSTEM, "Summary of the earlier conversation:\nSummary 4: the user keeps asking what to cook."]
+    assert prompts(window)[0].startswith("Question 5") and len(window) == 4
+    # The system prompt is stored once, not in the first turn
+    assert not any(isinstance(p, SystemPromptPart) for m in window for p in m.parts)
+
+
+# --- Reload ---
+def test_reloaded_store_matches_the_one_that_wrote_the_log(tmp_path):
+    path = tmp_path / "s.jsonl"
+    store, summarizer = filled_store(path)
+
+    reloaded = HistoryStore(path, max_tokens=BUDGET, summarizer=Summarizer().agent)
+    (lead, *window), (reloaded_lead, *reloaded_window) = store.messages, reloaded.messages
+    # Only the system prompt's text is logged, so the lead parts match by content
+    assert [p.content for p in reloaded_lead.parts] == [p.content for p in lead.parts]
+    assert _dump(reloaded_window) == _dump(window)
+    assert reloaded.stats() == store.stats()
+    assert reloaded.summary == store.summary
+
+
+def test_reload_does_not_summarize_again_or_log_the_system_prompt_twice(tmp_path):
+    path = tmp_path / "s.jsonl"
+    filled_store(path)
+    summarizer = Summarizer()
+    reloaded = HistoryStore(path, max_tokens=BUDGET, summarizer=summarizer.agent)
+    assert reloaded.messages and summarizer.calls == 0
+
+    asyncio.run(reloaded.add(turn(7, system=True)))
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [r["type"] for r in records].count("system") == 1
+    assert summarizer.calls == 1 and prompts(reloaded.messages[1:])[0].startswith("Question 6")
+
+
+def test_log_is_read_lazily(tmp_path):
+    path = tmp_path / "s.jsonl"
+    filled_store(path, turns=1)
+    reloaded = HistoryStore(path, max_tokens=BUDGET)
+    # Written after the store was created, before its history was first needed
+    path.write_text(path.read_text() + json.dumps({"type": "turn", "messages": _dump(turn(2))}) + "\n")
+    assert prompts(reloaded.messages) == ["Question 1: what should I cook tonight, given what is in the fridge?",
+                                          "Question 2: what should I cook tonight, given what is in the fridge?"]
+
+
+def test_reload_holds_at_most_the_budget_while_reading(tmp_path, monkeypatch):
+    path = tmp_path / "s.jsonl"
+    filled_store(path, turns=1)
+    with open(path, "a") as f:
+        for n in range(2, 201):
+            f.write(json.dumps({"type": "turn", "messages": _dump(turn(n))}) + "\n")
+
+    reloaded = HistoryStore(path, max_tokens=BUDGET)
+    peak = []
+    evict = HistoryStore._evict
+
+    def watching_evict(self):
+        evicted = evict(self)
+        peak.append(len(self._turns))
+        return evicted
+
+    monkeypatch.setattr(HistoryStore, "_evict", watching_evict)
+    assert reloaded.stats()["evicted_turns"] == 198
+    assert max(peak) == 2
+
+
+# --- With an agent ---
+def test_reloaded_history_leads_with_the_system_prompt(tmp_path):
+    seen = []
+
+    def reply(messages, info: AgentInfo) -> ModelResponse:
+        seen.append(messages)
+        return ModelResponse(parts=[TextPart(content="An omelette.")])
+
+    agent = Agent(FunctionModel(reply), system_prompt=SYSTEM)
+    store = HistoryStore(tmp_path / "s.jsonl")
+    result = agent.run_sync("What should I cook?", message_history=store.messages)
+    asyncio.run(store.add(result.new_messages()))
+
+    # A new process: the agent only adds its system prompt to an empty history, so the store must
+    reloaded = HistoryStore(tmp_path / "s.jsonl")
+    agent.run_sync("And tomorrow?", message_history=reloaded.messages)
+    first = seen[-1][0].parts[0]
+    assert isinstance(first, SystemPromptPart) and first.content == SYSTEM
+    assert prompts(seen[-1]) == ["What should I cook?", "And tomorrow?"]
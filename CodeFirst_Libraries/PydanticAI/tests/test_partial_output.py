@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+from pydantic import BaseModel
+from pydantic_ai import Agent, PromptedOutput
+from pydantic_ai.models.function import AgentInfo, DeltaToolCall, FunctionModel
+
+from partial_output import partial_model, stream_partial
+
+
+class Recipe(BaseModel):
+    name: str
+    ingredients: list[str]
+    steps: list[str]
+
+
+RECIPE = {"name": "Pancakes", "ingredients": ["flour", "milk", "eggs"], "steps": ["mix", "fry"]}
+
+
+def tool_stream(arguments: str, size: int = 7):
+    """A model that writes `arguments` into the output tool call a few characters at a time."""
+    async def stream(messages, info: AgentInfo):
+        tool = info.output_tools[0].name
+        for i in range(0, len(arguments), size):
+            yield {0: DeltaToolCall(name=tool if i == 0 else None, json_args=arguments[i:i + size])}
+    return stream
+
+
+def text_stream(arguments: str, size: int = 7):
+    async def stream(messages, info: AgentInfo):
+        for i in range(0, len(arguments), size):
+            yield arguments[i:i + size]
+    return stream
+
+
+def snapshots(agent: Agent) -> list:
+    async def run():
+        async with agent.run_stream("Pancakes, please") as result:
+            return [snapshot async for snapshot in stream_partial(result, Recipe)]
+    return asyncio.run(run())
+
+
+def test_fields_complete_one_at_a_time():
+    steps = snapshots(Agent(FunctionModel(stream_function=tool_stream(json.dumps(RECIPE))), output_type=Recipe))
+
+    # Every field is announced once, in generation order, the last one with the final output
+    assert [name for s in steps for name in s.new] == ["name", "ingredients", "steps"]
+    assert [s.done for s in steps].count(True) == 1 and steps[-1].done
+    ingredients = next(s for s in steps if "ingredients" in s.new)
+    assert not ingredients.done and ingredients.output.ingredients == RECIPE["ingredients"]
+    assert ingredients.output.steps is not None and ingredients.completed == ("name", "ingredients")
+
+
+def test_field_being_generated_is_truncated_and_later_ones_are_none():
+    steps = snapshots(Agent(FunctionModel(stream_function=tool_stream(json.dumps(RECIPE))), output_type=Recipe))
+    assert any(s.output.name == "Panc" and s.output.ingredients is None for s in steps)
+    assert any(s.output.ingredients == ["flour", "mi"] and s.completed == ("name",) for s in steps)
+
+
+def test_final_snapshot_is_the_validated_output():
+    steps = snapshots(Agent(FunctionModel(stream_function=tool_stream(json.dumps(RECIPE))), output_type=Recipe))
+    assert isinstance(steps[-1].output, Recipe) and steps[-1].output == Recipe(**RECIPE)
+    assert steps[-1].completed == ("name", "ingredients", "steps")
+    assert all(not isinstance(s.output, Recipe) for s in steps[:-1])
+
+
+def test_prompted_output_is_read_from_the_text():
+    steps = snapshots(Agent(FunctionModel(stream_function=text_stream(json.dumps(RECIPE))), output_type=PromptedOutput(Recipe)))
+    assert [name for s in steps for name in s.new] == ["name", "ingredients", "steps"]
+    assert steps[-1].output == Recipe(**RECIPE)
+
+
+def test_keys_outside_the_model_are_not_reported():
+    arguments = json.dumps({"name": "Pancakes", "note": "serves two", **RECIPE})
+    steps = snapshots(Agent(FunctionModel(stream_function=tool_stream(arguments)), output_type=Recipe))
+    assert [name for s in steps for name in s.new] == ["name", "ingredients", "steps"]
+    assert all("note" not in s.completed for s in steps)
+
+
+def test_partial_model_makes_every_field_optional():
+    partial = partial_model(Recipe)
+    assert partial is partial_model(Recipe)
+    assert partial().model_dump() == {"name": None, "ingredients": None, "steps": None}
+    assert partial(name="Panc").name == "Panc"
@@ -0,0 +1,528 @@
+"""
+Local mailbox index.
+
+Without it every listing and search goes to Gmail and downloads the same
+headers again. `MailIndex` keeps the headers of a mailbox (and with
+MAIL_INDEX_BODIES=1 the text of the messages) in a SQLite file, brought up to
+date incrementally by `sync`:
+
+- new messages: only the UIDs from the stored UIDNEXT up are fetched
+- flags and labels: with CONDSTORE, only the messages whose MODSEQ moved past
+  the stored HIGHESTMODSEQ (no request at all when it has not moved); without
+  it, the flags of the indexed messages, no headers
+- deleted messages: dropped after comparing the indexed UIDs with a UID SEARCH,
+  skipped when the message counts show nothing was deleted
+- a new UIDVALIDITY means the UIDs were reassigned, so the mailbox is indexed anew
+
+The first sync indexes the newest MAIL_INDEX_DEPTH messages (default 5000, 0
+for the whole mailbox). That can take minutes, so `refresh` does it in a
+background thread (or leaves it to an explicit sync), and so does it after a
+UIDVALIDITY change; meanwhile the mailbox is not indexed and the caller asks
+the server. A mailbox synced less than MAIL_INDEX_MAX_AGE seconds ago (default
+60) is answered without contacting the server, in milliseconds. Queries
+reaching below the indexed range return None, and the caller asks the server
+instead.
+
+MAIL_INDEX=1 keeps the index in ~/.cache/gmail-index/index.sqlite,
+MAIL_INDEX=<path> in another file. Shared by the Gmail MCP server (GMailMCP)
+and the Gmail skill (GmailSkill/scripts), which can use the same file; the
+copies of this module are kept identical.
+"""
+import imaplib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from email import policy
+from email.parser import BytesHeaderParser, BytesParser
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Iterator, Optional, TypeVar
+
+from gmail_imap import (
+    MONTHS, UID_PATTERN, EmailSummary, MailboxState, SearchFilters, SearchPage,
+    decode_value, imap_date, parse_summary, select,
+)
+
+DEFAULT_PATH = Path.home() / ".cache" / "gmail-index" / "index.sqlite"
+
+# Header fields stored for every message; TO is searched by `recipient`
+INDEX_FIELDS = ("SUBJECT", "FROM", "TO", "DATE")
+
+# Messages per FETCH while syncing
+FETCH_BATCH = 500
+
+# Characters of text kept per message with bodies enabled
+BODY_LIMIT = 20000
+
+FLAGS_PATTERN = re.compile(rb"\bFLAGS \(([^)]*)\)")
+LABELS_PATTERN = re.compile(rb'X-GM-LABELS \(((?:[^()"]|"(?:[^"\\]|\\.)*")*)\)')
+LABEL_TOKEN = re.compile(rb'"((?:[^"\\]|\\.)*)"|([^\s"]+)')
+INTERNALDATE_PATTERN = re.compile(rb'INTERNALDATE "\s?(\d{1,2})-([A-Za-z]{3})-(\d{4})')
+HTML_TAG = re.compile(r"<[^>]+>")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS mailboxes (
+    account TEXT NOT NULL,
+    mailbox TEXT NOT NULL,
+    uidvalidity INTEGER,
+    uidnext INTEGER NOT NULL,
+    -- Every message with a UID from low_uid up is indexed; 1 once the whole mailbox is
+    low_uid INTEGER NOT NULL,
+    highestmodseq INTEGER,
+    bodies INTEGER NOT NULL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (account, mailbox)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    account TEXT NOT NULL,
+    mailbox TEXT NOT NULL,
+    uid INTEGER NOT NULL,
+    subject TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    date TEXT NOT NULL,
+    -- INTERNALDATE as YYYY-MM-DD, which since/before compare like IMAP SEARCH does
+    received TEXT,
+    flags TEXT NOT NULL,
+    -- One per line, with a newline before and after each, for exact matches
+    labels TEXT NOT NULL,
+    body TEXT,
+    PRIMARY KEY (account, mailbox, uid)
+);
+"""
+
+T = TypeVar("T")
+
+# Runs a function with a logged-in IMAP connection and returns its result
+Session = Callable[[Callable[[imaplib.IMAP4], T]], T]
+
+
+# --- FETCH parsing ---
+def _records(data: list) -> list[tuple[bytes, Optional[bytes]]]:
+    """(metadata, literal) for every message of a FETCH response; the metadata includes what follows the literal."""
+    records = []
+    after_literal = False
+    for item in data:
+        if isinstance(item, tuple):
+            records.append([item[0], item[1]])
+            after_literal = True
+        elif isinstance(item, bytes):
+            if after_literal:
+                records[-1][0] += item
+            else:
+                records.append([item, None])
+            after_literal = False
+    return [(meta, literal) for meta, literal in records]
+
+
+def _flags(meta: bytes) -> str:
+    match = FLAGS_PATTERN.search(meta)
+    return match.group(1).decode(errors="ignore") if match else ""
+
+
+def _labels(meta: bytes) -> str:
+    match = LABELS_PATTERN.search(meta)
+    if not match:
+        return ""
+    labels = []
+    for token in LABEL_TOKEN.finditer(match.group(1)):
+        quoted, atom = token.groups()
+        labels.append(re.sub(rb"\\(.)", rb"\1", quoted) if quoted is not None else atom)
+    return "".join(f"\n{label.decode(errors='ignore')}\n" for label in labels)
+
+
+def _received(meta: bytes) -> Optional[str]:
+    match = INTERNALDATE_PATTERN.search(meta)
+    if not match or match.group(2).decode().title() not in MONTHS:
+        return None
+    day, month, year = int(match.group(1)), MONTHS.index(match.group(2).decode().title()) + 1, match.group(3).decode()
+    return f"{year}-{month:02d}-{day:02d}"
+
+
+def body_text(raw: bytes) -> str:
+    """The plain-text body of a full message (HTML with the tags removed when there is no plain part)."""
+    message = BytesParser(policy=policy.default).parsebytes(raw)
+    part = message.get_body(preferencelist=("plain", "html"))
+    if part is None:
+        return ""
+    try:
+        text = part.get_content()
+    except (LookupError, ValueError):
+        return ""
+    if part.get_content_type() == "text/html":
+        text = HTML_TAG.sub(" ", text)
+    return text[:BODY_LIMIT]
+
+
+def _message_row(meta: bytes, raw: bytes, bodies: bool) -> Optional[tuple]:
+    match = UID_PATTERN.search(meta)
+    if not match:
+        return None
+    summary = parse_summary(int(match.group(1)), raw)
+    recipient = decode_value(BytesHeaderParser().parsebytes(raw)["To"])
+    return (
+        summary.uid, summary.subject, summary.sender, recipient, summary.date,
+        _received(meta), _flags(meta), _labels(meta), body_text(raw) if bodies else None,
+    )
+
+
+def _uids(data: list) -> list[int]:
+    return [int(uid) for uid in b" ".join(item for item in data if isinstance(item, bytes)).split()]
+
+
+def _batches(uids: list[int]) -> Iterator[str]:
+    for start in range(0, len(uids), FETCH_BATCH):
+        yield ",".join(map(str, uids[start:start + FETCH_BATCH]))
+
+
+class MailIndex:
+    def __init__(self, path: Path = DEFAULT_PATH, max_age: float = 60.0, depth: int = 5000, bodies: bool = False):
+        self.path = Path(path).expanduser()
+        self.max_age = max_age
+        self.depth = depth
+        self.bodies = bodies
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._db() as db:
+            # WAL lets the server and the skill read while the other one syncs
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        # One sync at a time per (account, mailbox); the others wait and then find it fresh
+        self._sync_locks: dict[tuple[str, str], threading.Lock] = defaultdict(threading.Lock)
+        # (account, mailbox) -> the thread indexing it anew; incremental syncs skip it meanwhile
+        self._builders: dict[tuple[str, str], threading.Thread] = {}
+        self._counts = {
+            "answered": 0, "not_covered": 0, "syncs": 0, "fetched": 0, "flag_updates": 0, "expunged": 0,
+            "builds": 0, "build_errors": 0,
+        }
+
+    @contextmanager
+    def _db(self) -> Iterator[sqlite3.Connection]:
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._counts[name] += n
+
+    def _state(self, db: sqlite3.Connection, account: str, mailbox: str) -> Optional[sqlite3.Row]:
+        db.row_factory = sqlite3.Row
+        return db.execute("SELECT * FROM mailboxes WHERE account = ? AND mailbox = ?", (account, mailbox)).fetchone()
+
+    # --- Sync ---
+    def refresh(self, account: str, session: Session, mailbox: str = "inbox", force: bool = False,
+                rebuild: str = "background") -> bool:
+        """
+        Syncs the mailbox through `session` unless it was synced less than
+        max_age seconds ago. Returns whether it synced.
+
+        Only incremental syncs run in the call by default. Indexing the mailbox
+        anew (the first sync, or after a UIDVALIDITY change) downloads up to
+        `depth` messages, so `rebuild` says where that happens: "now" in the
+        call, "background" in a thread, or "never", leaving it to a later call
+        with "now". Until it is done the mailbox is not indexed, and queries
+        return None.
+        """
+        if rebuild not in ("now", "background", "never"):
+            raise ValueError(f"rebuild must be 'now', 'background' or 'never', not {rebuild!r}")
+        key = (account, mailbox)
+        with self._lock:
+            sync_lock = self._sync_locks[key]
+        with sync_lock:
+            with self._lock:
+                builder = self._builders.get(key)
+            if builder is not None:
+                if rebuild != "now":
+                    return False
+                builder.join()
+            with self._db() as db:
+                state = self._state(db, account, mailbox)
+            if not force and state is not None and state["bodies"] >= self.bodies and time.time() - state["synced_at"] < self.max_age:
+                return False
+            if rebuild == "now":
+                session(lambda mail: self.sync(mail, account, mailbox))
+                return True
+            if state is not None and session(lambda mail: self.sync(mail, account, mailbox, rebuild=False)) is not None:
+                return True
+            if rebuild == "background":
+                self._build_in_background(account, session, mailbox)
+            return False
+
+    def _build_in_background(self, account: str, session: Session, mailbox: str):
+        """Indexes the mailbox anew in a daemon thread; called with its sync lock held."""
+        key = (account, mailbox)
+
+        def build():
+            try:
+                session(lambda mail: self.sync(mail, account, mailbox))
+                self._count("builds")
+            except Exception:
+                # The mailbox stays unindexed, and the next refresh tries again
+                self._count("build_errors")
+            finally:
+                with self._lock:
+                    del self._builders[key]
+
+        thread = threading.Thread(target=build, name=f"mail-index-build-{account}-{mailbox}", daemon=True)
+        with self._lock:
+            self._builders[key] = thread
+        thread.start()
+
+    def sync(self, mail: imaplib.IMAP4, account: str, mailbox: str = "inbox", rebuild: bool = True) -> Optional[dict]:
+        """
+        Brings the index of `mailbox` up to date with the server; returns what
+        changed. When the mailbox has to be indexed anew and `rebuild` is False,
+        it is dropped from the index instead, and None is returned.
+        """
+        condstore = _enable_condstore(mail)
+        server = select(mail, mailbox)
+        with self._db() as db:
+            stored = self._state(db, account, mailbox)
+        if stored is not None and (stored["uidvalidity"] != server.uidvalidity or stored["bodies"] < self.bodies):
+            # The stored UIDs no longer name the same messages, or the bodies are missing: start over
+            stored = None
+        if stored is None and not rebuild:
+            with self._db() as db:
+                db.execute("DELETE FROM mailboxes WHERE account = ? AND mailbox = ?", (account, mailbox))
+            return None
+
+        if stored is None:
+            rows, low_uid = self._initial(mail, server)
+            uidnext = server.uidnext or max((row[0] for row in rows), default=0) + 1
+            changes = {"fetched": len(rows), "flag_updates": 0, "expunged": 0}
+            with self._db() as db:
+                db.execute("DELETE FROM messages WHERE account = ? AND mailbox = ?", (account, mailbox))
+                self._store(db, account, mailbox, rows)
+                self._save_state(db, account, mailbox, server, uidnext, low_uid, condstore)
+        else:
+            rows = self._new_messages(mail, server, stored["uidnext"])
+            updates = self._changed_flags(mail, server, stored, condstore)
+            uidnext = server.uidnext or max([stored["uidnext"]] + [row[0] + 1 for row in rows])
+            with self._db() as db:
+                self._store(db, account, mailbox, rows)
+                db.executemany(
+                    "UPDATE messages SET flags = ?, labels = ? WHERE account = ? AND mailbox = ? AND uid = ?",
+                    [(flags, labels, account, mailbox, uid) for uid, flags, labels in updates],
+                )
+                indexed = db.execute(
+                    "SELECT COUNT(*) FROM messages WHERE account = ? AND mailbox = ?", (account, mailbox)
+                ).fetchone()[0]
+            expunged = []
+            if stored["low_uid"] > 1 or indexed != server.exists:
+                expunged = self._expunged(mail, account, mailbox, stored["low_uid"])
+            with self._db() as db:
+                db.executemany(
+                    "DELETE FROM messages WHERE account = ? AND mailbox = ? AND uid = ?",
+                    [(account, mailbox, uid) for uid in expunged],
+                )
+                self._save_state(db, account, mailbox, server, uidnext, stored["low_uid"], condstore)
+            changes = {"fetched": len(rows), "flag_updates": len(updates), "expunged": len(expunged)}
+
+        self._count("syncs")
+        for name, n in changes.items():
+            self._count(name, n)
+        return changes
+
+    def _query(self, mail: imaplib.IMAP4) -> str:
+        items = ["UID", "FLAGS", "INTERNALDATE"]
+        if "X-GM-EXT-1" in mail.capabilities:
+            items.append("X-GM-LABELS")
+        items.append("BODY.PEEK[]" if self.bodies else f"BODY.PEEK[HEADER.FIELDS ({' '.join(INDEX_FIELDS)})]")
+        return f"({' '.join(items)})"
+
+    def _fetch(self, mail: imaplib.IMAP4, message_set: str, by_uid: bool) -> list[tuple]:
+        query = self._query(mail)
+        status, data = mail.uid("FETCH", message_set, query) if by_uid else mail.fetch(message_set, query)
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"FETCH failed: {data}")
+        rows = [_message_row(meta, raw, self.bodies) for meta, raw in _records(data) if raw is not None]
+        return [row for row in rows if row is not None]
+
+    def _initial(self, mail: imaplib.IMAP4, server: MailboxState) -> tuple[list[tuple], int]:
+        """The newest `depth` messages, by sequence number, and the lowest UID from which the index is complete."""
+        if server.exists == 0:
+            return [], 1
+        start = 1 if self.depth <= 0 else max(1, server.exists - self.depth + 1)
+        rows = []
+        for first in range(start, server.exists + 1, FETCH_BATCH):
+            rows += self._fetch(mail, f"{first}:{min(first + FETCH_BATCH - 1, server.exists)}", by_uid=False)
+        low_uid = 1 if start == 1 else min((row[0] for row in rows), default=1)
+        return rows, low_uid
+
+    def _new_messages(self, mail: imaplib.IMAP4, server: MailboxState, uidnext: int) -> list[tuple]:
+        if server.uidnext is not None and server.uidnext <= uidnext:
+            return []
+        status, data = mail.uid("SEARCH", "UID", f"{uidnext}:*")
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"SEARCH failed: {data}")
+        # `N:*` always matches the last message, even when its UID is below N
+        uids = sorted(uid for uid in _uids(data) if uid >= uidnext)
+        rows = []
+        for message_set in _batches(uids):
+            rows += self._fetch(mail, message_set, by_uid=True)
+        return rows
+
+    def _changed_flags(self, mail: imaplib.IMAP4, server: MailboxState, stored: sqlite3.Row, condstore: bool) -> list[tuple]:
+        """(uid, flags, labels) of the indexed messages whose flags may have changed."""
+        items = "(UID FLAGS X-GM-LABELS)" if "X-GM-EXT-1" in mail.capabilities else "(UID FLAGS)"
+        if condstore and server.highestmodseq is not None and stored["highestmodseq"] is not None:
+            if server.highestmodseq <= stored["highestmodseq"]:
+                return []
+            status, data = mail.uid("FETCH", f"{stored['low_uid']}:*", items, f"(CHANGEDSINCE {stored['highestmodseq']})")
+        else:
+            status, data = mail.uid("FETCH", f"{stored['low_uid']}:*", items)
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"FETCH failed: {data}")
+        updates = []
+        for meta, _ in _records(data):
+            match = UID_PATTERN.search(meta)
+            if match:
+                updates.append((int(match.group(1)), _flags(meta), _labels(meta)))
+        return updates
+
+    def _expunged(self, mail: imaplib.IMAP4, account: str, mailbox: str, low_uid: int) -> list[int]:
+        status, data = mail.uid("SEARCH", "UID", f"{low_uid}:*")
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"SEARCH failed: {data}")
+        on_server = set(_uids(data))
+        with self._db() as db:
+            indexed = [uid for (uid,) in db.execute(
+                "SELECT uid FROM messages WHERE account = ? AND mailbox = ?", (account, mailbox)
+            )]
+        return [uid for uid in indexed if uid not in on_server]
+
+    def _store(self, db: sqlite3.Connection, account: str, mailbox: str, rows: list[tuple]):
+        db.executemany(
+            "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(account, mailbox) + row for row in rows],
+        )
+
+    def _save_state(self, db: sqlite3.Connection, account: str, mailbox: str, server: MailboxState,
+                    uidnext: int, low_uid: int, condstore: bool):
+        db.execute(
+            "INSERT OR REPLACE INTO mailboxes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (account, mailbox, server.uidvalidity, uidnext, low_uid,
+             server.highestmodseq if condstore else None, int(self.bodies), time.time()),
+        )
+
+    # --- Queries ---
+    def recent(self, account: str, count: int = 10, mailbox: str = "inbox") -> Optional[list[EmailSummary]]:
+        """The last `count` emails, newest first; None when the mailbox is not indexed that far back."""
+        with self._db() as db:
+            state = self._state(db, account, mailbox)
+            rows = [] if state is None else db.execute(
+                "SELECT uid, subject, sender, date FROM messages WHERE account = ? AND mailbox = ? ORDER BY uid DESC LIMIT ?",
+                (account, mailbox, max(count, 0)),
+            ).fetchall()
+        if state is None or (len(rows) < count and state["low_uid"] > 1):
+            self._count("not_covered")
+            return None
+        self._count("answered")
+        return [EmailSummary(*row) for row in rows]
+
+    def search(self, account: str, filters: SearchFilters, limit: int = 20, cursor: Optional[int] = None,
+               mailbox: str = "inbox") -> Optional[SearchPage]:
+        """
+        One page of the emails matching `filters`, newest first, like
+        gmail_imap.search_emails. None when the index cannot answer: the cursor
+        is below the indexed range, or `text` is set and bodies are not indexed.
+        When the page runs out of indexed messages before the start of the
+        mailbox, next_cursor points the caller at the rest, on the server.
+        """
+        with self._db() as db:
+            state = self._state(db, account, mailbox)
+            covered = state is not None and (cursor is None or cursor > state["low_uid"] or state["low_uid"] == 1)
+            if not covered or (filters.text and not state["bodies"]):
+                self._count("not_covered")
+                return None
+            where, params = _where(filters)
+            rows = db.execute(
+                f"SELECT uid, subject, sender, date FROM messages WHERE account = ? AND mailbox = ? AND uid < ?{where} "
+                "ORDER BY uid DESC LIMIT ?",
+                [account, mailbox, cursor if cursor is not None else state["uidnext"], *params, limit + 1],
+            ).fetchall()
+        self._count("answered")
+        emails = [EmailSummary(*row) for row in rows[:limit]]
+        if len(rows) > limit:
+            return SearchPage(emails, emails[-1].uid)
+        return SearchPage(emails, state["low_uid"] if state["low_uid"] > 1 else None)
+
+    # --- Reporting ---
+    def stats(self) -> dict:
+        with self._db() as db:
+            db.row_factory = sqlite3.Row
+            mailboxes = {
+                f"{row['account']}/{row['mailbox']}": {
+                    "messages": row["messages"],
+                    "complete": row["low_uid"] == 1,
+                    "uidvalidity": row["uidvalidity"],
+                    "uidnext": row["uidnext"],
+                    "highestmodseq": row["highestmodseq"],
+                    "bodies": bool(row["bodies"]),
+                    "synced_seconds_ago": round(time.time() - row["synced_at"], 1),
+                }
+                for row in db.execute(
+                    "SELECT m.*, (SELECT COUNT(*) FROM messages x WHERE x.account = m.account AND x.mailbox = m.mailbox) "
+                    "AS messages FROM mailboxes m"
+                )
+            }
+        with self._lock:
+            building = [f"{account}/{mailbox}" for account, mailbox in self._builders]
+            return {"path": str(self.path), "mailboxes": mailboxes, "building": building, **self._counts}
+
+
+def _enable_condstore(mail: imaplib.IMAP4) -> bool:
+    """Turns on CONDSTORE (before SELECT) when the server has it, so SELECT reports HIGHESTMODSEQ."""
+    if "CONDSTORE" not in mail.capabilities or "ENABLE" not in mail.capabilities:
+        return False
+    if mail.state == "AUTH":
+        mail.enable("CONDSTORE")
+    return True
+
+
+def _where(filters: SearchFilters) -> tuple[str, list]:
+    """The SQL conditions for the filters, matching the way IMAP SEARCH does (case-insensitive substrings)."""
+    conditions, params = [], []
+    if filters.since:
+        imap_date(filters.since)
+        conditions.append("received >= ?")
+        params.append(filters.since)
+    if filters.before:
+        imap_date(filters.before)
+        conditions.append("received < ?")
+        params.append(filters.before)
+    for column, value in (("sender", filters.sender), ("recipient", filters.recipient), ("subject", filters.subject)):
+        if value:
+            conditions.append(f"instr(lower({column}), lower(?)) > 0")
+            params.append(value)
+    if filters.unread:
+        conditions.append("instr(flags, '\\Seen') = 0")
+    if filters.label:
+        conditions.append("instr(lower(labels), lower(?)) > 0")
+        params.append(f"\n{filters.label}\n")
+    if filters.text:
+        conditions.append("instr(lower(subject || ' ' || sender || ' ' || recipient || ' ' || coalesce(body, '')), lower(?)) > 0")
+        params.append(filters.text)
+    return "".join(f" AND {condition}" for condition in conditions), params
+
+
+@lru_cache(maxsize=None)
+def get_mail_index() -> Optional[MailIndex]:
+    """The process-wide index, configured from the environment on first use; None unless MAIL_INDEX is set."""
+    setting = os.environ.get("MAIL_INDEX", "")
+    if setting in ("", "0"):
+        return None
+    return MailIndex(
+        path=DEFAULT_PATH if setting == "1" else Path(setting),
+        max_age=float(os.environ.get("MAIL_INDEX_MAX_AGE", "60")),
+        depth=int(os.environ.get("MAIL_INDEX_DEPTH", "5000")),
+        bodies=os.environ.get("MAIL_INDEX_BODIES", "0") == "1",
+    )
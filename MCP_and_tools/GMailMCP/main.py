@@ -1,19 +1,31 @@
 from fastmcp import FastMCP
-import smtplib
-import imaplib
-import email
-from email.header import decode_header
 from email.message import EmailMessage
 import os
+from typing import Optional
 from dotenv import load_dotenv
 
+from gmail_imap import SearchFilters, recent_emails, search_emails as search_mailbox
+from mail_index import get_mail_index
+from mail_pool import get_mail_pool
+from tool_runner import offload
+
 # Load environment variables
 load_dotenv()
 
 # Initialize FastMCP
 mcp = FastMCP("Gmail Integration")
 
+def pooled_session(email_address: str, password: str, operation: str):
+    """Runs a function on a pooled IMAP session, for syncing the mail index."""
+    return lambda fn: get_mail_pool().imap(email_address, password, fn, operation=operation)
+
+# The tools block on IMAP/SMTP sockets, so each runs in a bounded thread pool with its own
+# concurrency limit and timeout, keeping the event loop free for parallel calls (see tool_runner.py)
+
 @mcp.tool()
+# No call timeout: a send that timed out may still go through, and a retry would send it twice.
+# MAIL_TIMEOUT bounds each SMTP operation instead (see mail_pool.py).
+@offload(concurrency=4, timeout=None)
 def send_email(sender: str, recipient: str, title: str, body: str) -> str:
     """
     Send an email using Gmail SMTP.
@@ -36,74 +48,117 @@ def send_email(sender: str, recipient: str, title: str, body: str) -> str:
     msg["To"] = recipient
 
     try:
-        # Connect to Gmail SMTP server
-        # Note: This requires an App Password if 2FA is enabled
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(sender, password)
-            server.send_message(msg)
+        # Sent on a pooled, already logged-in Gmail SMTP session (see mail_pool.py)
+        get_mail_pool().smtp(sender, password, lambda server: server.send_message(msg), operation="send_email")
         return f"Email sent successfully to {recipient}"
     except Exception as e:
         return f"Error sending email: {str(e)}"
 
 @mcp.tool()
-def get_recent_emails(email_address: str) -> list[str]:
+@offload(concurrency=4, timeout=30)
+def get_recent_emails(email_address: str, count: int = 10) -> list[dict]:
     """
-    Retrieve the titles of the last 10 emails from the inbox.
+    Retrieve the headers (uid, subject, sender, date) of the most recent emails in the inbox, newest first.
     
     Args:
         email_address: The email address to check (must match GMAIL_PASSWORD account).
+        count: How many emails to return (default 10).
     """
     password = os.getenv("GMAIL_PASSWORD")
     if not password:
         raise ValueError("GMAIL_PASSWORD not set in environment variables.")
     
     try:
-        # Connect to Gmail IMAP server
-        mail = imaplib.IMAP4_SSL("imap.gmail.com")
-        mail.login(email_address, password)
-        
-        # Select the 'inbox'
-        mail.select("inbox")
-        
-        # Search for all emails
-        status, messages = mail.search(None, "ALL")
-        if status != "OK":
-            return ["Error retrieving emails"]
-        
-        # Get the list of email IDs
-        email_ids = messages[0].split()
-        
-        # Get the last 10 email IDs (or fewer if less than 10 exist)
-        last_10_ids = email_ids[-10:] if len(email_ids) >= 10 else email_ids
-        
-        titles = []
-        # Fetch in reverse order (newest first)
-        for e_id in reversed(last_10_ids):
-            status, msg_data = mail.fetch(e_id, "(RFC822)")
-            if status != "OK":
-                continue
-            
-            for response_part in msg_data:
-                if isinstance(response_part, tuple):
-                    msg = email.message_from_bytes(response_part[1])
-                    subject = msg["Subject"]
-                    if subject:
-                        decoded_list = decode_header(subject)
-                        subject_str = ""
-                        for decoded_part, encoding in decoded_list:
-                            if isinstance(decoded_part, bytes):
-                                subject_str += decoded_part.decode(encoding if encoding else "utf-8", errors="ignore")
-                            else:
-                                subject_str += decoded_part
-                        titles.append(subject_str)
-                    else:
-                        titles.append("(No Subject)")
-                    
-        mail.logout()
-        return titles
+        index = get_mail_index()
+        if index is not None:
+            # From the local index, synced incrementally at most every MAIL_INDEX_MAX_AGE seconds (see mail_index.py);
+            # until its first full sync has finished in the background, the server answers
+            index.refresh(email_address, pooled_session(email_address, password, "index_sync"))
+            summaries = index.recent(email_address, count)
+            if summaries is not None:
+                return [summary.to_dict() for summary in summaries]
+
+        # One header-only FETCH for the last `count` messages of the inbox (see gmail_imap.py),
+        # on a pooled, already logged-in IMAP session (see mail_pool.py)
+        summaries = get_mail_pool().imap(
+            email_address, password, lambda mail: recent_emails(mail, count), operation="get_recent_emails"
+        )
+        return [summary.to_dict() for summary in summaries]
     except Exception as e:
-        return [f"Error retrieving emails: {str(e)}"]
+        return [{"error": f"Error retrieving emails: {str(e)}"}]
+
+@mcp.tool()
+@offload(concurrency=4, timeout=60)
+def search_emails(
+    email_address: str,
+    since: Optional[str] = None,
+    before: Optional[str] = None,
+    sender: Optional[str] = None,
+    recipient: Optional[str] = None,
+    subject: Optional[str] = None,
+    unread: bool = False,
+    label: Optional[str] = None,
+    text: Optional[str] = None,
+    limit: int = 20,
+    cursor: Optional[int] = None,
+) -> dict:
+    """
+    Search the inbox and return one page of matching email headers, newest first.
+    All given filters must match. Answered from the local mail index when it is enabled, on the server otherwise.
+    
+    Args:
+        email_address: The email address to check (must match GMAIL_PASSWORD account).
+        since: Only emails received on or after this date (YYYY-MM-DD).
+        before: Only emails received before this date (YYYY-MM-DD).
+        sender: Text the From header must contain.
+        recipient: Text the To header must contain.
+        subject: Text the subject must contain.
+        unread: Only unread emails.
+        label: Only emails with this Gmail label.
+        text: Text the headers or body must contain.
+        limit: Maximum number of emails in the page (default 20).
+        cursor: The `next_cursor` of the previous page, to get the next (older) page.
+    
+    Returns:
+        {"emails": [{uid, subject, sender, date}, ...], "next_cursor": int or null when there are no more matches}
+    """
+    password = os.getenv("GMAIL_PASSWORD")
+    if not password:
+        raise ValueError("GMAIL_PASSWORD not set in environment variables.")
+
+    filters = SearchFilters(since, before, sender, recipient, subject, unread, label, text)
+    try:
+        index = get_mail_index()
+        if index is not None:
+            index.refresh(email_address, pooled_session(email_address, password, "index_sync"))
+            page = index.search(email_address, filters, limit=limit, cursor=cursor)
+            if page is not None:
+                return page.to_dict()
+
+        # A UID SEARCH on the server, paged by UID (see gmail_imap.py), on a pooled IMAP session
+        page = get_mail_pool().imap(
+            email_address, password, lambda mail: search_mailbox(mail, filters, limit=limit, cursor=cursor), operation="search_emails"
+        )
+        return page.to_dict()
+    except Exception as e:
+        return {"error": f"Error searching emails: {str(e)}"}
+
+@mcp.resource("gmail://pool-stats")
+def pool_stats() -> dict:
+    """
+    Mail session pool metrics: per tool, the calls that reused a logged-in session (hits),
+    logged in anew (misses) or replaced a dropped session (reconnects), plus the sessions open now.
+    """
+    return get_mail_pool().stats()
+
+@mcp.resource("gmail://index-stats")
+def index_stats() -> dict:
+    """
+    Local mail index metrics: per mailbox, the messages indexed and when it was last synced, plus the
+    queries answered from the index, those sent to the server instead, and what the syncs downloaded.
+    """
+    index = get_mail_index()
+    return index.stats() if index is not None else {"enabled": False}
 
 if __name__ == "__main__":
     mcp.run()
@@ -0,0 +1,240 @@
+"""
+An in-memory IMAP server for the tests, standing in for imaplib.IMAP4_SSL.
+
+It covers the commands the Gmail helpers send (LOGIN, CAPABILITY, ENABLE,
+EXAMINE, FETCH, UID FETCH with CHANGEDSINCE, UID SEARCH) and answers them in
+the shapes imaplib returns. Like Gmail, it lists ENABLE, CONDSTORE and
+UTF8=ACCEPT only to authenticated clients: `capabilities` on a new
+connection is the pre-login list imaplib reads on connect, and CAPABILITY
+after login returns the full one.
+"""
+import imaplib
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Optional
+
+PRE_LOGIN = ("IMAP4REV1", "AUTH=PLAIN", "AUTH=XOAUTH2")
+GMAIL = ("IMAP4REV1", "UNSELECT", "IDLE", "NAMESPACE", "ID", "ENABLE", "CONDSTORE", "UTF8=ACCEPT", "X-GM-EXT-1")
+
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+@dataclass
+class Message:
+    uid: int
+    subject: str = "Hello"
+    sender: str = "Alice <alice@example.com>"
+    recipient: str = "me@example.com"
+    day: date = date(2026, 1, 15)
+    body: str = "Hi there"
+    flags: list[str] = field(default_factory=list)
+    labels: list[str] = field(default_factory=lambda: ["\\Inbox"])
+    modseq: int = 1
+
+    def header_lines(self) -> dict[str, str]:
+        return {
+            "SUBJECT": f"Subject: {self.subject}",
+            "FROM": f"From: {self.sender}",
+            "TO": f"To: {self.recipient}",
+            "DATE": f"Date: {self.day.strftime('%a')}, {self.day.day} {MONTHS[self.day.month - 1]} {self.day.year} 10:00:00 +0000",
+        }
+
+    def raw(self) -> bytes:
+        headers = "\r\n".join(self.header_lines().values())
+        return f"{headers}\r\nContent-Type: text/plain; charset=utf-8\r\n\r\n{self.body}\r\n".encode()
+
+
+class FakeServer:
+    def __init__(self, messages: list[Message] = (), capabilities: tuple[str, ...] = GMAIL, uidvalidity: int = 1):
+        self.messages = sorted(messages, key=lambda m: m.uid)
+        self.capabilities = capabilities
+        self.uidvalidity = uidvalidity
+        self.uidnext = max((m.uid for m in self.messages), default=0) + 1
+        self.highestmodseq = max((m.modseq for m in self.messages), default=1)
+        self.connections: list["FakeIMAP"] = []
+
+    def add(self, **fields) -> Message:
+        self.highestmodseq += 1
+        message = Message(uid=self.uidnext, modseq=self.highestmodseq, **fields)
+        self.uidnext += 1
+        self.messages.append(message)
+        return message
+
+    def set_flags(self, uid: int, flags: list[str]):
+        self.highestmodseq += 1
+        message = next(m for m in self.messages if m.uid == uid)
+        message.flags, message.modseq = flags, self.highestmodseq
+
+    def expunge(self, uid: int):
+        self.messages = [m for m in self.messages if m.uid != uid]
+
+    def connect(self, host: str = "imap.example.com", timeout: Optional[float] = None) -> "FakeIMAP":
+        """Drop-in for imaplib.IMAP4_SSL."""
+        connection = FakeIMAP(self)
+        self.connections.append(connection)
+        return connection
+
+    def commands(self) -> list[tuple]:
+        return [command for connection in self.connections for command in connection.commands]
+
+
+class FakeIMAP:
+    def __init__(self, server: FakeServer):
+        self.server = server
+        # What imaplib reads on connect, before login
+        self.capabilities = PRE_LOGIN
+        self.state = "NONAUTH"
+        self.utf8_enabled = False
+        self.condstore = False
+        self.commands: list[tuple] = []
+        self._untagged: dict[str, list] = {}
+
+    # --- Session ---
+    def login(self, user: str, password: str):
+        self.commands.append(("LOGIN", user))
+        self.state = "AUTH"
+        return "OK", [b"Logged in"]
+
+    def capability(self):
+        self.commands.append(("CAPABILITY",))
+        capabilities = self.server.capabilities if self.state != "NONAUTH" else PRE_LOGIN
+        return "OK", [" ".join(capabilities).encode()]
+
+    def enable(self, capability: str):
+        # imaplib checks its own (possibly stale) list before sending ENABLE
+        if "ENABLE" not in self.capabilities:
+            raise imaplib.IMAP4.error("Server does not support ENABLE")
+        self.commands.append(("ENABLE", capability))
+        if self.state != "AUTH" or capability not in self.server.capabilities:
+            return "NO", [b"ENABLE not allowed"]
+        if capability == "CONDSTORE":
+            self.condstore = True
+        if capability == "UTF8=ACCEPT":
+            self.utf8_enabled = True
+        return "OK", [b"Enabled"]
+
+    def select(self, mailbox: str = "INBOX", readonly: bool = False):
+        self.commands.append(("EXAMINE" if readonly else "SELECT", mailbox))
+        self.state = "SELECTED"
+        self._untagged = {
+            "UIDVALIDITY": [str(self.server.uidvalidity).encode()],
+            "UIDNEXT": [str(self.server.uidnext).encode()],
+        }
+        if self.condstore:
+            self._untagged["HIGHESTMODSEQ"] = [str(self.server.highestmodseq).encode()]
+        return "OK", [str(len(self.server.messages)).encode()]
+
+    def response(self, code: str):
+        return code, self._untagged.pop(code, [None])
+
+    def close(self):
+        self.state = "AUTH"
+        return "OK", [b""]
+
+    def noop(self):
+        return "OK", [b""]
+
+    def logout(self):
+        self.state = "LOGOUT"
+        return "BYE", [b""]
+
+    # --- FETCH ---
+    def fetch(self, message_set: str, query: str):
+        self.commands.append(("FETCH", message_set, query))
+        numbers = _message_set(message_set, len(self.server.messages))
+        return "OK", self._items([(n, self.server.messages[n - 1]) for n in sorted(numbers) if n <= len(self.server.messages)], query)
+
+    def uid(self, command: str, *args):
+        self.commands.append(("UID", command) + args)
+        top = max((m.uid for m in self.server.messages), default=0)
+        if command == "FETCH":
+            uids = _message_set(args[0], top)
+            since = None
+            if len(args) > 2:
+                since = int(re.search(r"CHANGEDSINCE (\d+)", args[2]).group(1))
+            numbered = [(n, m) for n, m in enumerate(self.server.messages, 1) if m.uid in uids]
+            if since is not None:
+                numbered = [(n, m) for n, m in numbered if m.modseq > since]
+            return "OK", self._items(numbered, args[1]) or [None]
+        if command == "SEARCH":
+            if any(not arg.isascii() for arg in args) and not self.utf8_enabled:
+                raise imaplib.IMAP4.error("non-ASCII search term without UTF8=ACCEPT")
+            hits = [m.uid for m in self.server.messages if _matches(m, list(args), top)]
+            return "OK", [" ".join(map(str, hits)).encode()]
+        raise imaplib.IMAP4.error(f"UID {command} is not supported by the fake")
+
+    def _items(self, numbered: list[tuple[int, Message]], query: str) -> list:
+        items = []
+        for number, message in numbered:
+            meta = f"{number} (UID {message.uid}"
+            if "FLAGS" in query:
+                meta += f" FLAGS ({' '.join(message.flags)})"
+            if "INTERNALDATE" in query:
+                meta += f' INTERNALDATE "{message.day.day:2d}-{MONTHS[message.day.month - 1]}-{message.day.year} 10:00:00 +0000"'
+            if "X-GM-LABELS" in query:
+                labels = " ".join('"' + label.replace("\\", "\\\\") + '"' for label in message.labels)
+                meta += f" X-GM-LABELS ({labels})"
+            if self.condstore:
+                meta += f" MODSEQ ({message.modseq})"
+            fields = re.search(r"HEADER\.FIELDS \(([^)]*)\)", query)
+            if fields:
+                lines = message.header_lines()
+                literal = ("\r\n".join(lines[name] for name in fields.group(1).split() if name in lines) + "\r\n\r\n").encode()
+                items += [(f"{meta} BODY[HEADER.FIELDS ({fields.group(1)})] {{{len(literal)}}}".encode(), literal), b")"]
+            elif "BODY.PEEK[]" in query:
+                literal = message.raw()
+                items += [(f"{meta} BODY[] {{{len(literal)}}}".encode(), literal), b")"]
+            else:
+                items.append((meta + ")").encode())
+        return items
+
+
+def _message_set(spec: str, top: int) -> set[int]:
+    """The numbers in an IMAP set like '1,4:7,9:*'; `*` is the highest, and ranges may run either way."""
+    numbers = set()
+    for part in spec.split(","):
+        first, _, last = part.partition(":")
+        low = top if first == "*" else int(first)
+        high = low if not last else top if last == "*" else int(last)
+        numbers |= set(range(min(low, high), max(low, high) + 1))
+    return numbers
+
+
+def _unquote(value: str) -> str:
+    if value.startswith('"') and value.endswith('"'):
+        return re.sub(r"\\(.)", r"\1", value[1:-1])
+    return value
+
+
+def _matches(message: Message, criteria: list[str], top: int) -> bool:
+    i = 0
+    while i < len(criteria):
+        key = criteria[i].upper()
+        if key == "ALL":
+            i += 1
+            continue
+        if key == "UNSEEN":
+            if "\\Seen" in message.flags:
+                return False
+            i += 1
+            continue
+        value = criteria[i + 1]
+        i += 2
+        if key == "UID":
+            ok = message.uid in _message_set(value, top)
+        elif key in ("SINCE", "BEFORE"):
+            day = datetime.strptime(value, "%d-%b-%Y").date()
+            ok = message.day >= day if key == "SINCE" else message.day < day
+        elif key in ("FROM", "TO", "SUBJECT", "TEXT", "X-GM-LABELS"):
+            term = _unquote(value).lower()
+            haystack = {
+                "FROM": message.sender, "TO": message.recipient, "SUBJECT": message.subject,
+                "TEXT": message.raw().decode(), "X-GM-LABELS": "\n".join(message.labels),
+            }[key].lower()
+            ok = (term in haystack.split("\n")) if key == "X-GM-LABELS" else term in haystack
+        else:
+            raise imaplib.IMAP4.error(f"SEARCH {key} is not supported by the fake")
+        if not ok:
+            return False
+    return True
@@ -0,0 +1,175 @@
+from datetime import date
+
+import pytest
+
+import gmail_imap
+from fake_imap import FakeServer, Message
+from gmail_imap import SearchFilters, build_criteria, imap_date, imap_session, quote, search_emails
+
+
+@pytest.fixture
+def connect(monkeypatch):
+    """Opens a logged-in session on a fake server, as the tools do."""
+    sessions = []
+
+    def connect(server: FakeServer):
+        monkeypatch.setattr(gmail_imap.imaplib, "IMAP4_SSL", server.connect)
+        session = imap_session("me@example.com", "secret")
+        sessions.append(session)
+        return session.__enter__()
+
+    yield connect
+    for session in sessions:
+        session.__exit__(None, None, None)
+
+
+def searched_ranges(server: FakeServer) -> list[tuple[int, int]]:
+    ranges = []
+    for command in server.commands():
+        if command[:2] == ("UID", "SEARCH"):
+            low, high = command[-1].split(":")
+            ranges.append((int(low), int(high)))
+    return ranges
+
+
+def all_pages(mail, filters: SearchFilters, limit: int) -> list[list[int]]:
+    pages, cursor = [], None
+    while True:
+        page = search_emails(mail, filters, limit=limit, cursor=cursor)
+        pages.append([e.uid for e in page.emails])
+        if page.next_cursor is None:
+            return pages
+        cursor = page.next_cursor
+
+
+# --- Criteria ---
+def test_build_criteria_without_filters_matches_all():
+    assert build_criteria(SearchFilters()) == ["ALL"]
+
+
+def test_build_criteria_with_every_filter():
+    filters = SearchFilters(
+        since="2026-01-02", before="2026-02-01", sender="bob", recipient="me@example.com",
+        subject='say "hi"', unread=True, label="Work", text="invoice",
+    )
+    assert build_criteria(filters) == [
+        "SINCE", "2-Jan-2026", "BEFORE", "1-Feb-2026", "FROM", '"bob"', "TO", '"me@example.com"',
+        "SUBJECT", '"say \\"hi\\""', "UNSEEN", "X-GM-LABELS", '"Work"', "TEXT", '"invoice"',
+    ]
+
+
+def test_build_criteria_rejects_bad_dates():
+    with pytest.raises(ValueError):
+        build_criteria(SearchFilters(since="01/02/2026"))
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2026-01-31", "31-Jan-2026"),
+    ("2026-12-01", "1-Dec-2026"),
+    ("2024-02-29", "29-Feb-2024"),
+])
+def test_imap_date(value, expected):
+    assert imap_date(value) == expected
+
+
+@pytest.mark.parametrize("value", ["31-01-2026", "2026-02-30", "2026-1-5x", ""])
+def test_imap_date_rejects_other_formats(value):
+    with pytest.raises(ValueError):
+        imap_date(value)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("plain", '"plain"'),
+    ('a "quoted" word', '"a \\"quoted\\" word"'),
+    ("back\\slash", '"back\\\\slash"'),
+    ("Café", '"Café"'),
+])
+def test_quote(value, expected):
+    assert quote(value) == expected
+
+
+@pytest.mark.parametrize("value", ["x\r\nA1 DELETE INBOX", "line\nbreak", "nul\x00", "tab\there", "del\x7f"])
+def test_quote_rejects_control_characters(value):
+    with pytest.raises(ValueError):
+        quote(value)
+
+
+# --- Windowed search ---
+def test_empty_mailbox(connect):
+    server = FakeServer([])
+    page = search_emails(connect(server), SearchFilters())
+    assert page.emails == [] and page.next_cursor is None
+    assert searched_ranges(server) == []
+
+
+def test_cursor_1_is_the_end(connect):
+    server = FakeServer([Message(uid) for uid in range(1, 6)])
+    page = search_emails(connect(server), SearchFilters(), cursor=1)
+    assert page.emails == [] and page.next_cursor is None
+    assert searched_ranges(server) == []
+
+
+def test_cursor_above_the_mailbox_starts_at_the_newest(connect):
+    server = FakeServer([Message(uid) for uid in range(1, 6)])
+    page = search_emails(connect(server), SearchFilters(), limit=2, cursor=1000)
+    assert [e.uid for e in page.emails] == [5, 4] and page.next_cursor == 4
+
+
+def test_pages_cover_every_match_once(connect):
+    server = FakeServer([Message(uid) for uid in range(1, 26)])
+    pages = all_pages(connect(server), SearchFilters(), limit=10)
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert sum(pages, []) == list(range(25, 0, -1))
+
+
+def test_page_ending_at_the_oldest_match_has_no_cursor(connect):
+    server = FakeServer([Message(uid) for uid in range(1, 5)])
+    pages = all_pages(connect(server), SearchFilters(), limit=4)
+    assert pages == [[4, 3, 2, 1]]
+
+
+def test_sparse_matches_span_several_windows(connect, monkeypatch):
+    monkeypatch.setattr(gmail_imap, "SEARCH_WINDOW", 10)
+    monkeypatch.setattr(gmail_imap, "MAX_SEARCH_WINDOW", 40)
+    needles = {3, 47, 95}
+    server = FakeServer([Message(uid, subject="needle" if uid in needles else "hay") for uid in range(1, 101)])
+    mail = connect(server)
+
+    first = search_emails(mail, SearchFilters(subject="needle"), limit=2)
+    assert [e.uid for e in first.emails] == [95, 47] and first.next_cursor == 47
+    second = search_emails(mail, SearchFilters(subject="needle"), limit=2, cursor=first.next_cursor)
+    assert [e.uid for e in second.emails] == [3] and second.next_cursor is None
+
+    ranges = searched_ranges(server)
+    # Windows double below the cursor, never overlap, and stop once the page is full
+    assert ranges == [(91, 100), (71, 90), (31, 70), (37, 46), (17, 36), (1, 16)]
+
+
+def test_filters_are_evaluated_by_the_server(connect):
+    server = FakeServer([
+        Message(1, sender="Bob <bob@example.com>", day=date(2026, 1, 10)),
+        Message(2, sender="Bob <bob@example.com>", day=date(2026, 2, 10), flags=["\\Seen"]),
+        Message(3, sender="Bob <bob@example.com>", day=date(2026, 2, 11), labels=["\\Inbox", "Work"]),
+        Message(4, sender="Carol <carol@example.com>", day=date(2026, 2, 12)),
+    ])
+    mail = connect(server)
+    uids = lambda **filters: [e.uid for e in search_emails(mail, SearchFilters(**filters)).emails]
+    assert uids(sender="bob", since="2026-02-01") == [3, 2]
+    assert uids(sender="bob", unread=True) == [3, 1]
+    assert uids(label="Work") == [3]
+    assert uids(before="2026-02-11") == [2, 1]
+
+
+# --- Non-ASCII terms ---
+def test_non_ascii_terms_enable_utf8_after_login(connect):
+    server = FakeServer([Message(1, sender="José <jose@example.com>"), Message(2)])
+    mail = connect(server)
+    page = search_emails(mail, SearchFilters(sender="José"))
+    assert [e.uid for e in page.emails] == [1]
+    assert ("ENABLE", "UTF8=ACCEPT") in server.commands()
+
+
+def test_non_ascii_terms_need_utf8_accept(connect):
+    server = FakeServer([Message(1)], capabilities=("IMAP4REV1", "ENABLE"))
+    with pytest.raises(ValueError, match="non-ASCII"):
+        search_emails(connect(server), SearchFilters(subject="Café"))
@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+
+import gmail_imap
+import mail_pool
+from fake_imap import PRE_LOGIN, FakeServer, Message
+from gmail_imap import SearchFilters, imap_session
+from mail_index import MailIndex
+
+ACCOUNT = "me@example.com"
+
+
+@pytest.fixture
+def server(monkeypatch) -> FakeServer:
+    server = FakeServer([Message(uid, subject=f"Message {uid}") for uid in range(1, 31)])
+    monkeypatch.setattr(gmail_imap.imaplib, "IMAP4_SSL", server.connect)
+    return server
+
+
+@pytest.fixture
+def index(tmp_path) -> MailIndex:
+    return MailIndex(tmp_path / "index.sqlite", max_age=0)
+
+
+def session(fn):
+    with imap_session(ACCOUNT, "secret") as mail:
+        return fn(mail)
+
+
+def flag_fetches(server: FakeServer) -> list[tuple]:
+    return [c for c in server.commands() if c[:2] == ("UID", "FETCH") and "BODY" not in c[3]]
+
+
+# --- Capabilities ---
+def test_imap_session_reloads_capabilities_after_login(server):
+    with imap_session(ACCOUNT, "secret") as mail:
+        assert "CONDSTORE" in mail.capabilities and "UTF8=ACCEPT" in mail.capabilities
+    assert server.connections[0].capabilities != PRE_LOGIN
+
+
+def test_pool_connection_reloads_capabilities_after_login(server, monkeypatch):
+    monkeypatch.setattr(mail_pool.imaplib, "IMAP4_SSL", server.connect)
+    mail = mail_pool.connect_imap(ACCOUNT, "secret")
+    assert "ENABLE" in mail.capabilities and "X-GM-EXT-1" in mail.capabilities
+
+
+def test_incremental_sync_uses_changedsince(server, index):
+    index.refresh(ACCOUNT, session, rebuild="now")
+    server.set_flags(7, ["\\Seen"])
+    server.add(subject="Newest")
+
+    changes = index.refresh(ACCOUNT, session, force=True, rebuild="now")
+
+    assert changes
+    fetches = flag_fetches(server)
+    # Only the messages whose MODSEQ moved are asked for, not every indexed one
+    assert fetches and all("CHANGEDSINCE" in " ".join(c[2:]) for c in fetches)
+    stats = index.stats()
+    # The flagged message, and the new one, whose MODSEQ is past the stored HIGHESTMODSEQ too
+    assert stats["flag_updates"] == 2 and stats["fetched"] == 31
+    unread = [e.uid for e in index.search(ACCOUNT, SearchFilters(unread=True), limit=50).emails]
+    assert 7 not in unread and len(unread) == 30
+    assert index.recent(ACCOUNT, 1)[0].subject == "Newest"
+
+
+def test_unchanged_mailbox_sends_no_flag_fetch(server, index):
+    index.refresh(ACCOUNT, session, rebuild="now")
+    index.refresh(ACCOUNT, session, force=True, rebuild="now")
+    assert flag_fetches(server) == []
+
+
+def test_without_condstore_flags_are_fetched_for_the_indexed_range(monkeypatch, index):
+    server = FakeServer([Message(uid) for uid in range(1, 11)], capabilities=("IMAP4REV1",))
+    monkeypatch.setattr(gmail_imap.imaplib, "IMAP4_SSL", server.connect)
+    index.refresh(ACCOUNT, session, rebuild="now")
+    server.set_flags(3, ["\\Seen"])
+    index.refresh(ACCOUNT, session, force=True, rebuild="now")
+    assert [c[2] for c in flag_fetches(server)] == ["1:*"]
+    assert index.search(ACCOUNT, SearchFilters(unread=True)).emails[-1].uid == 1
+
+
+# --- Full builds stay out of the calls ---
+def test_first_refresh_builds_in_the_background(server, index):
+    release = threading.Event()
+
+    def slow_session(fn):
+        release.wait(5)
+        return session(fn)
+
+    assert index.refresh(ACCOUNT, slow_session) is False
+    # Not indexed yet: the caller asks the server
+    assert index.recent(ACCOUNT, 5) is None
+    assert index.stats()["building"] == [f"{ACCOUNT}/inbox"]
+    # Another call does not wait for the build either
+    assert index.refresh(ACCOUNT, slow_session) is False
+
+    release.set()
+    # A call that must have the index waits for the running build instead of starting its own
+    index.refresh(ACCOUNT, session, rebuild="now")
+    assert [e.uid for e in index.recent(ACCOUNT, 3)] == [30, 29, 28]
+    assert index.stats()["builds"] == 1
+
+
+def test_new_uidvalidity_drops_the_mailbox_until_rebuilt(server, index):
+    index.refresh(ACCOUNT, session, rebuild="now")
+    server.uidvalidity = 2
+
+    assert index.refresh(ACCOUNT, session, rebuild="never") is False
+    # The stored UIDs name other messages now, so nothing is answered from them
+    assert index.recent(ACCOUNT, 5) is None
+    assert index.search(ACCOUNT, SearchFilters()) is None
+
+    index.refresh(ACCOUNT, session, rebuild="now")
+    assert index.stats()["mailboxes"][f"{ACCOUNT}/inbox"]["uidvalidity"] == 2
+
+
+def test_expunged_messages_leave_the_index(server, index):
+    index.refresh(ACCOUNT, session, rebuild="now")
+    server.expunge(30)
+    server.expunge(4)
+    index.refresh(ACCOUNT, session, force=True, rebuild="now")
+    uids = [e.uid for e in index.search(ACCOUNT, SearchFilters(), limit=50).emails]
+    assert 30 not in uids and 4 not in uids and len(uids) == 28
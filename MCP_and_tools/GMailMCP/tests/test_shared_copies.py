@@ -0,0 +1,24 @@
+"""
+Some modules are shared with other projects in this repository as verbatim copies, so each
+project stays runnable on its own. These checks fail as soon as a copy drifts: change the
+module here and copy it over in the same commit.
+"""
+from pathlib import Path
+
+import pytest
+
+HERE = Path(__file__).resolve().parents[1]
+REPO = HERE.parents[1]
+
+# module -> the projects holding a copy of it
+SHARED = {
+    "gmail_imap.py": ["MCP_and_tools/Skills_and_Tools/GmailSkill/scripts"],
+    "mail_index.py": ["MCP_and_tools/Skills_and_Tools/GmailSkill/scripts"],
+    "mail_pool.py": ["CodeFirst_Libraries/PydanticAI"],
+}
+
+
+@pytest.mark.parametrize("module, project", [(m, p) for m, projects in SHARED.items() for p in projects])
+def test_copy_is_identical(module, project):
+    copy = REPO / project / module
+    assert copy.read_bytes() == (HERE / module).read_bytes(), f"{project}/{module} differs from the GMailMCP copy"
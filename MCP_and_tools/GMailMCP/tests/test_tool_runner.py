@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("fastmcp")
+
+from fastmcp.exceptions import ToolError
+
+from tool_runner import offload
+
+
+class Gate:
+    """A blocking tool body that runs until released, counting the threads inside it."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.calls = 0
+
+    def __call__(self) -> str:
+        with self.lock:
+            self.calls += 1
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            self.release.wait(5)
+            return "done"
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def test_timed_out_call_keeps_its_slot_until_the_thread_finishes():
+    gate = Gate()
+
+    def slow_tool():
+        return gate()
+
+    tool = offload(concurrency=1, timeout=0.1)(slow_tool)
+
+    async def run():
+        with pytest.raises(ToolError, match="timed out"):
+            await tool()
+        # The first thread is still inside the call, so the only slot is taken
+        with pytest.raises(ToolError, match="timed out"):
+            await tool()
+        assert gate.calls == 1
+        gate.release.set()
+        while gate.running:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+        return await tool()
+
+    assert asyncio.run(run()) == "done"
+    assert gate.peak == 1
+
+
+def test_concurrency_limits_the_threads_doing_io():
+    gate = Gate()
+
+    def busy_tool():
+        return gate()
+
+    tool = offload(concurrency=2, timeout=5)(busy_tool)
+
+    async def run():
+        calls = [asyncio.create_task(tool()) for _ in range(5)]
+        await asyncio.sleep(0.1)
+        assert gate.running == 2
+        gate.release.set()
+        return await asyncio.gather(*calls)
+
+    assert asyncio.run(run()) == ["done"] * 5
+    assert gate.peak == 2
+
+
+def test_no_timeout_ignores_the_environment(monkeypatch):
+    monkeypatch.setenv("UNBOUNDED_TOOL_TIMEOUT", "0.01")
+
+    def unbounded_tool():
+        time.sleep(0.2)
+        return "sent"
+
+    tool = offload(concurrency=1, timeout=None)(unbounded_tool)
+    assert asyncio.run(tool()) == "sent"
+
+
+def test_tool_errors_reach_the_caller():
+    def failing_tool():
+        raise ValueError("bad input")
+
+    tool = offload(concurrency=1, timeout=1)(failing_tool)
+
+    async def run():
+        with pytest.raises(ValueError, match="bad input"):
+            await tool()
+        # And the slot is free again
+        with pytest.raises(ValueError):
+            await tool()
+
+    asyncio.run(run())
@@ -0,0 +1,70 @@
+"""
+Non-blocking tool execution.
+
+The Gmail tools do blocking socket I/O (imaplib, smtplib). Called directly
+from the server's event loop, one slow IMAP fetch would stall every other
+request. `offload` turns such a function into an async tool: the call runs
+in a bounded thread pool shared by all tools (MCP_MAX_WORKERS threads,
+default 8), so calls from parallel clients overlap.
+
+Each tool also gets its own concurrency limit and timeout, set in the
+decorator and overridable per tool with <TOOL>_CONCURRENCY and
+<TOOL>_TIMEOUT (e.g. SEARCH_EMAILS_TIMEOUT=120). The timeout covers waiting
+for a slot as well as the call. A thread cannot be interrupted, so a call that
+times out finishes in the background, but the client gets its error
+straight away; its slot stays taken until the thread is done, so the limit
+holds for the threads actually doing I/O.
+
+A timeout error invites a retry, so tools that must not run twice (sending
+mail) are offloaded with timeout=None: they have no call timeout, and the
+socket timeouts of their connections bound them instead.
+
+    @mcp.tool()
+    @offload(concurrency=4, timeout=60)
+    def get_recent_emails(...): ...
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from fastmcp.exceptions import ToolError
+
+
+@functools.lru_cache(maxsize=None)
+def get_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=int(os.environ.get("MCP_MAX_WORKERS", "8")), thread_name_prefix="mcp-tool")
+
+
+def offload(concurrency: int = 4, timeout: Optional[float] = 60.0):
+    """Runs a blocking tool in the shared thread pool, at most `concurrency` calls at a time, within `timeout` seconds (None: no limit)."""
+    def decorator(func: Callable):
+        name = func.__name__.upper()
+        limit = int(os.environ.get(f"{name}_CONCURRENCY", concurrency))
+        seconds = float(os.environ.get(f"{name}_TIMEOUT", timeout)) if timeout is not None else None
+        slots = asyncio.Semaphore(limit)
+
+        def release(future: asyncio.Future):
+            slots.release()
+            # Consumed here, as nobody awaits a call that timed out
+            if not future.cancelled():
+                future.exception()
+
+        # functools.wraps keeps the signature and docstring FastMCP builds the tool schema from
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + seconds if seconds is not None else None
+            try:
+                async with asyncio.timeout_at(deadline):
+                    await slots.acquire()
+                    future = loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+                    # The slot is given back when the thread finishes, not when the caller stops waiting
+                    future.add_done_callback(release)
+                    return await asyncio.shield(future)
+            except TimeoutError:
+                raise ToolError(f"{func.__name__} timed out after {seconds:g}s") from None
+
+        return wrapper
+    return decorator
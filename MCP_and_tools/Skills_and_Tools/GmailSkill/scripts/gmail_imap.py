@@ -0,0 +1,309 @@
+"""
+Gmail IMAP helpers.
+
+Shared by the MCP server (GMailMCP/main.py) and the Gmail skill
+(GmailSkill/scripts/manage_emails.py); the two copies are kept identical.
+
+Listing emails only needs a few header fields, so `fetch_headers` asks for
+exactly those with `BODY.PEEK[HEADER.FIELDS (...)]` for a whole sequence or
+UID range in one FETCH, instead of one `RFC822` fetch (full body and
+attachments) per message. PEEK leaves the messages unread. The returned
+headers are parsed with a header-only parser.
+
+`search_emails` compiles `SearchFilters` (dates, from, to, subject, text,
+unread, Gmail label) to a server-side UID SEARCH and pages through the matches with a
+UID cursor. Each SEARCH is limited to a window of UIDs below the cursor,
+widened until a page is full, so a response never lists more than a window of
+the mailbox, however broad the filters.
+"""
+import imaplib
+import re
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from email.header import decode_header
+from email.parser import BytesHeaderParser
+from typing import Iterator, Optional
+
+IMAP_HOST = "imap.gmail.com"
+
+# Header fields fetched for every email listed
+HEADER_FIELDS = ("SUBJECT", "FROM", "DATE")
+
+UID_PATTERN = re.compile(rb"\bUID (\d+)")
+
+# First UID window searched for a page, and how far it can grow; windows double until the page is full
+SEARCH_WINDOW = 2000
+MAX_SEARCH_WINDOW = 256000
+
+# IMAP dates use English month names whatever the locale
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+@dataclass
+class EmailSummary:
+    """The headers of one email, as returned by the tools."""
+    uid: int
+    subject: str
+    sender: str
+    date: str
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def decode_value(value: Optional[str]) -> str:
+    """Decodes an RFC 2047 encoded header value (e.g. '=?utf-8?b?...?=') to text."""
+    if not value:
+        return ""
+    decoded = ""
+    for part, encoding in decode_header(value):
+        if isinstance(part, bytes):
+            try:
+                decoded += part.decode(encoding or "utf-8", errors="ignore")
+            except LookupError:
+                decoded += part.decode("utf-8", errors="ignore")
+        else:
+            decoded += part
+    return decoded
+
+
+def parse_fetch(data: list) -> list[tuple[int, bytes]]:
+    """
+    (UID, header bytes) for every message of a FETCH response. imaplib returns each
+    message as a (metadata, literal) tuple; the server may put the UID before the
+    literal or in the bytes that close the message.
+    """
+    records = []
+    for item in data:
+        if isinstance(item, tuple):
+            match = UID_PATTERN.search(item[0])
+            records.append([int(match.group(1)) if match else None, item[1]])
+        elif isinstance(item, bytes) and records and records[-1][0] is None:
+            match = UID_PATTERN.search(item)
+            if match:
+                records[-1][0] = int(match.group(1))
+    return [(uid, raw) for uid, raw in records if uid is not None]
+
+
+def parse_summary(uid: int, raw: bytes) -> EmailSummary:
+    headers = BytesHeaderParser().parsebytes(raw)
+    return EmailSummary(
+        uid=uid,
+        subject=decode_value(headers["Subject"]) or "(No Subject)",
+        sender=decode_value(headers["From"]),
+        date=decode_value(headers["Date"]),
+    )
+
+
+def fetch_headers(mail: imaplib.IMAP4, message_set: str, by_uid: bool = True) -> list[EmailSummary]:
+    """
+    Fetches the summary headers of every message in `message_set` (UIDs, or
+    sequence numbers with by_uid=False, e.g. '120:129') in a single FETCH.
+    Returns them newest first.
+    """
+    query = f"(UID BODY.PEEK[HEADER.FIELDS ({' '.join(HEADER_FIELDS)})])"
+    status, data = mail.uid("FETCH", message_set, query) if by_uid else mail.fetch(message_set, query)
+    if status != "OK":
+        raise imaplib.IMAP4.error(f"FETCH failed: {data}")
+    summaries = [parse_summary(uid, raw) for uid, raw in parse_fetch(data)]
+    return sorted(summaries, key=lambda s: s.uid, reverse=True)
+
+
+def login(mail: imaplib.IMAP4, email_address: str, password: str):
+    """
+    Logs in, then reloads the capability list. imaplib reads it once, on
+    connect, and Gmail lists ENABLE, CONDSTORE and UTF8=ACCEPT only to
+    authenticated clients, so the checks against `mail.capabilities` need the
+    list from after login.
+    """
+    mail.login(email_address, password)
+    status, data = mail.capability()
+    if status == "OK" and data and data[-1]:
+        mail.capabilities = tuple(data[-1].decode().upper().split())
+
+
+@contextmanager
+def imap_session(email_address: str, password: str, host: str = IMAP_HOST, timeout: float = 30.0) -> Iterator[imaplib.IMAP4]:
+    """A logged-in IMAP connection, logged out on exit; socket operations give up after `timeout` seconds."""
+    mail = imaplib.IMAP4_SSL(host, timeout=timeout)
+    try:
+        login(mail, email_address, password)
+        yield mail
+    finally:
+        try:
+            mail.logout()
+        except (imaplib.IMAP4.error, OSError):
+            pass
+
+
+@dataclass
+class MailboxState:
+    """What SELECT reports about a mailbox; highestmodseq is only set once CONDSTORE is enabled."""
+    exists: int
+    uidvalidity: Optional[int]
+    uidnext: Optional[int]
+    highestmodseq: Optional[int] = None
+
+
+def _response_int(mail: imaplib.IMAP4, code: str) -> Optional[int]:
+    _, data = mail.response(code)
+    return int(data[-1]) if data and data[-1] is not None else None
+
+
+def select(mail: imaplib.IMAP4, mailbox: str = "inbox") -> MailboxState:
+    """Opens a mailbox read-only (EXAMINE)."""
+    status, data = mail.select(mailbox, readonly=True)
+    if status != "OK":
+        raise imaplib.IMAP4.error(f"Cannot open mailbox {mailbox}: {data}")
+    return MailboxState(
+        int(data[0]), _response_int(mail, "UIDVALIDITY"), _response_int(mail, "UIDNEXT"), _response_int(mail, "HIGHESTMODSEQ")
+    )
+
+
+def recent_emails(mail: imaplib.IMAP4, count: int = 10, mailbox: str = "inbox") -> list[EmailSummary]:
+    """
+    The headers of the last `count` emails of a mailbox, newest first. The
+    newest messages have the highest sequence numbers, so this is one FETCH
+    of the range ending at the message count, with no SEARCH.
+    """
+    exists = select(mail, mailbox).exists
+    if exists == 0 or count <= 0:
+        return []
+    return fetch_headers(mail, f"{max(1, exists - count + 1)}:{exists}", by_uid=False)
+
+
+# --- Search ---
+@dataclass
+class SearchFilters:
+    """
+    Server-side filters; every one that is set must match.
+    since/before: dates as YYYY-MM-DD (since is inclusive, before exclusive).
+    sender/recipient/subject: substrings of the From, To and Subject headers.
+    unread: only unread emails. label: a Gmail label (X-GM-LABELS).
+    text: a substring of the headers or body.
+    """
+    since: Optional[str] = None
+    before: Optional[str] = None
+    sender: Optional[str] = None
+    recipient: Optional[str] = None
+    subject: Optional[str] = None
+    unread: bool = False
+    label: Optional[str] = None
+    text: Optional[str] = None
+
+
+@dataclass
+class SearchPage:
+    emails: list[EmailSummary] = field(default_factory=list)
+    # Pass back as `cursor` for the next (older) page; None once there are no more matches
+    next_cursor: Optional[int] = None
+
+    def to_dict(self) -> dict:
+        return {"emails": [e.to_dict() for e in self.emails], "next_cursor": self.next_cursor}
+
+
+def imap_date(value: str) -> str:
+    """'2026-01-31' -> '31-Jan-2026'."""
+    try:
+        day = datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"Dates must be YYYY-MM-DD, got {value!r}") from None
+    return f"{day.day}-{MONTHS[day.month - 1]}-{day.year}"
+
+
+def quote(value: str) -> str:
+    """
+    An IMAP quoted string. imaplib sends arguments as they are, so a CR or LF
+    in a search term would end the command and start another one: control
+    characters are refused rather than escaped.
+    """
+    if any(ord(char) < 32 or ord(char) == 127 for char in value):
+        raise ValueError(f"Search terms cannot contain control characters: {value!r}")
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def build_criteria(filters: SearchFilters) -> list[str]:
+    """The SEARCH criteria for the filters (ALL when none are set)."""
+    criteria = []
+    if filters.since:
+        criteria += ["SINCE", imap_date(filters.since)]
+    if filters.before:
+        criteria += ["BEFORE", imap_date(filters.before)]
+    if filters.sender:
+        criteria += ["FROM", quote(filters.sender)]
+    if filters.recipient:
+        criteria += ["TO", quote(filters.recipient)]
+    if filters.subject:
+        criteria += ["SUBJECT", quote(filters.subject)]
+    if filters.unread:
+        criteria.append("UNSEEN")
+    if filters.label:
+        criteria += ["X-GM-LABELS", quote(filters.label)]
+    if filters.text:
+        criteria += ["TEXT", quote(filters.text)]
+    return criteria or ["ALL"]
+
+
+def _enable_utf8(mail: imaplib.IMAP4, filters: SearchFilters):
+    """
+    Non-ASCII search terms are sent as UTF-8, which needs UTF8=ACCEPT (enabled
+    before SELECT). Gmail lists it only after login, so `mail` must come from
+    `login` or `imap_session`, which reload the capabilities.
+    """
+    terms = [filters.sender, filters.recipient, filters.subject, filters.label, filters.text]
+    if all(term is None or term.isascii() for term in terms) or mail.utf8_enabled:
+        return
+    if "UTF8=ACCEPT" not in mail.capabilities:
+        raise ValueError("This server does not accept non-ASCII search terms")
+    mail.enable("UTF8=ACCEPT")
+
+
+def _uid_search(mail: imaplib.IMAP4, criteria: list[str], low: int, high: int) -> list[int]:
+    status, data = mail.uid("SEARCH", *criteria, "UID", f"{low}:{high}")
+    if status != "OK":
+        raise imaplib.IMAP4.error(f"SEARCH failed: {data}")
+    # The server answers every UID in the range with `UID low:high`; keep only the ones really in it
+    return [uid for uid in map(int, b" ".join(data).split()) if low <= uid <= high]
+
+
+def _highest_uid(mail: imaplib.IMAP4, state: MailboxState) -> int:
+    if state.uidnext is not None:
+        return state.uidnext - 1
+    if state.exists == 0:
+        return 0
+    # No UIDNEXT in the SELECT response: ask for the UID of the last message
+    status, data = mail.fetch(str(state.exists), "(UID)")
+    match = UID_PATTERN.search(data[0]) if status == "OK" and data and data[0] else None
+    return int(match.group(1)) if match else 0
+
+
+def search_emails(
+    mail: imaplib.IMAP4,
+    filters: SearchFilters,
+    limit: int = 20,
+    cursor: Optional[int] = None,
+    mailbox: str = "inbox",
+) -> SearchPage:
+    """
+    One page of the emails matching `filters`, newest first: at most `limit`
+    emails with a UID below `cursor` (from the previous page's next_cursor).
+    """
+    criteria = build_criteria(filters)
+    _enable_utf8(mail, filters)
+    state = select(mail, mailbox)
+    high = min(cursor - 1, _highest_uid(mail, state)) if cursor is not None else _highest_uid(mail, state)
+    matches: list[int] = []
+    window = SEARCH_WINDOW
+    while high >= 1 and len(matches) < limit:
+        low = max(1, high - window + 1)
+        matches += sorted(_uid_search(mail, criteria, low, high), reverse=True)
+        high = low - 1
+        window = min(window * 2, MAX_SEARCH_WINDOW)
+
+    page = matches[:limit]
+    if not page:
+        return SearchPage()
+    emails = fetch_headers(mail, ",".join(map(str, page)))
+    more = len(matches) > limit or high >= 1
+    return SearchPage(emails, page[-1] if more else None)
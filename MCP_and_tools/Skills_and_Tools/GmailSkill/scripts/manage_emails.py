@@ -1,24 +1,32 @@
 import argparse
-import smtplib
-import imaplib
-import email
-from email.header import decode_header
-from email.message import EmailMessage
 import os
 import sys
-from dotenv import load_dotenv
 from pathlib import Path
+from typing import Optional
 
-# Load environment variables
-# Try loading from the current directory, and also specific locations
-load_dotenv() # Defaults
-env_path = Path(__file__).parent / ".env"
-load_dotenv(dotenv_path=env_path)
+# The script runs once per action, so startup time counts: the mail and dotenv
+# modules are imported by the commands that need them, not at module load.
+
+def load_env():
+    """
+    Loads environment variables from .env files unless GMAIL_PASSWORD is already set.
+    Tries the current directory, and also the script's directory.
+    """
+    if os.getenv("GMAIL_PASSWORD"):
+        return
+    from dotenv import load_dotenv
+
+    load_dotenv() # Defaults
+    env_path = Path(__file__).parent / ".env"
+    load_dotenv(dotenv_path=env_path)
 
 def send_email(sender: str, recipient: str, title: str, body: str) -> str:
     """
     Send an email using Gmail SMTP.
     """
+    import smtplib
+    from email.message import EmailMessage
+
     password = os.getenv("GMAIL_PASSWORD")
     if not password:
         print("Error: GMAIL_PASSWORD not set in environment variables.", file=sys.stderr)
@@ -41,66 +49,110 @@ def send_email(sender: str, recipient: str, title: str, body: str) -> str:
     except Exception as e:
         return f"Error sending email: {str(e)}"
 
-def get_recent_emails(email_address: str) -> list[str]:
+def new_session(email_address: str, password: str):
+    """Runs a function on a new IMAP session, for syncing the mail index."""
+    from gmail_imap import imap_session
+
+    def run(fn):
+        with imap_session(email_address, password) as mail:
+            return fn(mail)
+    return run
+
+def get_recent_emails(email_address: str, count: int = 10) -> list[dict]:
     """
-    Retrieve the titles of the last 10 emails from the inbox.
+    Retrieve the headers (uid, subject, sender, date) of the most recent emails in the inbox, newest first.
     """
+    from gmail_imap import imap_session, recent_emails
+    from mail_index import get_mail_index
+
     password = os.getenv("GMAIL_PASSWORD")
     if not password:
         print("Error: GMAIL_PASSWORD not set in environment variables.", file=sys.stderr)
-        return ["Error: GMAIL_PASSWORD not set"]
+        return [{"error": "Error: GMAIL_PASSWORD not set"}]
     
     try:
-        # Connect to Gmail IMAP server
-        mail = imaplib.IMAP4_SSL("imap.gmail.com")
-        mail.login(email_address, password)
-        
-        # Select the 'inbox'
-        mail.select("inbox")
-        
-        # Search for all emails
-        status, messages = mail.search(None, "ALL")
-        if status != "OK":
-            return ["Error retrieving emails: IMAP search failed"]
-        
-        # Get the list of email IDs
-        email_ids = messages[0].split()
-        
-        # Get the last 10 email IDs (or fewer if less than 10 exist)
-        last_10_ids = email_ids[-10:] if len(email_ids) >= 10 else email_ids
-        
-        titles = []
-        # Fetch in reverse order (newest first)
-        for e_id in reversed(last_10_ids):
-            status, msg_data = mail.fetch(e_id, "(RFC822)")
-            if status != "OK":
-                continue
-            
-            for response_part in msg_data:
-                if isinstance(response_part, tuple):
-                    msg = email.message_from_bytes(response_part[1])
-                    subject = msg["Subject"]
-                    if subject:
-                        decoded_list = decode_header(subject)
-                        subject_str = ""
-                        for decoded_part, encoding in decoded_list:
-                            if isinstance(decoded_part, bytes):
-                                subject_str += decoded_part.decode(encoding if encoding else "utf-8", errors="ignore")
-                            else:
-                                subject_str += decoded_part
-                        titles.append(subject_str)
-                    else:
-                        titles.append("(No Subject)")
-                    
-        mail.logout()
-        # Print titles for the CLI output
-        for title in titles:
-            print(f"- {title}")
-        return titles
+        summaries = None
+        index = get_mail_index()
+        if index is not None:
+            # From the local index shared with the MCP server, synced incrementally (see mail_index.py).
+            # The script exits after answering, so a mailbox not indexed yet is left to `sync-index`.
+            index.refresh(email_address, new_session(email_address, password), rebuild="never")
+            summaries = index.recent(email_address, count)
+        if summaries is None:
+            # One header-only FETCH for the last `count` messages of the inbox (see gmail_imap.py)
+            with imap_session(email_address, password) as mail:
+                summaries = recent_emails(mail, count)
+        emails = [summary.to_dict() for summary in summaries]
+        # Print the emails for the CLI output
+        print_emails(emails)
+        return emails
     except Exception as e:
         err = f"Error retrieving emails: {str(e)}"
         print(err, file=sys.stderr)
-        return [err]
+        return [{"error": err}]
+
+def search_emails(email_address: str, filters, limit: int = 20, cursor: Optional[int] = None) -> dict:
+    """
+    Search the inbox (the local mail index when enabled, UID SEARCH on the server otherwise)
+    and return one page of matching email headers, newest first.
+    """
+    from gmail_imap import imap_session, search_emails as search_mailbox
+    from mail_index import get_mail_index
+
+    password = os.getenv("GMAIL_PASSWORD")
+    if not password:
+        print("Error: GMAIL_PASSWORD not set in environment variables.", file=sys.stderr)
+        return {"error": "Error: GMAIL_PASSWORD not set"}
+
+    try:
+        page = None
+        index = get_mail_index()
+        if index is not None:
+            index.refresh(email_address, new_session(email_address, password), rebuild="never")
+            page = index.search(email_address, filters, limit=limit, cursor=cursor)
+        if page is None:
+            with imap_session(email_address, password) as mail:
+                page = search_mailbox(mail, filters, limit=limit, cursor=cursor)
+        page = page.to_dict()
+        print_emails(page["emails"])
+        if page["next_cursor"] is not None:
+            print(f"More results: rerun with --cursor {page['next_cursor']}")
+        return page
+    except Exception as e:
+        err = f"Error searching emails: {str(e)}"
+        print(err, file=sys.stderr)
+        return {"error": err}
+
+def sync_index(email_address: str) -> dict:
+    """
+    Bring the local mail index up to date now, whatever MAIL_INDEX_MAX_AGE says.
+    """
+    from mail_index import get_mail_index
+
+    password = os.getenv("GMAIL_PASSWORD")
+    if not password:
+        print("Error: GMAIL_PASSWORD not set in environment variables.", file=sys.stderr)
+        return {"error": "Error: GMAIL_PASSWORD not set"}
+    index = get_mail_index()
+    if index is None:
+        print("Error: the mail index is off; set MAIL_INDEX=1 (or a file path) to enable it.", file=sys.stderr)
+        return {"error": "Error: MAIL_INDEX not set"}
+
+    try:
+        index.refresh(email_address, new_session(email_address, password), force=True, rebuild="now")
+        stats = index.stats()
+        for name, mailbox in stats["mailboxes"].items():
+            print(f"{name}: {mailbox['messages']} messages indexed ({'whole mailbox' if mailbox['complete'] else 'newest only'})")
+        print(f"Downloaded {stats['fetched']} message(s), updated flags of {stats['flag_updates']}, removed {stats['expunged']}")
+        return stats
+    except Exception as e:
+        err = f"Error syncing the mail index: {str(e)}"
+        print(err, file=sys.stderr)
+        return {"error": err}
+
+def print_emails(emails: list[dict]):
+    for item in emails:
+        print(f"- {item['subject']} | From: {item['sender']} | Date: {item['date']} | UID: {item['uid']}")
 
 def main():
     parser = argparse.ArgumentParser(description="Gmail Actions Skill")
@@ -114,16 +166,43 @@ def main():
     send_parser.add_argument("--body", required=True, help="Email body")
 
     # Get recent emails command
-    get_parser = subparsers.add_parser("get-recent", help="Get recent 10 emails")
+    get_parser = subparsers.add_parser("get-recent", help="Get the most recent emails")
     get_parser.add_argument("--email-address", required=True, help="Email address to check")
+    get_parser.add_argument("--count", type=int, default=10, help="Number of emails to list (default 10)")
+
+    # Search emails command
+    search_parser = subparsers.add_parser("search", help="Search emails, one page at a time")
+    search_parser.add_argument("--email-address", required=True, help="Email address to check")
+    search_parser.add_argument("--since", help="Only emails received on or after this date (YYYY-MM-DD)")
+    search_parser.add_argument("--before", help="Only emails received before this date (YYYY-MM-DD)")
+    search_parser.add_argument("--from", dest="sender", help="Text the From header must contain")
+    search_parser.add_argument("--to", dest="recipient", help="Text the To header must contain")
+    search_parser.add_argument("--subject", help="Text the subject must contain")
+    search_parser.add_argument("--unread", action="store_true", help="Only unread emails")
+    search_parser.add_argument("--label", help="Only emails with this Gmail label")
+    search_parser.add_argument("--text", help="Text the headers or body must contain")
+    search_parser.add_argument("--limit", type=int, default=20, help="Emails per page (default 20)")
+    search_parser.add_argument("--cursor", type=int, help="Cursor printed by the previous page, for the next (older) page")
+
+    # Sync the local mail index command
+    sync_parser = subparsers.add_parser("sync-index", help="Bring the local mail index (MAIL_INDEX) up to date")
+    sync_parser.add_argument("--email-address", required=True, help="Email address to index")
 
     args = parser.parse_args()
+    load_env()
 
     if args.command == "send":
         result = send_email(args.sender, args.recipient, args.title, args.body)
         print(result)
     elif args.command == "get-recent":
-        get_recent_emails(args.email_address)
+        get_recent_emails(args.email_address, args.count)
+    elif args.command == "search":
+        from gmail_imap import SearchFilters
+
+        filters = SearchFilters(args.since, args.before, args.sender, args.recipient, args.subject, args.unread, args.label, args.text)
+        search_emails(args.email_address, filters, args.limit, args.cursor)
+    elif args.command == "sync-index":
+        sync_index(args.email_address)
     else:
         parser.print_help()
         sys.exit(1)
@@ -1,12 +1,21 @@
 import os
+import argparse
+import asyncio
+from functools import lru_cache
 from typing import Annotated, TypedDict
 
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 
+from history import build_history_compactor, with_summary
+from instrumentation import metrics_config
+from metrics import dump_metrics
+from models import awarm_up, chat_model
+from streaming import print_token_stream
+
 # --- Configuration ---
 load_dotenv()
 
@@ -16,51 +25,85 @@ if not os.environ.get("OPENAI_API_KEY"):
 # --- State Definition ---
 class State(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
+    summary: str # Running summary of the turns folded out of `messages`
 
 # --- LLM Setup ---
-try:
-    llm = ChatOpenAI(
-        model="gpt-5-nano",
-        temperature=0.1,
-    )
-except Exception as e:
-    print(f"Error initializing ChatOpenAI: {e}")
-    llm = None
+# Declared here, built on first use on the shared HTTP pool (see models.py)
+llm = chat_model("gpt-5-nano", temperature=0.1)
+
+# --- Conversation History ---
+# Older turns are folded into `summary` (by gpt-5-nano) so long sessions stay within HISTORY_MAX_TURNS / HISTORY_MAX_TOKENS.
+history = build_history_compactor(llm)
 
 # --- Node Definitions ---
 def chatbot(state: State):
-    if llm is None:
-        return {"messages": [SystemMessage(content="Error: LLM not initialized. Check API key.")]}
-    
-    messages = state["messages"]
-    response = llm.invoke(messages)
+    response = llm.invoke(with_summary(state))
     return {"messages": [response]}
 
+async def achatbot(state: State):
+    response = await llm.ainvoke(with_summary(state))
+    return {"messages": [response]}
+
+def compact_history_node(state: State):
+    """
+    Runs first on every turn: folds old turns into the running summary once the session is over budget.
+    """
+    return history.compact(state)
+
+async def acompact_history_node(state: State):
+    return await history.acompact(state)
+
 # --- Graph Construction ---
 graph_builder = StateGraph(State)
 
-graph_builder.add_node("chatbot", chatbot)
-graph_builder.add_edge(START, "chatbot")
+# Each node carries a sync and an async implementation, so the graph supports both invoke/stream and ainvoke/astream
+graph_builder.add_node("compact_history", RunnableLambda(compact_history_node, afunc=acompact_history_node))
+graph_builder.add_node("chatbot", RunnableLambda(chatbot, afunc=achatbot))
+graph_builder.add_edge(START, "compact_history")
+graph_builder.add_edge("compact_history", "chatbot")
 graph_builder.add_edge("chatbot", END)
 
-graph = graph_builder.compile()
+@lru_cache(maxsize=None)
+def get_graph():
+    """The compiled graph, built on first use like meal_agent's."""
+    return graph_builder.compile()
+
+def __getattr__(name: str):
+    # `agent.graph` (used by the runners) compiles on first access
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- Execution ---
-if __name__ == "__main__":
+async def main(stream_mode: str = "tokens"):
     print("Starting OpenAI Agent...")
     
     if not os.environ.get("OPENAI_API_KEY"):
         print("Please set OPENAI_API_KEY environment variable.")
 
+    # The model clients are built (and MODEL_PREWARM connections opened) while the user types the first prompt
+    warm_up = asyncio.create_task(awarm_up())
+
     while True:
         try:
-            user_input = input("\nUser: ")
+            user_input = await asyncio.to_thread(input, "\nUser: ")
+            # Done by the time the user has typed, usually; otherwise the turn waits for the clients it needs
+            await warm_up
             if user_input.lower() in ["quit", "exit", "q"]:
+                dump_metrics()
                 print("Goodbye!")
                 break
 
-            for event in graph.stream({"messages": [HumanMessage(content=user_input)]}):
-                for value in event.values():
+            inputs = {"messages": [HumanMessage(content=user_input)]}
+            if stream_mode == "tokens":
+                # Forward token deltas as they arrive, tagged with the producing node
+                await print_token_stream(get_graph(), inputs, metrics_config())
+                continue
+
+            async for event in get_graph().astream(inputs, metrics_config()):
+                for key, value in event.items():
+                    if key != "chatbot":
+                        continue
                     # ChatOpenAI response content is directly accessible
                     print("Agent:", value["messages"][-1].content)
                     
@@ -70,3 +113,9 @@ if __name__ == "__main__":
         except Exception as e:
             print(f"An error occurred: {e}")
             break
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stream-mode", choices=["tokens", "nodes"], default="tokens",
+                        help="Print token deltas as they arrive (default) or whole node outputs")
+    asyncio.run(main(parser.parse_args().stream_mode))
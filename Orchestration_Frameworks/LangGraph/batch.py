@@ -0,0 +1,193 @@
+"""
+Resumable JSONL batch processing.
+
+Streams requests from a JSONL file through an async handler with at most
+`concurrency` requests in flight, appending one result line per request to
+the output file as soon as it finishes (so results are not in input order;
+each carries its input line number).
+
+Progress is checkpointed to `<output>.checkpoint` after every result: the
+input line and byte offset up to which everything is done, the few later lines
+that already finished out of order, and the output size at that point. A
+rerun resumes from there, truncating any result written after the last
+checkpoint, so every request ends up in the output exactly once.
+
+Memory stays constant: the input is read line by line, at most `window`
+requests are read ahead of the oldest unfinished one, and latencies go into
+a fixed-bucket histogram.
+"""
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+from metrics import Histogram
+
+Handler = Callable[[dict], Awaitable[dict]]
+
+
+class Checkpoint:
+    def __init__(self, path: Path):
+        self.path = path
+
+    def load(self) -> Optional[dict]:
+        if not self.path.exists():
+            return None
+        return json.loads(self.path.read_text())
+
+    def save(self, state: dict):
+        # Write-then-rename so a crash never leaves a half-written checkpoint
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, self.path)
+
+
+class BatchRun:
+    def __init__(
+        self,
+        handler: Handler,
+        input_path: str,
+        output_path: str,
+        concurrency: int = 8,
+        window: Optional[int] = None,
+        timeout: Optional[float] = None,
+        progress_every: float = 10.0,
+    ):
+        self.handler = handler
+        self.input_path = Path(input_path)
+        self.output_path = Path(output_path)
+        self.concurrency = concurrency
+        self.window = window or concurrency * 4
+        self.timeout = timeout
+        self.progress_every = progress_every
+        self.checkpoint = Checkpoint(self.output_path.with_name(self.output_path.name + ".checkpoint"))
+        self.latency = Histogram()
+        self.counts = {"done": 0, "errors": 0, "resumed_from_line": 0}
+
+        # Everything up to input line `watermark` (ending at byte `offset`) is in the output
+        self.watermark = 0
+        self.offset = 0
+        self._done: set[int] = set()  # finished lines above the watermark
+        self._ends: dict[int, int] = {}  # byte offset after each line read but not yet below the watermark
+        self._output = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    # --- Checkpointing ---
+    def _restore(self, state: Optional[dict]):
+        if state is None:
+            self._output = open(self.output_path, "wb")
+            return
+        self.watermark = state["line"]
+        self.offset = state["offset"]
+        self._done = set(state["done"])
+        self.counts["resumed_from_line"] = self.watermark
+        self._output = open(self.output_path, "r+b" if self.output_path.exists() else "wb")
+        # Results written after the last checkpoint are dropped and their requests run again
+        self._output.truncate(state["output_bytes"])
+        self._output.seek(state["output_bytes"])
+
+    def _save(self, complete: bool = False):
+        self.checkpoint.save({
+            "input": str(self.input_path.resolve()),
+            "line": self.watermark,
+            "offset": self.offset,
+            "done": sorted(self._done),
+            "output_bytes": self._output.tell(),
+            "complete": complete,
+        })
+
+    def _finish(self, line: int):
+        """Marks a line done and moves the watermark past every contiguous finished line."""
+        self._done.add(line)
+        # Lines restored as done only pass once the reader has reached them and knows their offsets
+        while self.watermark + 1 in self._done and self.watermark + 1 in self._ends:
+            self.watermark += 1
+            self._done.remove(self.watermark)
+            self.offset = self._ends.pop(self.watermark)
+            self._slots.release()
+
+    # --- Pipeline ---
+    async def _read(self, queue: asyncio.Queue):
+        line = self.watermark
+        with open(self.input_path, "rb") as f:
+            f.seek(self.offset)
+            for raw in iter(f.readline, b""):
+                line += 1
+                # Never read more than `window` lines past the oldest unfinished one
+                await self._slots.acquire()
+                self._ends[line] = f.tell()
+                # Blank lines and lines that finished before a restart are not run again
+                if line in self._done or not raw.strip():
+                    self._finish(line)
+                    continue
+                await queue.put((line, raw))
+        for _ in range(self.concurrency):
+            await queue.put(None)
+
+    async def _process(self, line: int, raw: bytes) -> dict:
+        start = time.perf_counter()
+        result = {"line": line}
+        try:
+            record = json.loads(raw)
+            result["id"] = record.get("id", line) if isinstance(record, dict) else line
+            output = await asyncio.wait_for(self.handler(record), self.timeout)
+            result.update(output)
+        except Exception as e:
+            result["error"] = repr(e)
+            self.counts["errors"] += 1
+        elapsed = time.perf_counter() - start
+        result["latency_s"] = round(elapsed, 4)
+        self.latency.observe(elapsed)
+        return result
+
+    async def _work(self, queue: asyncio.Queue):
+        while (item := await queue.get()) is not None:
+            line, raw = item
+            result = await self._process(line, raw)
+            self._output.write(json.dumps(result, default=str).encode() + b"\n")
+            self._output.flush()
+            self.counts["done"] += 1
+            self._finish(line)
+            self._save()
+
+    async def _report_progress(self, started: float):
+        while True:
+            await asyncio.sleep(self.progress_every)
+            elapsed = time.perf_counter() - started
+            print(f"... {self.counts['done']} done ({self.counts['errors']} errors), "
+                  f"{self.counts['done'] / elapsed:.1f}/s, input line {self.watermark}", flush=True)
+
+    async def run(self, resume: bool = True) -> dict:
+        state = self.checkpoint.load() if resume else None
+        if state is not None and state["input"] != str(self.input_path.resolve()):
+            raise ValueError(f"{self.checkpoint.path} belongs to {state['input']}; pass --restart to start over")
+        if state is not None and state.get("complete"):
+            return {**self.counts, "lines": state["line"], "complete": True, "note": "already complete; pass --restart to run again"}
+        self._restore(state)
+
+        self._slots = asyncio.Semaphore(self.window)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+        started = time.perf_counter()
+        progress = asyncio.create_task(self._report_progress(started)) if self.progress_every else None
+        try:
+            await asyncio.gather(self._read(queue), *(self._work(queue) for _ in range(self.concurrency)))
+            self._save(complete=True)
+        finally:
+            if progress is not None:
+                progress.cancel()
+            self._output.close()
+        return self.summary(time.perf_counter() - started)
+
+    def summary(self, wall_time: float) -> dict:
+        return {
+            **self.counts,
+            "lines": self.watermark,
+            "wall_time_s": round(wall_time, 3),
+            "per_s": round(self.counts["done"] / wall_time, 2) if wall_time else 0.0,
+            "p50_s": round(self.latency.quantile(0.50), 3),
+            "p95_s": round(self.latency.quantile(0.95), 3),
+            "p99_s": round(self.latency.quantile(0.99), 3),
+            "complete": True,
+        }
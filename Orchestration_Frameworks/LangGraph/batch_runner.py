@@ -0,0 +1,67 @@
+"""
+Batch runner.
+
+Runs every request of a JSONL file through one of the compiled graphs with a
+bounded number of graph runs in flight, writing one JSON result per line as
+each finishes. Progress is checkpointed next to the output file, so rerunning
+the same command after a crash resumes where it stopped (see batch.py).
+
+Input lines are JSON objects with the request text in `prompt` (or the field
+named by --field) and an optional `id`. Output lines carry the input line
+number, the id, the reply (or the error) and the latency.
+
+Usage:
+    uv run batch_runner.py meal_agent requests.jsonl results.jsonl --concurrency 20
+    uv run batch_runner.py recipe_agent requests.jsonl results.jsonl --restart
+"""
+import argparse
+import asyncio
+import importlib
+import json
+
+from langchain_core.messages import HumanMessage
+
+from batch import BatchRun
+from instrumentation import metrics_config
+from metrics import metrics
+from models import aprewarm
+from session_runner import max_rss_mb
+
+
+def graph_handler(graph, field: str):
+    async def handle(record: dict) -> dict:
+        state = await graph.ainvoke({"messages": [HumanMessage(content=record[field])]}, metrics_config())
+        return {"reply": state["messages"][-1].content}
+    return handle
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of requests through a graph")
+    parser.add_argument("module", help="Agent module exposing `graph` (e.g. meal_agent, recipe_agent)")
+    parser.add_argument("input", help="JSONL file with one request object per line")
+    parser.add_argument("output", help="JSONL file the results are appended to")
+    parser.add_argument("--field", default="prompt", help="Field holding the request text")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum graph runs in flight")
+    parser.add_argument("--timeout", type=float, default=None, help="Seconds allowed per request")
+    parser.add_argument("--progress", type=float, default=10.0, help="Seconds between progress lines (0 = off)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the first line")
+    args = parser.parse_args()
+
+    graph = importlib.import_module(args.module).graph
+    await aprewarm()
+    run = BatchRun(
+        graph_handler(graph, args.field), args.input, args.output,
+        concurrency=args.concurrency, timeout=args.timeout, progress_every=args.progress,
+    )
+    try:
+        summary = await run.run(resume=not args.restart)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    summary["max_rss_mb"] = max_rss_mb()
+    print(json.dumps(summary, indent=2))
+    print(metrics.report())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,306 @@
+"""
+Record/replay cassettes for model calls.
+
+An httpx transport that sits under the shared HTTP pool. With
+CASSETTE_MODE=record every model request is sent as usual and its response,
+with the time each chunk arrived, is appended to the cassette at
+CASSETTE_PATH. With CASSETTE_MODE=replay nothing goes over the network: each
+request is answered from the cassette, paced like the original
+(CASSETTE_TIMING=recorded) or immediately (CASSETTE_TIMING=zero).
+
+Requests are keyed by a SHA-256 of the method, path and canonical JSON body
+(the prompt, model and parameters), so a replayed graph takes exactly the
+recorded path, loops included. A request recorded several times is replayed
+in the recorded order, then the recordings are reused round-robin.
+
+Cassettes are JSON lines, gzipped when the path ends in .gz.
+"""
+import asyncio
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+MODES = ("record", "replay")
+REPLAYED_HEADERS = ("content-type", "content-encoding")
+
+
+def request_key(request: httpx.Request) -> str:
+    body = request.read()
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode()
+    except ValueError:
+        pass
+    digest = hashlib.sha256(f"{request.method} {request.url.path}\n".encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def _request_model(request: httpx.Request) -> Optional[str]:
+    try:
+        return json.loads(request.read()).get("model")
+    except (ValueError, AttributeError):
+        return None
+
+
+# Chunks are stored as text; surrogateescape round-trips UTF-8 sequences split across chunks
+def _encode(chunk: bytes) -> str:
+    return chunk.decode("utf-8", "surrogateescape")
+
+
+def _decode(text: str) -> bytes:
+    return text.encode("utf-8", "surrogateescape")
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str, timing: str = "recorded"):
+        if mode not in MODES:
+            raise ValueError(f"CASSETTE_MODE must be one of {MODES}, not {mode!r}")
+        self.path = Path(path)
+        self.mode = mode
+        self.timing = timing
+        self.counts = {"recorded": 0, "replayed": 0, "misses": 0}
+        self._entries: Optional[dict[str, list[dict]]] = None
+        self._served: dict[str, int] = {}
+        self._file = None
+        self._lock = threading.Lock()
+
+    # --- Storage ---
+    def _open(self, mode: str):
+        return gzip.open(self.path, mode) if self.path.suffix == ".gz" else open(self.path, mode)
+
+    def _load(self) -> dict[str, list[dict]]:
+        entries: dict[str, list[dict]] = {}
+        if self.path.exists():
+            with self._open("rt") as f:
+                try:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            entries.setdefault(entry["key"], []).append(entry)
+                except EOFError:
+                    pass  # A recording process that did not exit cleanly leaves the gzip trailer off
+        return entries
+
+    def save(self, entry: dict):
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                # One gzip stream for the whole process compresses far better than one per entry
+                self._file = self._open("at")
+                atexit.register(self.close)
+            self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            self._file.flush()
+            self.counts["recorded"] += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def lookup(self, key: str) -> Optional[dict]:
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            recordings = self._entries.get(key)
+            if not recordings:
+                self.counts["misses"] += 1
+                return None
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+            self.counts["replayed"] += 1
+            return recordings[served % len(recordings)]
+
+    def stats(self) -> dict:
+        return {"mode": self.mode, "path": str(self.path), **self.counts}
+
+    # --- Entries ---
+    def entry(self, key: str, request: httpx.Request, response: httpx.Response, ttfb: float, chunks: list) -> dict:
+        return {
+            "key": key,
+            "model": _request_model(request),
+            "path": request.url.path,
+            "status": response.status_code,
+            # Chunks are the raw (possibly compressed) bytes, so the encoding is kept with them
+            "headers": {k: response.headers[k] for k in REPLAYED_HEADERS if k in response.headers},
+            "ttfb": round(ttfb, 4),
+            "chunks": [[round(offset, 4), _encode(chunk)] for offset, chunk in chunks],
+        }
+
+    def miss(self, key: str) -> httpx.Response:
+        # A 404 makes the OpenAI SDK fail the call straight away instead of retrying
+        return httpx.Response(404, json={"error": {
+            "message": f"No recording in cassette {self.path} for request {key[:12]}",
+            "type": "cassette_miss",
+        }})
+
+    def delays(self, entry: dict) -> tuple[float, list[tuple[float, bytes]]]:
+        """The time to wait before the headers and each chunk's offset from the request start."""
+        chunks = [(offset, _decode(text)) for offset, text in entry["chunks"]]
+        if self.timing == "zero":
+            return 0.0, [(0.0, chunk) for _, chunk in chunks]
+        return entry["ttfb"], chunks
+
+
+# --- Sync Transport ---
+class _RecordingStream(httpx.SyncByteStream):
+    def __init__(self, stream, on_complete, start: float):
+        self._stream = stream
+        self._on_complete = on_complete
+        self._start = start
+        self._chunks = []
+        self._complete = False
+
+    def __iter__(self):
+        for chunk in self._stream:
+            self._chunks.append((time.perf_counter() - self._start, chunk))
+            yield chunk
+        self._complete = True
+
+    def close(self):
+        self._stream.close()
+        # Only fully read responses are recorded; an aborted stream would replay truncated
+        if self._complete:
+            self._on_complete(self._chunks)
+            self._complete = False
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, chunks: list, start: float):
+        self._chunks = chunks
+        self._start = start
+
+    def __iter__(self):
+        for offset, chunk in self._chunks:
+            wait = offset - (time.perf_counter() - self._start)
+            if wait > 0:
+                time.sleep(wait)
+            yield chunk
+
+
+class CassetteTransport(httpx.BaseTransport):
+    def __init__(self, transport: httpx.BaseTransport, cassette: Cassette):
+        self.transport = transport
+        self.cassette = cassette
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        key = request_key(request)
+        start = time.perf_counter()
+        if self.cassette.mode == "replay":
+            entry = self.cassette.lookup(key)
+            if entry is None:
+                return self.cassette.miss(key)
+            ttfb, chunks = self.cassette.delays(entry)
+            if ttfb > 0:
+                time.sleep(ttfb)
+            return httpx.Response(entry["status"], headers=entry["headers"],
+                                  stream=_ReplayStream(chunks, start))
+
+        response = self.transport.handle_request(request)
+        ttfb = time.perf_counter() - start
+        on_complete = lambda chunks: self.cassette.save(self.cassette.entry(key, request, response, ttfb, chunks))
+        response.stream = _RecordingStream(response.stream, on_complete, start)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+# --- Async Transport ---
+class _AsyncRecordingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, on_complete, start: float):
+        self._stream = stream
+        self._on_complete = on_complete
+        self._start = start
+        self._chunks = []
+        self._complete = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._chunks.append((time.perf_counter() - self._start, chunk))
+            yield chunk
+        self._complete = True
+
+    async def aclose(self):
+        await self._stream.aclose()
+        if self._complete:
+            self._on_complete(self._chunks)
+            self._complete = False
+
+
+class _AsyncReplayStream(httpx.AsyncByteStream):
+    def __init__(self, chunks: list, start: float):
+        self._chunks = chunks
+        self._start = start
+
+    async def __aiter__(self):
+        for offset, chunk in self._chunks:
+            wait = offset - (time.perf_counter() - self._start)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            yield chunk
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport, cassette: Cassette):
+        self.transport = transport
+        self.cassette = cassette
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = request_key(request)
+        start = time.perf_counter()
+        if self.cassette.mode == "replay":
+            entry = self.cassette.lookup(key)
+            if entry is None:
+                return self.cassette.miss(key)
+            ttfb, chunks = self.cassette.delays(entry)
+            if ttfb > 0:
+                await asyncio.sleep(ttfb)
+            return httpx.Response(entry["status"], headers=entry["headers"],
+                                  stream=_AsyncReplayStream(chunks, start))
+
+        response = await self.transport.handle_async_request(request)
+        ttfb = time.perf_counter() - start
+        on_complete = lambda chunks: self.cassette.save(self.cassette.entry(key, request, response, ttfb, chunks))
+        response.stream = _AsyncRecordingStream(response.stream, on_complete, start)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+# --- Factories ---
+# CASSETTE_MODE=record|replay (unset: off), CASSETTE_PATH (default cassette.jsonl.gz), CASSETTE_TIMING=recorded|zero.
+@lru_cache(maxsize=None)
+def get_cassette() -> Optional[Cassette]:
+    mode = os.environ.get("CASSETTE_MODE")
+    if not mode:
+        return None
+    if mode == "replay":
+        # The OpenAI clients refuse to start without a key, even though replay never sends one
+        os.environ.setdefault("OPENAI_API_KEY", "cassette-replay")
+    return Cassette(
+        os.environ.get("CASSETTE_PATH", "cassette.jsonl.gz"),
+        mode,
+        timing=os.environ.get("CASSETTE_TIMING", "recorded"),
+    )
+
+
+def cassette_transport(transport: httpx.BaseTransport) -> httpx.BaseTransport:
+    """`transport` wrapped for the configured cassette, or unchanged when cassettes are off."""
+    cassette = get_cassette()
+    return CassetteTransport(transport, cassette) if cassette else transport
+
+
+def async_cassette_transport(transport: httpx.AsyncBaseTransport) -> httpx.AsyncBaseTransport:
+    cassette = get_cassette()
+    return AsyncCassetteTransport(transport, cassette) if cassette else transport
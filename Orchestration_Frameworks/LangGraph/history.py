@@ -0,0 +1,161 @@
+"""
+Bounded conversation history.
+
+With a checkpointer every turn is appended to `State.messages` for good, so
+the chat nodes would resend an ever-growing conversation. The compactor runs
+at the start of each turn: once a session holds more than HISTORY_MAX_TURNS
+turns or HISTORY_MAX_TOKENS (approximate) tokens, the older turns are removed
+from the state and folded into a running summary written by a cheap model.
+Only the last HISTORY_KEEP_TURNS turns stay verbatim, so a fold happens every
+few turns rather than on every one.
+"""
+import json
+import os
+from collections import Counter
+from typing import TYPE_CHECKING, Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage, RemoveMessage, SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from models import chat_model
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+
+SUMMARY_PROMPT = """You keep a running summary of a conversation between a user and an assistant.
+Update the summary with the new part of the conversation below. Keep facts, preferences and open requests the assistant may need later; drop small talk.
+Respond with the updated summary only, in at most 200 words."""
+
+
+def is_user_message(message: BaseMessage) -> bool:
+    """A message typed by the user. Graph nodes that speak as a human (e.g. the no-butter inspector's feedback) set a `name`."""
+    return isinstance(message, HumanMessage) and not message.name
+
+
+def turn_starts(messages: list[BaseMessage]) -> list[int]:
+    """Index of the first message of every turn (each user message starts one)."""
+    return [i for i, m in enumerate(messages) if is_user_message(m)]
+
+
+def transcript(messages: list[BaseMessage]) -> str:
+    lines = []
+    for m in messages:
+        if is_user_message(m):
+            speaker = "User"
+        else:
+            speaker = m.name.title() if isinstance(m, HumanMessage) else "Assistant"
+        lines.append(f"{speaker}: {m.content}")
+    return "\n".join(lines)
+
+
+def with_summary(state: dict) -> list[BaseMessage]:
+    """The messages to send to a chat model: the running summary (if any) followed by the kept turns."""
+    summary = state.get("summary")
+    if not summary:
+        return state["messages"]
+    return [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")] + state["messages"]
+
+
+def state_size(state: dict) -> dict:
+    """Size metrics for one session's state."""
+    messages = state.get("messages", [])
+    summary = state.get("summary") or ""
+    return {
+        "messages": len(messages),
+        "turns": len(turn_starts(messages)),
+        "approx_tokens": count_tokens_approximately(messages) if messages else 0,
+        "bytes": len(json.dumps([m.content for m in messages], default=str).encode()) + len(summary.encode()),
+        "summary_chars": len(summary),
+    }
+
+
+class HistoryCompactor:
+    def __init__(
+        self,
+        model: Optional["ChatOpenAI"] = None,
+        max_turns: int = 8,
+        keep_turns: int = 4,
+        max_tokens: int = 3000,
+        summarize: bool = True,
+        enabled: bool = True,
+    ):
+        self.model = model
+        self.max_turns = max_turns
+        self.keep_turns = max(1, min(keep_turns, max_turns))
+        self.max_tokens = max_tokens
+        self.summarize = summarize and model is not None
+        self.enabled = enabled
+        self.counts = Counter()
+
+    def plan(self, messages: list[BaseMessage]) -> list[BaseMessage]:
+        """
+        The oldest messages to fold, or [] while the session is within budget.
+        The current (last) turn is always kept.
+        """
+        starts = turn_starts(messages)
+        if not self.enabled or len(starts) <= 1:
+            return []
+        over_turns = len(starts) > self.max_turns
+        over_tokens = count_tokens_approximately(messages) > self.max_tokens
+        if not (over_turns or over_tokens):
+            return []
+
+        kept = starts[-self.keep_turns:] if len(starts) >= self.keep_turns else starts
+        cut = kept[0]
+        # Within the kept turns, keep dropping the oldest while they alone exceed the token budget
+        for start in kept[1:]:
+            if count_tokens_approximately(messages[cut:]) <= self.max_tokens:
+                break
+            cut = start
+        return messages[:cut]
+
+    def _prompt(self, summary: str, folded: list[BaseMessage]) -> list[BaseMessage]:
+        previous = f"Current summary:\n{summary}\n\n" if summary else ""
+        return [
+            SystemMessage(content=SUMMARY_PROMPT),
+            HumanMessage(content=f"{previous}New conversation:\n{transcript(folded)}"),
+        ]
+
+    def _update(self, folded: list[BaseMessage], summary: str) -> dict:
+        self.counts["folds"] += 1
+        self.counts["folded_messages"] += len(folded)
+        return {"messages": [RemoveMessage(id=m.id) for m in folded], "summary": summary}
+
+    def compact(self, state: dict) -> dict:
+        folded = self.plan(state["messages"])
+        if not folded:
+            return {}
+        summary = state.get("summary") or ""
+        if self.summarize:
+            summary = self.model.invoke(self._prompt(summary, folded)).content
+        return self._update(folded, summary)
+
+    async def acompact(self, state: dict) -> dict:
+        folded = self.plan(state["messages"])
+        if not folded:
+            return {}
+        summary = state.get("summary") or ""
+        if self.summarize:
+            summary = (await self.model.ainvoke(self._prompt(summary, folded))).content
+        return self._update(folded, summary)
+
+    def stats(self) -> dict:
+        return {"folds": self.counts["folds"], "folded_messages": self.counts["folded_messages"]}
+
+
+# --- Factories ---
+# HISTORY_COMPACTION=0 keeps the full history; HISTORY_SUMMARY=0 drops old turns instead of summarizing them.
+def build_summary_model() -> "ChatOpenAI":
+    """The summary model, declared on the shared registry and built on first use (see models.py)."""
+    return chat_model(os.environ.get("HISTORY_SUMMARY_MODEL", "gpt-5-nano"))
+
+
+def build_history_compactor(model: Optional["ChatOpenAI"] = None) -> HistoryCompactor:
+    """Builds the compactor from the HISTORY_* environment variables, summarizing with `model` (gpt-5-nano by default)."""
+    return HistoryCompactor(
+        model=model or build_summary_model(),
+        max_turns=int(os.environ.get("HISTORY_MAX_TURNS", "8")),
+        keep_turns=int(os.environ.get("HISTORY_KEEP_TURNS", "4")),
+        max_tokens=int(os.environ.get("HISTORY_MAX_TOKENS", "3000")),
+        summarize=os.environ.get("HISTORY_SUMMARY", "1") != "0",
+        enabled=os.environ.get("HISTORY_COMPACTION", "1") != "0",
+    )
@@ -0,0 +1,60 @@
+"""
+Process-wide HTTP connection pools.
+
+Every model client in the process (ChatOpenAI, PydanticAI's OpenAI provider)
+shares one sync and one async httpx client per provider, so concurrent
+sessions reuse keep-alive connections instead of each model opening its own.
+When CASSETTE_MODE is set, their transports record or replay model calls (see
+cassette.py).
+
+`aprewarm(base_url, connections)` opens keep-alive connections ahead of the
+first model call, so it does not pay for the TCP and TLS handshakes.
+"""
+import asyncio
+import os
+from functools import lru_cache
+from typing import Optional
+
+import httpx
+
+from cassette import async_cassette_transport, cassette_transport
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.environ.get("HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.environ.get("HTTP_MAX_KEEPALIVE", "20")),
+    )
+
+
+# The OpenAI SDK sets its own per-request timeouts; this only applies to anything else using the pool.
+_TIMEOUT = httpx.Timeout(600.0, connect=5.0)
+
+
+@lru_cache(maxsize=None)
+def get_http_client(provider: str = "openai") -> httpx.Client:
+    return httpx.Client(timeout=_TIMEOUT, transport=cassette_transport(httpx.HTTPTransport(limits=_limits())))
+
+
+@lru_cache(maxsize=None)
+def get_async_http_client(provider: str = "openai") -> httpx.AsyncClient:
+    return httpx.AsyncClient(timeout=_TIMEOUT, transport=async_cassette_transport(httpx.AsyncHTTPTransport(limits=_limits())))
+
+
+# --- Pre-warming ---
+async def aprewarm(base_url: str, connections: int = 1, provider: str = "openai", headers: Optional[dict] = None) -> int:
+    """
+    Opens `connections` keep-alive connections to `base_url` on the async pool
+    by sending that many requests at once; each one holds its own connection,
+    which goes back to the pool when it completes.
+    Returns the number of requests that got a response (any status counts).
+    """
+    client = get_async_http_client(provider)
+    results = await asyncio.gather(
+        *(client.get(base_url, headers=headers, timeout=10.0) for _ in range(connections)),
+        return_exceptions=True,
+    )
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        print(f"Warning: could not pre-warm {base_url}: {errors[0]}")
+    return len(results) - len(errors)
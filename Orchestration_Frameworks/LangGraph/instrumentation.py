@@ -0,0 +1,180 @@
+"""
+LangGraph instrumentation.
+
+A LangChain callback handler that reports every graph node, routing edge and
+model call to the metrics registry without touching the node code. Pass it in
+the run config:
+
+    graph.astream(inputs, {"callbacks": [MetricsCallback()]})
+
+Node queue time is the gap between the end of the previous graph step and the
+node starting, i.e. scheduling overhead plus waiting on slower siblings. Node
+wall time excludes the routing edges that run after it; those get edge rows.
+Model call tokens are also rolled up into the enclosing node or edge, so the
+node rows show spend per node and the llm rows spend per model. A stream
+closed early (a stopped draft) gets no usage from the provider though its
+prompt was billed; its tokens are estimated from the prompt and partial text.
+"""
+import time
+from typing import Any, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages.utils import count_tokens_approximately
+
+from metrics import metrics
+
+
+class MetricsCallback(BaseCallbackHandler):
+    # Timing is taken when the callback fires, so run it inline rather than in an executor
+    run_inline = True
+
+    def __init__(self):
+        # run_id -> {kind, name, parent, start, step, tokens...}; entries are dropped when the run ends
+        self._runs: dict[UUID, dict] = {}
+        # (root run, step) -> time the last node of that step finished
+        self._step_end: dict[tuple[UUID, int], float] = {}
+
+    # --- Helpers ---
+    def _root(self, run_id: Optional[UUID]) -> Optional[UUID]:
+        while run_id in self._runs and self._runs[run_id]["parent"] in self._runs:
+            run_id = self._runs[run_id]["parent"]
+        return run_id
+
+    def _owner(self, run_id: Optional[UUID]) -> Optional[dict]:
+        """The closest enclosing node or edge run."""
+        while run_id in self._runs:
+            run = self._runs[run_id]
+            if run["kind"] in ("node", "edge"):
+                return run
+            run_id = run["parent"]
+        return None
+
+    def _finish(self, run_id: UUID, error: bool = False):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        end = time.perf_counter()
+        if run["kind"] == "root":
+            for key in [k for k in self._step_end if k[0] == run_id]:
+                del self._step_end[key]
+            return
+        if run["kind"] is None:
+            return
+        wall = end - run["start"]
+        if run["kind"] == "node":
+            key = (run["root"], run["step"])
+            self._step_end[key] = max(self._step_end.get(key, 0.0), end)
+            # The outgoing edges run inside the node's sequence; they are recorded on their own
+            wall -= run["edge_time"]
+        elif run["kind"] == "edge" and run["parent"] in self._runs:
+            self._runs[run["parent"]]["edge_time"] += wall
+        metrics.record(
+            run["kind"], run["name"], wall, queue_s=run["queue"],
+            model=run["model"], input_tokens=run["input_tokens"], output_tokens=run["output_tokens"], error=error,
+        )
+
+    # --- Chains (graph, nodes, edges) ---
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                       tags: Optional[list[str]] = None, metadata: Optional[dict] = None, **kwargs: Any):
+        now = time.perf_counter()
+        metadata = metadata or {}
+        tags = tags or []
+        name = kwargs.get("name") or ""
+        node = metadata.get("langgraph_node")
+        parent = self._runs.get(parent_run_id)
+
+        kind = None
+        if parent is None and node is None:
+            kind = "root"
+        elif any(t.startswith("graph:step:") for t in tags) and name == node:
+            kind = "node"
+        elif parent is not None and parent["kind"] == "node" and any(t.startswith("seq:step:") and t != "seq:step:1" for t in tags):
+            kind = "edge" # A conditional edge (router) run after the node body
+
+        run = {
+            "kind": kind, "name": name, "parent": parent_run_id, "start": now, "queue": 0.0, "edge_time": 0.0,
+            "model": None, "input_tokens": 0, "output_tokens": 0, "step": metadata.get("langgraph_step", 0),
+        }
+        self._runs[run_id] = run
+        run["root"] = self._root(run_id)
+        if kind == "node":
+            root = self._runs.get(run["root"])
+            ready = self._step_end.get((run["root"], run["step"] - 1), root["start"] if root else now)
+            run["queue"] = max(0.0, now - ready)
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id: UUID, **kwargs: Any):
+        self._finish(run_id, error=True)
+
+    # --- Model calls ---
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                            metadata: Optional[dict] = None, **kwargs: Any):
+        metadata = metadata or {}
+        owner = self._owner(parent_run_id)
+        self._runs[run_id] = {
+            "kind": "llm", "name": owner["name"] if owner else metadata.get("langgraph_node", "llm"),
+            "parent": parent_run_id, "start": time.perf_counter(), "queue": 0.0,
+            "model": metadata.get("ls_model_name"), "input_tokens": 0, "output_tokens": 0, "step": 0,
+            "messages": messages,
+        }
+
+    def _add_usage(self, run: dict, input_tokens: int, output_tokens: int):
+        run["input_tokens"] += input_tokens
+        run["output_tokens"] += output_tokens
+        owner = self._owner(run["parent"])
+        if owner is not None:
+            owner["input_tokens"] += input_tokens
+            owner["output_tokens"] += output_tokens
+            owner["model"] = owner["model"] or run["model"]
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        run = self._runs.get(run_id)
+        if run is not None:
+            input_tokens = output_tokens = 0
+            for generations in response.generations:
+                for generation in generations:
+                    usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    input_tokens += usage.get("input_tokens", 0)
+                    output_tokens += usage.get("output_tokens", 0)
+            run["model"] = (response.llm_output or {}).get("model_name") or run["model"]
+            self._add_usage(run, input_tokens, output_tokens)
+        self._finish(run_id)
+
+    def on_llm_error(self, error, *, run_id: UUID, response: Any = None, **kwargs: Any):
+        run = self._runs.get(run_id)
+        # A stream that ended after producing text (closed early, or cut off) still billed its prompt
+        partial = [
+            generation.message for generations in getattr(response, "generations", []) for generation in generations
+            if getattr(generation, "message", None) is not None and generation.message.content
+        ]
+        if run is not None and partial:
+            self._add_usage(
+                run,
+                sum(count_tokens_approximately(batch) for batch in run["messages"]),
+                count_tokens_approximately(partial),
+            )
+        self._finish(run_id, error=True)
+
+    # --- Tools ---
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        self._runs[run_id] = {
+            "kind": "tool", "name": kwargs.get("name") or (serialized or {}).get("name", "tool"),
+            "parent": parent_run_id, "start": time.perf_counter(), "queue": 0.0,
+            "model": None, "input_tokens": 0, "output_tokens": 0, "step": 0,
+        }
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs: Any):
+        self._finish(run_id)
+
+    def on_tool_error(self, error, *, run_id: UUID, **kwargs: Any):
+        self._finish(run_id, error=True)
+
+
+def metrics_config(config: Optional[dict] = None) -> dict:
+    """Adds a MetricsCallback to a run config."""
+    config = dict(config or {})
+    config["callbacks"] = list(config.get("callbacks") or []) + [MetricsCallback()]
+    return config
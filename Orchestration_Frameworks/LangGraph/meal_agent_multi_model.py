@@ -1,11 +1,25 @@
 import os
-from typing import Annotated, TypedDict, Literal
+import re
+import argparse
+import asyncio
+from functools import lru_cache
+from typing import Annotated, TypedDict, Literal, Optional, Union
 
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, AIMessage
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
+from langgraph.types import Send
+
+from history import build_history_compactor, with_summary
+from instrumentation import metrics_config
+from intent_router import build_meal_router
+from metrics import dump_metrics
+from models import LazyChatModel, awarm_up, chat_model
+from response_cache import build_response_cache
+from speculation import build_speculator
+from streaming import print_token_stream
 
 # --- Configuration ---
 load_dotenv()
@@ -14,140 +28,285 @@ if not os.environ.get("OPENAI_API_KEY"):
     print("WARNING: OPENAI_API_KEY not found in environment variables.")
 
 # --- State Definition ---
+def add_courses(existing: list[dict], new: Optional[list[dict]]) -> list[dict]:
+    """
+    Collects the fan-out chefs' courses; the join node writes None to clear them for the next plan.
+    """
+    if new is None:
+        return []
+    return (existing or []) + new
+
 class State(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
+    summary: str # Running summary of the turns folded out of `messages`
+    courses: Annotated[list[dict], add_courses] # Full-day plan courses waiting for the join node
+
+class CourseRequest(TypedDict):
+    course: str # BREAKFAST, LUNCH or DINNER
+    request: BaseMessage
 
 # --- LLM Setup ---
-# We initialize different models for different tasks as requested.
-try:
-    # gpt-5-nano for routing and general chat
-    llm_nano = ChatOpenAI(
-        model="gpt-5-nano",
-        temperature=0.7,
-    )
-    
-    # gpt-5-mini for breakfast and lunch
-    llm_mini = ChatOpenAI(
-        model="gpt-5-mini",
-        temperature=0.7,
-    )
-    
-    # gpt-4.1-mini for dinner
-    llm_dinner = ChatOpenAI(
-        model="gpt-4.1-mini",
-        temperature=0.7,
-    )
-    
-except Exception as e:
-    print(f"Error initializing ChatOpenAI models: {e}")
-    llm_nano = None
-    llm_mini = None
-    llm_dinner = None
+# We use different models for different tasks as requested.
+# They are declared here and built on first use on the shared HTTP pool (see models.py).
+# gpt-5-nano for routing and general chat
+llm_nano = chat_model("gpt-5-nano", temperature=0.7)
+
+# gpt-5-mini for breakfast and lunch
+llm_mini = chat_model("gpt-5-mini", temperature=0.7)
+
+# gpt-4.1-mini for dinner
+llm_dinner = chat_model("gpt-4.1-mini", temperature=0.7)
+
+# --- Conversation History ---
+# Older turns are folded into `summary` (by gpt-5-nano) so long sessions stay within HISTORY_MAX_TURNS / HISTORY_MAX_TOKENS.
+history = build_history_compactor(llm_nano)
+
+# --- Intent Router ---
+# Keyword rules + a small in-memory classifier; falls back to the LLM below LOCAL_ROUTER_THRESHOLD.
+intent_router = build_meal_router()
+
+# --- Response Cache ---
+# Identical (or, with RESPONSE_CACHE_SIMILARITY, near-identical) requests reuse a previous recipe.
+response_cache = build_response_cache()
+
+# --- Speculative Chef ---
+# With SPECULATIVE_CHEF=1 the most likely chef starts while the LLM router is still deciding.
+speculator = build_speculator()
+
+# --- Chef Prompts ---
+BREAKFAST_CHEF_PROMPT = "You are a specialist Breakfast Chef. Provide a delicious and energetic breakfast recipe based on the user's request. Focus on morning ingredients."
+LUNCH_CHEF_PROMPT = "You are a specialist Lunch Chef. Provide a balanced and quick lunch recipe based on the user's request. Focus on midday sustenance."
+DINNER_CHEF_PROMPT = "You are a specialist Dinner Chef. Provide a comforting and substantial dinner recipe based on the user's request. Focus on evening relaxation and flavor."
 
 # --- Node Definitions ---
+# Every node has a sync and an async (ainvoke) implementation, registered together
+# so the compiled graph supports both invoke/stream and ainvoke/astream.
 
-def router_node(state: State) -> Literal["breakfast_chef", "lunch_chef", "dinner_chef", "general_chat"]:
-    """
-    Acts as the Orchestrator. Analyzes the user's intent and routes to the appropriate chef.
-    Uses gpt-5-nano.
-    """
-    if llm_nano is None:
-        return "general_chat"
-        
-    messages = state["messages"]
-    last_message = messages[-1]
-    
-    # We ask the LLM to classify the intent
-    prompt = [
-        SystemMessage(content="""You are a routing assistant. Classify the user's request into one of the following categories:
+ROUTER_PROMPT = """You are a routing assistant. Classify the user's request into one of the following categories:
         - BREAKFAST: If the user is asking for a breakfast recipe.
         - LUNCH: If the user is asking for a lunch recipe.
         - DINNER: If the user is asking for a dinner recipe.
         - OTHER: For any other request.
         
-        Respond ONLY with the category name (BREAKFAST, LUNCH, DINNER, or OTHER)."""),
-        last_message
-    ]
-    response = llm_nano.invoke(prompt)
-    print(f"Router response: {response.content}")
-    category = response.content.strip().upper()
-    print(f"Router classified the request as: {category}")
+        Respond ONLY with the category name (BREAKFAST, LUNCH, DINNER, or OTHER)."""
+
+def llm_route(text: str) -> str:
+    """
+    Asks the LLM to classify the request. Only used when the local router is unsure.
+    Uses gpt-5-nano.
+    """
+    response = llm_nano.invoke([SystemMessage(content=ROUTER_PROMPT), HumanMessage(content=text)])
+    return response.content
+
+async def allm_route(text: str) -> str:
+    response = await llm_nano.ainvoke([SystemMessage(content=ROUTER_PROMPT), HumanMessage(content=text)])
+    return response.content
+
+def route_to_node(decision) -> Literal["breakfast_chef", "lunch_chef", "dinner_chef", "general_chat"]:
+    category = decision.label
+    print(f"Router classified the request as: {category} (via {decision.source})")
     
-    if "BREAKFAST" in category:
+    if category == "BREAKFAST":
         return "breakfast_chef"
-    elif "LUNCH" in category:
+    elif category == "LUNCH":
         return "lunch_chef"
-    elif "DINNER" in category:
+    elif category == "DINNER":
         return "dinner_chef"
     else:
         return "general_chat"
 
+def plan_courses(text: str) -> list[str]:
+    """
+    The courses a request asks for: all three for a full-day plan, the listed ones for an explicit
+    list ("breakfast and dinner"). A meal that is only mentioned ("I skipped lunch, what can I
+    make for dinner?") is not a course of its own, so such requests get a single chef.
+    """
+    if FULL_DAY_PATTERN.search(text):
+        return list(COURSES)
+    listed = COURSE_LIST_PATTERN.search(text)
+    if not listed:
+        return []
+    meals = {MEAL_WORDS[word.lower()] for word in re.findall(MEAL_WORD, listed.group(0), re.IGNORECASE)}
+    return [course for course in COURSES if course in meals]
+
+def fan_out(request: BaseMessage) -> Optional[list[Send]]:
+    """
+    Sends one course_chef task per course when the request asks for more than one meal.
+    """
+    courses = plan_courses(request.content)
+    if len(courses) < 2:
+        return None
+    print(f"Router planned several courses: {', '.join(courses)}")
+    return [Send("course_chef", {"course": course, "request": request}) for course in courses]
+
+def router_node(state: State) -> Union[Literal["breakfast_chef", "lunch_chef", "dinner_chef", "general_chat"], list[Send]]:
+    """
+    Acts as the Orchestrator. Analyzes the user's intent and routes to the appropriate chef.
+    The local intent router decides most requests; the LLM is only asked when it is unsure.
+    Requests for several meals fan out to the chefs concurrently.
+    """
+    last_message = state["messages"][-1]
+    sends = fan_out(last_message)
+    if sends:
+        return sends
+    decision = intent_router.route(last_message.content, llm_route)
+    return route_to_node(decision)
+
+async def arouter_node(state: State) -> Union[Literal["breakfast_chef", "lunch_chef", "dinner_chef", "general_chat"], list[Send]]:
+    last_message = state["messages"][-1]
+    sends = fan_out(last_message)
+    if sends:
+        return sends
+    decision = await speculator.aroute(
+        intent_router, last_message, allm_route, speculative_chefs(last_message)
+    )
+    return route_to_node(decision)
+
+def speculative_chefs(request: BaseMessage) -> dict:
+    """
+    The chef calls the router may start before the LLM router has answered, keyed by route label.
+    """
+    return {
+        "BREAKFAST": ("breakfast_chef", lambda: acook("breakfast_chef", llm_mini, BREAKFAST_CHEF_PROMPT, request)),
+        "LUNCH": ("lunch_chef", lambda: acook("lunch_chef", llm_mini, LUNCH_CHEF_PROMPT, request)),
+        "DINNER": ("dinner_chef", lambda: acook("dinner_chef", llm_dinner, DINNER_CHEF_PROMPT, request)),
+    }
+
+def cook(chef: str, model: LazyChatModel, system_prompt: str, request: BaseMessage) -> str:
+    """
+    Runs a chef prompt through the response cache.
+    """
+    return response_cache.get_or_call(
+        chef, model.model_name, system_prompt, request.content,
+        lambda: model.invoke([SystemMessage(content=system_prompt), request]).content,
+    )
+
+async def acook(chef: str, model: LazyChatModel, system_prompt: str, request: BaseMessage) -> str:
+    # Pick up a speculative call the router already started for this chef
+    speculated = await speculator.claim(chef, request)
+    if speculated is not None:
+        return speculated
+
+    async def call() -> str:
+        response = await model.ainvoke([SystemMessage(content=system_prompt), request])
+        return response.content
+
+    return await response_cache.aget_or_call(chef, model.model_name, system_prompt, request.content, call)
+
 def breakfast_chef_node(state: State):
     """
     Uses gpt-5-mini.
     """
-    if llm_mini is None: return {"messages": []}
-    messages = state["messages"]
-    prompt = [
-        SystemMessage(content="You are a specialist Breakfast Chef. Provide a delicious and energetic breakfast recipe based on the user's request. Focus on morning ingredients."),
-        messages[-1]
-    ]
-    response = llm_mini.invoke(prompt)
-    return {"messages": [AIMessage(content=f"**Breakfast Chef (gpt-5-mini):**\n{response.content}")]}
+    content = cook("breakfast_chef", llm_mini, BREAKFAST_CHEF_PROMPT, state["messages"][-1])
+    return {"messages": [AIMessage(content=f"**Breakfast Chef (gpt-5-mini):**\n{content}")]}
+
+async def abreakfast_chef_node(state: State):
+    content = await acook("breakfast_chef", llm_mini, BREAKFAST_CHEF_PROMPT, state["messages"][-1])
+    return {"messages": [AIMessage(content=f"**Breakfast Chef (gpt-5-mini):**\n{content}")]}
 
 def lunch_chef_node(state: State):
     """
     Uses gpt-5-mini.
     """
-    if llm_mini is None: return {"messages": []}
-    messages = state["messages"]
-    prompt = [
-        SystemMessage(content="You are a specialist Lunch Chef. Provide a balanced and quick lunch recipe based on the user's request. Focus on midday sustenance."),
-        messages[-1]
-    ]
-    response = llm_mini.invoke(prompt)
-    return {"messages": [AIMessage(content=f"**Lunch Chef (gpt-5-mini):**\n{response.content}")]}
+    content = cook("lunch_chef", llm_mini, LUNCH_CHEF_PROMPT, state["messages"][-1])
+    return {"messages": [AIMessage(content=f"**Lunch Chef (gpt-5-mini):**\n{content}")]}
+
+async def alunch_chef_node(state: State):
+    content = await acook("lunch_chef", llm_mini, LUNCH_CHEF_PROMPT, state["messages"][-1])
+    return {"messages": [AIMessage(content=f"**Lunch Chef (gpt-5-mini):**\n{content}")]}
 
 def dinner_chef_node(state: State):
     """
     Uses gpt-4.1-mini.
     """
-    if llm_dinner is None: return {"messages": []}
-    messages = state["messages"]
-    prompt = [
-        SystemMessage(content="You are a specialist Dinner Chef. Provide a comforting and substantial dinner recipe based on the user's request. Focus on evening relaxation and flavor."),
-        messages[-1]
-    ]
-    response = llm_dinner.invoke(prompt)
-    return {"messages": [AIMessage(content=f"**Dinner Chef (gpt-4.1-mini):**\n{response.content}")]}
+    content = cook("dinner_chef", llm_dinner, DINNER_CHEF_PROMPT, state["messages"][-1])
+    return {"messages": [AIMessage(content=f"**Dinner Chef (gpt-4.1-mini):**\n{content}")]}
+
+async def adinner_chef_node(state: State):
+    content = await acook("dinner_chef", llm_dinner, DINNER_CHEF_PROMPT, state["messages"][-1])
+    return {"messages": [AIMessage(content=f"**Dinner Chef (gpt-4.1-mini):**\n{content}")]}
 
 def general_chat_node(state: State):
     """
     Uses gpt-5-nano.
     """
-    if llm_nano is None: return {"messages": []}
-    messages = state["messages"]
-    response = llm_nano.invoke(messages)
+    response = llm_nano.invoke(with_summary(state))
+    return {"messages": [response]}
+
+async def ageneral_chat_node(state: State):
+    response = await llm_nano.ainvoke(with_summary(state))
     return {"messages": [response]}
 
+# --- Full-Day Meal Plans ---
+# Course label -> (chef, model, system prompt, title). The fan-out runs the same chefs as the single routes.
+COURSES = {
+    "BREAKFAST": ("breakfast_chef", llm_mini, BREAKFAST_CHEF_PROMPT, "Breakfast Chef (gpt-5-mini)"),
+    "LUNCH": ("lunch_chef", llm_mini, LUNCH_CHEF_PROMPT, "Lunch Chef (gpt-5-mini)"),
+    "DINNER": ("dinner_chef", llm_dinner, DINNER_CHEF_PROMPT, "Dinner Chef (gpt-4.1-mini)"),
+}
+
+FULL_DAY_PATTERN = re.compile(r"\b(?:full|whole|entire) day\b|\bmeal plan\b|\ball (?:three|3|my|the) meals\b|\bevery meal\b", re.IGNORECASE)
+
+MEAL_WORDS = {"breakfast": "BREAKFAST", "brunch": "BREAKFAST", "lunch": "LUNCH", "dinner": "DINNER", "supper": "DINNER"}
+MEAL_WORD = r"\b(?:breakfast|brunch|lunch|dinner|supper)\b"
+# Meals listed together: "breakfast and dinner", "breakfast, lunch & dinner", "lunch plus supper"
+COURSE_LIST_PATTERN = re.compile(
+    rf"{MEAL_WORD}(?:\s*(?:,|&|\+|\band\b|\bplus\b)\s*(?:and\s+)?{MEAL_WORD})+", re.IGNORECASE
+)
+
+def course_chef_node(task: CourseRequest):
+    """
+    One branch of the fan-out. Writes its course to `courses` for the join node instead of replying directly.
+    """
+    chef, model, system_prompt, _ = COURSES[task["course"]]
+    content = cook(chef, model, system_prompt, task["request"])
+    return {"courses": [{"course": task["course"], "content": content}]}
+
+async def acourse_chef_node(task: CourseRequest):
+    chef, model, system_prompt, _ = COURSES[task["course"]]
+    content = await acook(chef, model, system_prompt, task["request"])
+    return {"courses": [{"course": task["course"], "content": content}]}
+
+def meal_plan_node(state: State):
+    """
+    Joins the fan-out: merges the courses, in meal order, into a single reply.
+    """
+    by_course = {c["course"]: c["content"] for c in state.get("courses") or []}
+    sections = [f"**{title}:**\n{by_course[label]}" for label, (_, _, _, title) in COURSES.items() if label in by_course]
+    return {"messages": [AIMessage(content="**Meal Plan**\n\n" + "\n\n".join(sections))], "courses": None}
+
+def compact_history_node(state: State):
+    """
+    Runs first on every turn: folds old turns into the running summary once the session is over budget.
+    """
+    return history.compact(state)
+
+async def acompact_history_node(state: State):
+    return await history.acompact(state)
+
 # --- Graph Construction ---
 graph_builder = StateGraph(State)
+graph_builder.add_node("compact_history", RunnableLambda(compact_history_node, afunc=acompact_history_node))
+graph_builder.add_edge(START, "compact_history")
 
 # Add nodes
-graph_builder.add_node("breakfast_chef", breakfast_chef_node)
-graph_builder.add_node("lunch_chef", lunch_chef_node)
-graph_builder.add_node("dinner_chef", dinner_chef_node)
-graph_builder.add_node("general_chat", general_chat_node)
+graph_builder.add_node("breakfast_chef", RunnableLambda(breakfast_chef_node, afunc=abreakfast_chef_node))
+graph_builder.add_node("lunch_chef", RunnableLambda(lunch_chef_node, afunc=alunch_chef_node))
+graph_builder.add_node("dinner_chef", RunnableLambda(dinner_chef_node, afunc=adinner_chef_node))
+graph_builder.add_node("general_chat", RunnableLambda(general_chat_node, afunc=ageneral_chat_node))
+graph_builder.add_node("course_chef", RunnableLambda(course_chef_node, afunc=acourse_chef_node))
+graph_builder.add_node("meal_plan", meal_plan_node)
 
-# Add conditional edges from START using the router logic
+# Add conditional edges from compact_history using the router logic
 graph_builder.add_conditional_edges(
-    START,
-    router_node,
+    "compact_history",
+    RunnableLambda(router_node, afunc=arouter_node),
     {
         "breakfast_chef": "breakfast_chef",
         "lunch_chef": "lunch_chef",
         "dinner_chef": "dinner_chef",
-        "general_chat": "general_chat"
+        "general_chat": "general_chat",
+        "course_chef": "course_chef", # Full-day plans (Send fan-out)
     }
 )
 
@@ -157,26 +316,55 @@ graph_builder.add_edge("lunch_chef", END)
 graph_builder.add_edge("dinner_chef", END)
 graph_builder.add_edge("general_chat", END)
 
-graph = graph_builder.compile()
+# Every fan-out branch joins in meal_plan, which runs once all courses are in
+graph_builder.add_edge("course_chef", "meal_plan")
+graph_builder.add_edge("meal_plan", END)
+
+@lru_cache(maxsize=None)
+def get_graph():
+    """The compiled graph, built on first use like meal_agent's."""
+    return graph_builder.compile()
+
+def __getattr__(name: str):
+    # `meal_agent_multi_model.graph` (used by the runners) compiles on first access
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- Execution ---
-if __name__ == "__main__":
+async def main(stream_mode: str = "tokens"):
     print("Starting Multi-Model Meal Orchestrator Agent...")
     print("Ask for a breakfast, lunch, or dinner recipe!")
     
     if not os.environ.get("OPENAI_API_KEY"):
         print("Please set OPENAI_API_KEY environment variable.")
 
+    # The model clients are built (and MODEL_PREWARM connections opened) while the user types the first prompt
+    warm_up = asyncio.create_task(awarm_up())
+
     while True:
         try:
-            user_input = input("\nUser: ")
+            user_input = await asyncio.to_thread(input, "\nUser: ")
+            # Done by the time the user has typed, usually; otherwise the turn waits for the clients it needs
+            await warm_up
             if user_input.lower() in ["quit", "exit", "q"]:
+                print(f"Router stats: {intent_router.stats()}")
+                print(f"Cache stats: {response_cache.stats()}")
+                if speculator.enabled:
+                    print(f"Speculation stats: {speculator.stats()}")
+                dump_metrics()
                 print("Goodbye!")
                 break
 
-            for event in graph.stream({"messages": [HumanMessage(content=user_input)]}):
+            inputs = {"messages": [HumanMessage(content=user_input)]}
+            if stream_mode == "tokens":
+                # Forward token deltas as they arrive, tagged with the producing node
+                await print_token_stream(get_graph(), inputs, metrics_config())
+                continue
+
+            async for event in get_graph().astream(inputs, metrics_config()):
                 for key, value in event.items():
-                    for msg in value["messages"]:
+                    for msg in (value or {}).get("messages", []):
                         print(f"\n{msg.content}")
                     
         except KeyboardInterrupt:
@@ -185,3 +373,9 @@ if __name__ == "__main__":
         except Exception as e:
             print(f"An error occurred: {e}")
             break
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stream-mode", choices=["tokens", "nodes"], default="tokens",
+                        help="Print token deltas as they arrive (default) or whole node outputs")
+    asyncio.run(main(parser.parse_args().stream_mode))
@@ -1,11 +1,26 @@
 import os
-from typing import Annotated, TypedDict, Literal
+import argparse
+import asyncio
+import re
+from contextlib import closing
+from functools import lru_cache
+from typing import Annotated, TypedDict, Literal, Optional
 
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, AIMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, AIMessage, AIMessageChunk
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
+from pydantic import BaseModel, Field
+
+from history import build_history_compactor, with_summary
+from instrumentation import metrics_config
+from intent_router import build_meal_router
+from metrics import dump_metrics
+from models import LazyChatModel, awarm_up, chat_model
+from speculation import build_speculator
+from streaming import print_token_stream
 
 # --- Configuration ---
 load_dotenv()
@@ -16,157 +31,407 @@ if not os.environ.get("OPENAI_API_KEY"):
 # --- State Definition ---
 class State(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
+    summary: str # Running summary of the turns folded out of `messages`
     active_chef: str # To track which chef is handling the request
+    verdict: Optional[dict] # Latest inspection result, reused by the routing edges (None until the draft is inspected)
+    request: str # The user's original request for the current recipe
+    recipe: str # The latest recipe draft
+    revisions: int # Number of times the inspector has sent the recipe back
+    usage: list[dict] # Per-iteration token counts for the chef and inspector calls
+
+# --- Revision Loop Settings ---
+# MAX_REVISIONS caps the chef/inspector loop; REVISION_MODE=full resends the whole history instead.
+MAX_REVISIONS = int(os.environ.get("MAX_REVISIONS", "3"))
+REVISION_MODE = os.environ.get("REVISION_MODE", "compact")
+
+# --- Inspection Settings ---
+# INSPECTION_MODE=streaming checks each ingredient line while the chef is still writing and stops the draft
+# at the first one using butter, going straight to the revision; "after" (the default) only inspects whole drafts.
+INSPECTION_MODE = os.environ.get("INSPECTION_MODE", "after")
 
 # --- LLM Setup ---
-try:
-    # gpt-5-nano for routing, general chat, and inspection
-    llm_nano = ChatOpenAI(
-        model="gpt-5-nano",
-        temperature=0.7,
-    )
-    
-    # gpt-5-mini for breakfast and lunch
-    llm_mini = ChatOpenAI(
-        model="gpt-5-mini",
-        temperature=0.7,
-    )
-    
-    # gpt-4.1-mini for dinner
-    llm_dinner = ChatOpenAI(
-        model="gpt-4.1-mini",
-        temperature=0.7,
-    )
-    
-except Exception as e:
-    print(f"Error initializing ChatOpenAI models: {e}")
-    llm_nano = None
-    llm_mini = None
-    llm_dinner = None
+# Declared here, built on first use on the shared HTTP pool (see models.py)
+# gpt-5-nano for routing, general chat, and inspection
+llm_nano = chat_model("gpt-5-nano", temperature=0.7)
+
+# gpt-5-mini for breakfast and lunch
+llm_mini = chat_model("gpt-5-mini", temperature=0.7)
+
+# gpt-4.1-mini for dinner
+llm_dinner = chat_model("gpt-4.1-mini", temperature=0.7)
+
+# --- Conversation History ---
+# Older turns are folded into `summary` (by gpt-5-nano) so long sessions stay within HISTORY_MAX_TURNS / HISTORY_MAX_TOKENS.
+history = build_history_compactor(llm_nano)
+
+# --- Intent Router ---
+# Keyword rules + a small in-memory classifier; falls back to the LLM below LOCAL_ROUTER_THRESHOLD.
+intent_router = build_meal_router()
+
+# --- Speculative Chef ---
+# With SPECULATIVE_CHEF=1 the most likely chef starts its first draft while the LLM router is still deciding.
+speculator = build_speculator()
 
 # --- Node Definitions ---
+# Every LLM-backed node has a sync and an async (ainvoke) implementation, registered together
+# so the compiled graph supports both invoke/stream and ainvoke/astream.
 
-def router_node(state: State) -> Literal["breakfast_chef", "lunch_chef", "dinner_chef", "general_chat"]:
-    """
-    Acts as the Orchestrator. Analyzes the user's intent and routes to the appropriate chef.
-    """
-    if llm_nano is None:
-        return "general_chat"
-        
-    messages = state["messages"]
-    last_message = messages[-1]
-    
-    prompt = [
-        SystemMessage(content="""You are a routing assistant. Classify the user's request into one of the following categories:
+ROUTER_PROMPT = """You are a routing assistant. Classify the user's request into one of the following categories:
         - BREAKFAST: If the user is asking for a breakfast recipe.
         - LUNCH: If the user is asking for a lunch recipe.
         - DINNER: If the user is asking for a dinner recipe.
         - OTHER: For any other request.
         
-        Respond ONLY with the category name (BREAKFAST, LUNCH, DINNER, or OTHER)."""),
-        last_message
-    ]
-    response = llm_nano.invoke(prompt)
-    category = response.content.strip().upper()
-    print(f"Router classified the request as: {category}")
+        Respond ONLY with the category name (BREAKFAST, LUNCH, DINNER, or OTHER)."""
+
+def llm_route(text: str) -> str:
+    """
+    Asks the LLM to classify the request. Only used when the local router is unsure.
+    """
+    response = llm_nano.invoke([SystemMessage(content=ROUTER_PROMPT), HumanMessage(content=text)])
+    return response.content
+
+async def allm_route(text: str) -> str:
+    response = await llm_nano.ainvoke([SystemMessage(content=ROUTER_PROMPT), HumanMessage(content=text)])
+    return response.content
+
+def route_to_node(decision) -> Literal["breakfast_chef", "lunch_chef", "dinner_chef", "general_chat"]:
+    category = decision.label
+    print(f"Router classified the request as: {category} (via {decision.source})")
     
-    if "BREAKFAST" in category:
+    if category == "BREAKFAST":
         return "breakfast_chef"
-    elif "LUNCH" in category:
+    elif category == "LUNCH":
         return "lunch_chef"
-    elif "DINNER" in category:
+    elif category == "DINNER":
         return "dinner_chef"
     else:
         return "general_chat"
 
-def breakfast_chef_node(state: State):
-    if llm_mini is None: return {"messages": []}
+def router_node(state: State) -> Literal["breakfast_chef", "lunch_chef", "dinner_chef", "general_chat"]:
+    """
+    Acts as the Orchestrator. Analyzes the user's intent and routes to the appropriate chef.
+    The local intent router decides most requests; the LLM is only asked when it is unsure.
+    """
+    last_message = state["messages"][-1]
+    decision = intent_router.route(last_message.content, llm_route)
+    return route_to_node(decision)
+
+async def arouter_node(state: State) -> Literal["breakfast_chef", "lunch_chef", "dinner_chef", "general_chat"]:
+    last_message = state["messages"][-1]
+    decision = await speculator.aroute(
+        intent_router, last_message, allm_route, speculative_chefs(state)
+    )
+    return route_to_node(decision)
+
+def speculative_chefs(state: State) -> dict:
+    """
+    The first-draft chef calls the router may start before the LLM router has answered, keyed by route label.
+    """
+    return {
+        "BREAKFAST": ("breakfast_chef", lambda: llm_mini.ainvoke(build_chef_prompt(state, BREAKFAST_CHEF_PROMPT))),
+        "LUNCH": ("lunch_chef", lambda: llm_mini.ainvoke(build_chef_prompt(state, LUNCH_CHEF_PROMPT))),
+        "DINNER": ("dinner_chef", lambda: llm_dinner.ainvoke(build_chef_prompt(state, DINNER_CHEF_PROMPT))),
+    }
+
+# --- Chef Prompts ---
+BREAKFAST_CHEF_PROMPT = "You are a specialist Breakfast Chef. Provide a delicious and energetic breakfast recipe based on the user's request. Focus on morning ingredients."
+LUNCH_CHEF_PROMPT = "You are a specialist Lunch Chef. Provide a balanced and quick lunch recipe based on the user's request. Focus on midday sustenance."
+DINNER_CHEF_PROMPT = "You are a specialist Dinner Chef. Provide a comforting and substantial dinner recipe based on the user's request. Focus on evening relaxation and flavor."
+
+def build_chef_prompt(state: State, system_prompt: str) -> list[BaseMessage]:
+    """
+    First drafts only see the user's request. Revisions see the original request,
+    the last recipe and the inspector's critique (REVISION_MODE=compact, the default),
+    or the whole conversation (REVISION_MODE=full).
+    """
     messages = state["messages"]
-    
-    # If we are looping back, the last message will be from the inspector.
-    # We need to ensure the context is preserved.
-    
-    prompt = [
-        SystemMessage(content="You are a specialist Breakfast Chef. Provide a delicious and energetic breakfast recipe based on the user's request. Focus on morning ingredients."),
-    ] + messages # Pass full history so the chef sees the critique
-    
-    response = llm_mini.invoke(prompt)
-    return {"messages": [AIMessage(content=f"**Breakfast Chef:**\n{response.content}")], "active_chef": "breakfast_chef"}
+    if not is_revision(state):
+        return [SystemMessage(content=system_prompt), messages[-1]]
+    if REVISION_MODE == "full":
+        return [SystemMessage(content=system_prompt)] + messages
+    return [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=state["request"]),
+        AIMessage(content=state["recipe"]),
+        messages[-1], # The inspector's critique
+    ]
+
+def is_revision(state: State) -> bool:
+    return getattr(state["messages"][-1], "name", None) == "inspector"
+
+def record_chef_turn(state: State, chef: str, response, violation: Optional[str] = None) -> dict:
+    """
+    Builds the chef's state update, resetting the loop bookkeeping on a first draft.
+    A draft stopped by the streaming inspection carries its failing verdict; any other draft is left to the inspector.
+    """
+    revising = is_revision(state)
+    content = f"**{chef.replace('_', ' ').title()}:**\n{response.content}"
+    verdict = None
+    if violation is not None:
+        verdict = {"passed": False, "offending_ingredients": [violation], "source": "stream"}
+        print(f"\n[Inspector]: Butter detected while the chef was writing ({violation})! Stopping the draft and sending it back for revision...")
+    update = {
+        "messages": [AIMessage(content=content)],
+        "active_chef": chef,
+        "recipe": content,
+        "verdict": verdict,
+        "usage": (state.get("usage", []) if revising else []) + [usage_entry(state.get("revisions", 0) if revising else 0, chef, response)],
+    }
+    if not revising:
+        update["request"] = state["messages"][-1].content
+        update["revisions"] = 0
+    return update
+
+def usage_entry(iteration: int, node: str, response) -> dict:
+    usage = getattr(response, "usage_metadata", None) or {}
+    return {
+        "iteration": iteration,
+        "node": node,
+        "input_tokens": usage.get("input_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+        "estimated": bool(getattr(response, "response_metadata", {}).get("usage_estimated")),
+    }
+
+# --- Streaming Inspection ---
+# A list item (bullet or numbered): ingredient lines, and steps that add an ingredient
+LIST_ITEM = re.compile(r"^\s*(?:[-*\u2022]|\d+[.)])\s+")
+
+# Mentions that are not a use of butter (or not butter at all); these drafts are left to the inspector
+NOT_BUTTER = re.compile(
+    r"\b(?:no|not|without|instead|substitute|replace[sd]?|swap|vegan|plant-based|peanut|almond|cashew|nut|seed|apple|cocoa|shea)\b|butter-free",
+    re.IGNORECASE,
+)
+
+def forbidden_line(line: str) -> Optional[str]:
+    """
+    Returns the ingredient if a finished recipe line clearly uses butter, otherwise None.
+    Only clear uses stop a draft early; anything doubtful is still checked by the inspector once the draft is done.
+    """
+    if LIST_ITEM.match(line) and BUTTER_MENTION.search(line) and not NOT_BUTTER.search(line):
+        return LIST_ITEM.sub("", line).strip()
+    return None
+
+class DraftScanner:
+    """
+    Checks a chef's token deltas one finished line at a time, so a word split across deltas
+    (butter / butternut) is only judged once complete. `violation` holds the first offending ingredient.
+    """
+    def __init__(self):
+        self.text = ""
+        self.violation: Optional[str] = None
+        self._scanned = 0
+
+    def feed(self, chunk: AIMessageChunk) -> Optional[str]:
+        if not isinstance(chunk.content, str) or not chunk.content:
+            return self.violation
+        self.text += chunk.content
+        end = self.text.rfind("\n")
+        if end >= self._scanned:
+            for line in self.text[self._scanned:end].splitlines():
+                self.violation = self.violation or forbidden_line(line)
+            self._scanned = end + 1
+        return self.violation
+
+def merge_chunks(response: Optional[AIMessageChunk], chunk: AIMessageChunk) -> AIMessageChunk:
+    return chunk if response is None else response + chunk
+
+def stopped_draft(response: Optional[AIMessageChunk], messages: list[BaseMessage]) -> AIMessageChunk:
+    """
+    The partial draft of a stopped generation. The provider never reports usage for it, but the
+    whole prompt was billed, so both counts are estimated and flagged as such in `response_metadata`.
+    """
+    response = response or AIMessageChunk(content="")
+    input_tokens = count_tokens_approximately(messages)
+    output_tokens = count_tokens_approximately([AIMessage(content=response.content)]) if response.content else 0
+    response.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+    response.response_metadata["usage_estimated"] = True
+    return response
+
+def stream_chef(model: LazyChatModel, messages: list[BaseMessage]) -> tuple[AIMessage, Optional[str]]:
+    """
+    Streams a chef's draft through the DraftScanner. Closing the stream at the first violation
+    closes the HTTP response, which cancels the rest of the generation.
+    """
+    scanner, response = DraftScanner(), None
+    with closing(model.stream(messages)) as chunks:
+        for chunk in chunks:
+            response = merge_chunks(response, chunk)
+            if scanner.feed(chunk):
+                return stopped_draft(response, messages), scanner.violation
+    return response, None
+
+async def astream_chef(model: LazyChatModel, messages: list[BaseMessage]) -> tuple[AIMessage, Optional[str]]:
+    scanner, response = DraftScanner(), None
+    chunks = model.astream(messages)
+    try:
+        async for chunk in chunks:
+            response = merge_chunks(response, chunk)
+            if scanner.feed(chunk):
+                return stopped_draft(response, messages), scanner.violation
+    finally:
+        await chunks.aclose()
+    return response, None
+
+def chef_call(state: State, model: LazyChatModel, system_prompt: str) -> tuple[AIMessage, Optional[str]]:
+    """
+    Runs a chef; returns its draft and, with streaming inspection, the ingredient that stopped it.
+    """
+    messages = build_chef_prompt(state, system_prompt)
+    if INSPECTION_MODE == "streaming":
+        return stream_chef(model, messages)
+    return model.invoke(messages), None
+
+def breakfast_chef_node(state: State):
+    response, violation = chef_call(state, llm_mini, BREAKFAST_CHEF_PROMPT)
+    return record_chef_turn(state, "breakfast_chef", response, violation)
 
 def lunch_chef_node(state: State):
-    if llm_mini is None: return {"messages": []}
-    messages = state["messages"]
-    
-    prompt = [
-        SystemMessage(content="You are a specialist Lunch Chef. Provide a balanced and quick lunch recipe based on the user's request. Focus on midday sustenance."),
-    ] + messages
-    
-    response = llm_mini.invoke(prompt)
-    return {"messages": [AIMessage(content=f"**Lunch Chef:**\n{response.content}")], "active_chef": "lunch_chef"}
+    response, violation = chef_call(state, llm_mini, LUNCH_CHEF_PROMPT)
+    return record_chef_turn(state, "lunch_chef", response, violation)
 
 def dinner_chef_node(state: State):
-    if llm_dinner is None: return {"messages": []}
-    messages = state["messages"]
-    
-    prompt = [
-        SystemMessage(content="You are a specialist Dinner Chef. Provide a comforting and substantial dinner recipe based on the user's request. Focus on evening relaxation and flavor."),
-    ] + messages
-    
-    response = llm_dinner.invoke(prompt)
-    return {"messages": [AIMessage(content=f"**Dinner Chef:**\n{response.content}")], "active_chef": "dinner_chef"}
+    response, violation = chef_call(state, llm_dinner, DINNER_CHEF_PROMPT)
+    return record_chef_turn(state, "dinner_chef", response, violation)
+
+async def achef_call(state: State, chef: str, model: LazyChatModel, system_prompt: str) -> tuple[AIMessage, Optional[str]]:
+    """
+    Runs a chef, picking up a speculative first draft if the router already started one.
+    That draft is already complete, so it goes to the inspector as usual.
+    """
+    response = await speculator.claim(chef, state["messages"][-1])
+    if response is not None:
+        return response, None
+    messages = build_chef_prompt(state, system_prompt)
+    if INSPECTION_MODE == "streaming":
+        return await astream_chef(model, messages)
+    return await model.ainvoke(messages), None
+
+async def abreakfast_chef_node(state: State):
+    response, violation = await achef_call(state, "breakfast_chef", llm_mini, BREAKFAST_CHEF_PROMPT)
+    return record_chef_turn(state, "breakfast_chef", response, violation)
+
+async def alunch_chef_node(state: State):
+    response, violation = await achef_call(state, "lunch_chef", llm_mini, LUNCH_CHEF_PROMPT)
+    return record_chef_turn(state, "lunch_chef", response, violation)
+
+async def adinner_chef_node(state: State):
+    response, violation = await achef_call(state, "dinner_chef", llm_dinner, DINNER_CHEF_PROMPT)
+    return record_chef_turn(state, "dinner_chef", response, violation)
 
 def general_chat_node(state: State):
-    if llm_nano is None: return {"messages": []}
-    messages = state["messages"]
-    response = llm_nano.invoke(messages)
+    response = llm_nano.invoke(with_summary(state))
+    return {"messages": [response], "active_chef": "general_chat"}
+
+async def ageneral_chat_node(state: State):
+    response = await llm_nano.ainvoke(with_summary(state))
     return {"messages": [response], "active_chef": "general_chat"}
 
-def inspector_node(state: State) -> Literal["breakfast_chef", "lunch_chef", "dinner_chef", "__end__"]:
+class InspectionVerdict(BaseModel):
+    """Structured result of a single butter inspection."""
+    passed: bool = Field(description="True if the recipe does not use butter as an ingredient.")
+    offending_ingredients: list[str] = Field(default_factory=list, description="Ingredients that contain butter.")
+
+# Any mention of butter (but not butternut or buttermilk) needs a closer look; everything else passes outright.
+BUTTER_MENTION = re.compile(r"\bbutter(?:s|y|ed)?\b", re.IGNORECASE)
+
+INSPECTOR_PROMPT = "You are a strict health inspector. Check the following recipe for the ingredient 'butter'. Fail it only if butter is actually used as an ingredient, and list the offending ingredients."
+
+def prefilter_recipe(recipe: str) -> Optional[dict]:
     """
-    Inspects the recipe for butter. If found, sends it back to the active chef.
+    Returns a passing verdict when no model call is needed, otherwise None.
+    Recipes that never mention butter pass outright.
     """
-    if llm_nano is None: return END
-    
-    messages = state["messages"]
-    last_message = messages[-1]
-    active_chef = state.get("active_chef")
-    
-    if active_chef == "general_chat":
-        return END
+    if not BUTTER_MENTION.search(recipe):
+        return {"passed": True, "offending_ingredients": [], "source": "prefilter"}
+    return None
 
-    # Check for butter using LLM
-    prompt = [
-        SystemMessage(content="You are a strict health inspector. Check the following recipe for the ingredient 'butter'. If it contains butter, respond with 'CONTAINS_BUTTER'. If it does not, respond with 'PASS'."),
-        last_message
-    ]
-    response = llm_nano.invoke(prompt)
-    result = response.content.strip().upper()
-    
-    if "CONTAINS_BUTTER" in result:
-        print("\n[Inspector]: Butter detected! Sending back for revision...")
-        return active_chef # Route back to the chef who created it
+def parse_inspection(result: dict) -> tuple[dict, AIMessage]:
+    verdict = result["parsed"] or InspectionVerdict(passed=False)
+    return {**verdict.model_dump(), "source": "llm"}, result["raw"]
+
+def inspect_recipe(recipe: str) -> tuple[dict, Optional[AIMessage]]:
+    """
+    Returns a verdict dict (passed, offending_ingredients, source) and the raw model response, if any.
+    """
+    verdict = prefilter_recipe(recipe)
+    if verdict is not None:
+        return verdict, None
+    inspector = llm_nano.with_structured_output(InspectionVerdict, include_raw=True)
+    return parse_inspection(inspector.invoke([SystemMessage(content=INSPECTOR_PROMPT), HumanMessage(content=recipe)]))
+
+async def ainspect_recipe(recipe: str) -> tuple[dict, Optional[AIMessage]]:
+    verdict = prefilter_recipe(recipe)
+    if verdict is not None:
+        return verdict, None
+    inspector = llm_nano.with_structured_output(InspectionVerdict, include_raw=True)
+    return parse_inspection(await inspector.ainvoke([SystemMessage(content=INSPECTOR_PROMPT), HumanMessage(content=recipe)]))
+
+def inspector_node(state: State):
+    """
+    Inspects the latest recipe for butter exactly once and stores the verdict in the state.
+    """
+    verdict, raw = inspect_recipe(state["messages"][-1].content)
+    return record_inspection(state, verdict, raw)
+
+async def ainspector_node(state: State):
+    verdict, raw = await ainspect_recipe(state["messages"][-1].content)
+    return record_inspection(state, verdict, raw)
+
+def record_inspection(state: State, verdict: dict, raw: Optional[AIMessage]) -> dict:
+    if verdict["passed"]:
+        print(f"\n[Inspector]: Recipe passed (no butter, via {verdict['source']}).")
     else:
-        print("\n[Inspector]: Recipe passed (no butter).")
-        return END
+        print(f"\n[Inspector]: Butter detected ({', '.join(verdict['offending_ingredients'])})! Sending back for revision...")
+    update = {"verdict": verdict}
+    if raw is not None:
+        update["usage"] = state.get("usage", []) + [usage_entry(state.get("revisions", 0), "inspector", raw)]
+    return update
 
 def inspector_feedback_node(state: State):
     # This node just adds the feedback message to the state before routing back
-    return {"messages": [HumanMessage(content="The inspector found butter in your recipe. Please rewrite the recipe WITHOUT using butter.")]}
+    offending = state["verdict"]["offending_ingredients"]
+    details = f" (offending ingredients: {', '.join(offending)})" if offending else ""
+    return {
+        "messages": [HumanMessage(content=f"The inspector found butter in your recipe{details}. Please rewrite the recipe WITHOUT using butter.", name="inspector")],
+        "revisions": state.get("revisions", 0) + 1,
+    }
+
+def revision_limit_node(state: State):
+    """
+    Graceful exit once MAX_REVISIONS is reached: keep the last draft and say why it was not approved.
+    """
+    offending = ", ".join(state["verdict"]["offending_ingredients"]) or "butter"
+    print(f"\n[Inspector]: Giving up after {state['revisions']} revisions.")
+    return {"messages": [AIMessage(content=f"**Inspector:**\nThe recipe above still contains {offending} after {state['revisions']} revisions. Please substitute it yourself (e.g. olive oil or a plant-based spread).")]}
+
+def compact_history_node(state: State):
+    """
+    Runs first on every turn: folds old turns into the running summary once the session is over budget.
+    """
+    return history.compact(state)
+
+async def acompact_history_node(state: State):
+    return await history.acompact(state)
 
 # --- Graph Construction ---
 graph_builder = StateGraph(State)
+graph_builder.add_node("compact_history", RunnableLambda(compact_history_node, afunc=acompact_history_node))
+graph_builder.add_edge(START, "compact_history")
 
 # Add nodes
-graph_builder.add_node("breakfast_chef", breakfast_chef_node)
-graph_builder.add_node("lunch_chef", lunch_chef_node)
-graph_builder.add_node("dinner_chef", dinner_chef_node)
-graph_builder.add_node("general_chat", general_chat_node)
+graph_builder.add_node("breakfast_chef", RunnableLambda(breakfast_chef_node, afunc=abreakfast_chef_node))
+graph_builder.add_node("lunch_chef", RunnableLambda(lunch_chef_node, afunc=alunch_chef_node))
+graph_builder.add_node("dinner_chef", RunnableLambda(dinner_chef_node, afunc=adinner_chef_node))
+graph_builder.add_node("general_chat", RunnableLambda(general_chat_node, afunc=ageneral_chat_node))
+graph_builder.add_node("inspector", RunnableLambda(inspector_node, afunc=ainspector_node))
 graph_builder.add_node("inspector_feedback", inspector_feedback_node)
+graph_builder.add_node("revision_limit", revision_limit_node)
 
 # Add conditional edges from START
 graph_builder.add_conditional_edges(
-    START,
-    router_node,
+    "compact_history",
+    RunnableLambda(router_node, afunc=arouter_node),
     {
         "breakfast_chef": "breakfast_chef",
         "lunch_chef": "lunch_chef",
@@ -175,40 +440,25 @@ graph_builder.add_conditional_edges(
     }
 )
 
-# Define the routing logic for the inspector
+# The inspector routes on the stored verdict instead of re-checking the recipe
 def inspector_router(state: State):
-    # We duplicate the logic here because conditional_edges expects a function that returns the next node key
-    # But we also need to add the feedback message if we loop back.
-    # So we'll use a dedicated node 'inspector_feedback' to add the message, then route to chef.
-    
-    # Actually, let's do the check inside a conditional edge function directly.
-    if llm_nano is None: return END
-    
-    messages = state["messages"]
-    last_message = messages[-1]
-    active_chef = state.get("active_chef")
-    
-    if active_chef == "general_chat":
+    if state["verdict"]["passed"]:
         return END
+    if state.get("revisions", 0) >= MAX_REVISIONS:
+        return "revision_limit"
+    return "inspector_feedback"
 
-    prompt = [
-        SystemMessage(content="You are a strict health inspector. Check the following recipe for the ingredient 'butter'. If it contains butter, respond with 'CONTAINS_BUTTER'. If it does not, respond with 'PASS'."),
-        last_message
-    ]
-    response = llm_nano.invoke(prompt)
-    result = response.content.strip().upper()
-    
-    if "CONTAINS_BUTTER" in result:
-        print("\n[Inspector]: Butter detected! Sending back for revision...")
-        return "inspector_feedback"
-    else:
-        print("\n[Inspector]: Recipe passed (no butter).")
-        return END
+# Chefs go to the inspector, which runs once per chef output, unless the streaming inspection
+# already stopped the draft: then its verdict routes straight to the revision
+def chef_router(state: State):
+    if state.get("verdict") is None:
+        return "inspector"
+    return inspector_router(state)
 
-# Chefs go to the inspector router
-graph_builder.add_conditional_edges("breakfast_chef", inspector_router, {"inspector_feedback": "inspector_feedback", END: END})
-graph_builder.add_conditional_edges("lunch_chef", inspector_router, {"inspector_feedback": "inspector_feedback", END: END})
-graph_builder.add_conditional_edges("dinner_chef", inspector_router, {"inspector_feedback": "inspector_feedback", END: END})
+for chef in ("breakfast_chef", "lunch_chef", "dinner_chef"):
+    graph_builder.add_conditional_edges(chef, chef_router, {"inspector": "inspector", "inspector_feedback": "inspector_feedback", "revision_limit": "revision_limit"})
+graph_builder.add_conditional_edges("inspector", inspector_router, {"inspector_feedback": "inspector_feedback", "revision_limit": "revision_limit", END: END})
+graph_builder.add_edge("revision_limit", END)
 
 # General chat goes to END
 graph_builder.add_edge("general_chat", END)
@@ -227,28 +477,60 @@ graph_builder.add_conditional_edges(
     }
 )
 
-graph = graph_builder.compile()
+@lru_cache(maxsize=None)
+def get_graph():
+    """The compiled graph, built on first use like meal_agent's."""
+    return graph_builder.compile()
+
+def __getattr__(name: str):
+    # `meal_agent_no_butter.graph` (used by the runners) compiles on first access
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- Execution ---
-if __name__ == "__main__":
+async def main(stream_mode: str = "tokens"):
     print("Starting No-Butter Meal Agent...")
     print("Ask for a recipe (try asking for something with butter, like croissants or mashed potatoes)!")
     
     if not os.environ.get("OPENAI_API_KEY"):
         print("Please set OPENAI_API_KEY environment variable.")
 
+    # The model clients are built (and MODEL_PREWARM connections opened) while the user types the first prompt
+    warm_up = asyncio.create_task(awarm_up())
+
     while True:
         try:
-            user_input = input("\nUser: ")
+            user_input = await asyncio.to_thread(input, "\nUser: ")
+            # Done by the time the user has typed, usually; otherwise the turn waits for the clients it needs
+            await warm_up
             if user_input.lower() in ["quit", "exit", "q"]:
+                print(f"Router stats: {intent_router.stats()}")
+                if speculator.enabled:
+                    print(f"Speculation stats: {speculator.stats()}")
+                dump_metrics()
                 print("Goodbye!")
                 break
 
-            for event in graph.stream({"messages": [HumanMessage(content=user_input)]}):
+            inputs = {"messages": [HumanMessage(content=user_input)]}
+            if stream_mode == "tokens":
+                # Forward token deltas as they arrive, tagged with the producing node
+                await print_token_stream(get_graph(), inputs, metrics_config())
+                continue
+
+            usage = []
+            async for event in get_graph().astream(inputs, metrics_config()):
                 for key, value in event.items():
+                    value = value or {}
                     if "messages" in value:
                         for msg in value["messages"]:
                             print(f"\n{msg.content}")
+                    usage = value.get("usage", usage)
+
+            for entry in usage:
+                # Stopped drafts have no provider usage; their counts are estimates
+                approx = "~" if entry.get("estimated") else ""
+                print(f"[Tokens] iteration {entry['iteration']} {entry['node']}: {approx}{entry['input_tokens']} in / {approx}{entry['output_tokens']} out")
                     
         except KeyboardInterrupt:
             print("\nGoodbye!")
@@ -256,3 +538,9 @@ if __name__ == "__main__":
         except Exception as e:
             print(f"An error occurred: {e}")
             break
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stream-mode", choices=["tokens", "nodes"], default="tokens",
+                        help="Print token deltas as they arrive (default) or whole node outputs")
+    asyncio.run(main(parser.parse_args().stream_mode))
@@ -0,0 +1,291 @@
+"""
+Latency, token and cost metrics.
+
+A process-wide registry that the framework hooks (LangGraph callbacks,
+PydanticAI run/tool wrappers) report into. Every record carries its kind
+(node, edge, llm, agent, tool), name, model, wall time, queue time and token
+counts. Records are aggregated into fixed-bucket histograms so memory stays
+constant, summarized as p50/p95/p99, exported as Prometheus text and, when
+METRICS_JSONL is set, appended one JSON line per record. The lines are
+written by a background thread, so recording never does file I/O on the
+caller's thread (often the event loop); `flush()` waits for them, and runs
+at exit.
+
+Costs are estimates from MODEL_PRICES (USD per million input/output tokens).
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# --- Pricing ---
+# USD per 1M (input, output) tokens. Unknown models are counted at zero cost.
+MODEL_PRICES = {
+    "gpt-5": (1.25, 10.00),
+    "gpt-5-mini": (0.25, 2.00),
+    "gpt-5-nano": (0.05, 0.40),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+
+
+def normalize_model(model: Optional[str]) -> str:
+    """'openai:gpt-5-nano' and 'gpt-5-nano-2025-08-07' both become 'gpt-5-nano'."""
+    name = (model or "").split(":")[-1]
+    for known in sorted(MODEL_PRICES, key=len, reverse=True):
+        if name == known or name.startswith(known + "-2"):
+            return known
+    return name
+
+
+def estimate_cost(model: Optional[str], input_tokens: int, output_tokens: int) -> float:
+    price_in, price_out = MODEL_PRICES.get(normalize_model(model), (0.0, 0.0))
+    return (input_tokens * price_in + output_tokens * price_out) / 1_000_000
+
+
+# --- Histograms ---
+# Seconds; the same buckets serve wall and queue time.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimated quantile, interpolating linearly inside the bucket that holds it (clamped to the observed range)."""
+        if not self.total:
+            return 0.0
+        rank = q * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = max(BUCKETS[i - 1] if i else 0.0, self.min)
+                upper = min(BUCKETS[i], self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+
+class Series:
+    """Everything recorded for one (kind, name, model)."""
+
+    def __init__(self):
+        self.wall = Histogram()
+        self.queue = Histogram()
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+        self.errors = 0
+
+
+# --- Registry ---
+class Metrics:
+    def __init__(self, jsonl_path: Optional[str] = None, enabled: bool = True):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self._series: dict[tuple[str, str, str], Series] = {}
+        self._lock = threading.Lock()
+        # JSONL lines waiting for the writer thread, which is started by the first one
+        self._pending: "queue.Queue[str]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+
+    def record(
+        self,
+        kind: str,
+        name: str,
+        wall_s: float,
+        queue_s: float = 0.0,
+        model: Optional[str] = None,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+        error: bool = False,
+    ):
+        if not self.enabled:
+            return
+        model = normalize_model(model)
+        cost = estimate_cost(model, input_tokens, output_tokens)
+        with self._lock:
+            series = self._series.setdefault((kind, name, model), Series())
+            series.wall.observe(wall_s)
+            series.queue.observe(queue_s)
+            series.input_tokens += input_tokens
+            series.output_tokens += output_tokens
+            series.cost += cost
+            series.errors += int(error)
+        if self.jsonl_path:
+            self._pending.put(json.dumps({
+                "ts": time.time(), "kind": kind, "name": name, "model": model,
+                "wall_s": round(wall_s, 6), "queue_s": round(queue_s, 6),
+                "input_tokens": input_tokens, "output_tokens": output_tokens,
+                "cost_usd": round(cost, 8), "error": error,
+            }) + "\n")
+            if self._writer is None:
+                self._start_writer()
+
+    def _start_writer(self):
+        with self._lock:
+            if self._writer is not None:
+                return
+            self._writer = threading.Thread(target=self._write_lines, name="metrics-jsonl", daemon=True)
+            self._writer.start()
+        atexit.register(self.flush)
+
+    def _write_lines(self):
+        while True:
+            lines = [self._pending.get()]
+            # Whatever queued up meanwhile goes out in the same write
+            while True:
+                try:
+                    lines.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.jsonl_path, "a") as f:
+                    f.writelines(lines)
+            except OSError as e:
+                print(f"metrics: could not write {self.jsonl_path}: {e}")
+            finally:
+                for _ in lines:
+                    self._pending.task_done()
+
+    def flush(self):
+        """Blocks until every JSONL line recorded so far is written."""
+        if self._writer is not None:
+            self._pending.join()
+
+    @contextmanager
+    def span(self, kind: str, name: str, model: Optional[str] = None, queued_at: Optional[float] = None):
+        """
+        Times the block. `queued_at` (a time.perf_counter() value) is when the work became
+        ready; the wait until the block starts is recorded as queue time. Report tokens with
+        `span.usage(input_tokens, output_tokens)`.
+        """
+        span = Span(model)
+        start = time.perf_counter()
+        error = False
+        try:
+            yield span
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.record(
+                kind, name, time.perf_counter() - start,
+                queue_s=max(0.0, start - queued_at) if queued_at is not None else 0.0,
+                model=span.model, input_tokens=span.input_tokens, output_tokens=span.output_tokens,
+                error=error,
+            )
+
+    # --- Export ---
+    def summary(self) -> list[dict]:
+        """One row per (kind, name, model), slowest total time first."""
+        with self._lock:
+            items = list(self._series.items())
+        rows = []
+        for (kind, name, model), s in items:
+            rows.append({
+                "kind": kind, "name": name, "model": model, "calls": s.wall.total, "errors": s.errors,
+                "p50_s": round(s.wall.quantile(0.50), 4), "p95_s": round(s.wall.quantile(0.95), 4),
+                "p99_s": round(s.wall.quantile(0.99), 4), "total_s": round(s.wall.sum, 4),
+                "queue_p95_s": round(s.queue.quantile(0.95), 4),
+                "input_tokens": s.input_tokens, "output_tokens": s.output_tokens, "cost_usd": round(s.cost, 6),
+            })
+        return sorted(rows, key=lambda r: r["total_s"], reverse=True)
+
+    def report(self) -> str:
+        """A plain-text table of `summary()`."""
+        header = f"{'kind':<6} {'name':<22} {'model':<14} {'calls':>5} {'p50_s':>8} {'p95_s':>8} {'p99_s':>8} {'queue95':>8} {'in_tok':>8} {'out_tok':>8} {'cost_usd':>10}"
+        lines = [header]
+        for r in self.summary():
+            lines.append(
+                f"{r['kind']:<6} {r['name'][:22]:<22} {r['model'][:14]:<14} {r['calls']:>5} {r['p50_s']:>8.3f} {r['p95_s']:>8.3f} "
+                f"{r['p99_s']:>8.3f} {r['queue_p95_s']:>8.3f} {r['input_tokens']:>8} {r['output_tokens']:>8} {r['cost_usd']:>10.6f}"
+            )
+        return "\n".join(lines)
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition format."""
+        with self._lock:
+            items = list(self._series.items())
+        out = []
+
+        def histogram(metric: str, help_text: str, attr: str):
+            out.append(f"# HELP {metric} {help_text}")
+            out.append(f"# TYPE {metric} histogram")
+            for (kind, name, model), s in items:
+                h = getattr(s, attr)
+                labels = f'kind="{kind}",name="{name}",model="{model}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS, h.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    out.append(f'{metric}_bucket{{{labels},le="{le}"}} {cumulative}')
+                out.append(f"{metric}_sum{{{labels}}} {h.sum}")
+                out.append(f"{metric}_count{{{labels}}} {h.total}")
+
+        def counter(metric: str, help_text: str, value, extra: str = ""):
+            out.append(f"# HELP {metric} {help_text}")
+            out.append(f"# TYPE {metric} counter")
+            for (kind, name, model), s in items:
+                out.append(f'{metric}{{kind="{kind}",name="{name}",model="{model}"{extra}}} {value(s)}')
+
+        histogram("agent_wall_seconds", "Wall time per node, edge, model call, agent run or tool call.", "wall")
+        histogram("agent_queue_seconds", "Time spent ready but not yet started.", "queue")
+        counter("agent_input_tokens_total", "Input tokens.", lambda s: s.input_tokens)
+        counter("agent_output_tokens_total", "Output tokens.", lambda s: s.output_tokens)
+        counter("agent_cost_usd_total", "Estimated cost in USD.", lambda s: s.cost)
+        counter("agent_errors_total", "Calls that raised.", lambda s: s.errors)
+        return "\n".join(out) + "\n"
+
+    def write_prometheus(self, path: str):
+        with open(path, "w") as f:
+            f.write(self.prometheus())
+
+
+class Span:
+    def __init__(self, model: Optional[str] = None):
+        self.model = model
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def usage(self, input_tokens: int = 0, output_tokens: int = 0, model: Optional[str] = None):
+        self.input_tokens += input_tokens or 0
+        self.output_tokens += output_tokens or 0
+        if model:
+            self.model = model
+
+
+# METRICS=0 turns recording off; METRICS_JSONL appends every record to a file.
+metrics = Metrics(jsonl_path=os.environ.get("METRICS_JSONL"), enabled=os.environ.get("METRICS", "1") != "0")
+
+
+def dump_metrics():
+    """Prints the summary table and writes METRICS_PROM (Prometheus text) when set. Called when a REPL exits."""
+    metrics.flush()
+    if not metrics.summary():
+        return
+    print(metrics.report())
+    if os.environ.get("METRICS_PROM"):
+        metrics.write_prometheus(os.environ["METRICS_PROM"])
@@ -0,0 +1,181 @@
+"""
+Shared model registry.
+
+Modules declare their models with `chat_model("gpt-5-nano", temperature=0.7)`
+instead of building ChatOpenAI at import time. The declaration is a cheap
+stand-in: the real ChatOpenAI is built on first use (the first invoke,
+ainvoke, with_structured_output, ...), once per process for each model and
+settings, on the provider's shared HTTP pool (http_pool.py). Importing an agent
+module therefore opens nothing, and every module asking for the same model
+gets the same client.
+
+Entry points (the runners, the HTTP server) call `aprewarm()` on startup. It
+builds every declared client, importing langchain_openai on the way, so the
+first turn does not pay for that. langchain_openai is the slowest import of an
+agent, which is why it is deferred until then; the interactive agents run the
+same warm-up in the background (`awarm_up()`) while the user types the first
+prompt. With MODEL_PREWARM=<n> it also opens n keep-alive connections to each
+provider ahead of the first request, so the first turn skips the TCP and TLS
+handshakes too (0, the default, opens none).
+"""
+import asyncio
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Optional
+
+from cassette import get_cassette
+from http_pool import aprewarm as aprewarm_pool
+from http_pool import get_async_http_client, get_http_client
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+
+
+def _client_class() -> type:
+    # Imported on first use: langchain_openai (and the openai SDK) take longer to import than the rest of an agent
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI
+
+
+class LazyChatModel:
+    """
+    Stands in for a ChatOpenAI until it is first used. `model_name` is known
+    up front; calling a model method builds (or fetches) the shared client.
+
+    The common methods are defined here rather than left to `__getattr__`:
+    RunnableLambda inspects the functions it wraps and reads attributes such
+    as `llm.invoke` while the graph is built, which must not build a client.
+    """
+
+    def __init__(self, registry: "ModelRegistry", model: str, provider: str, params: dict):
+        self._registry = registry
+        self._key = (provider, model, tuple(sorted(params.items())))
+        self.model_name = model
+        self.provider = provider
+
+    @property
+    def client(self) -> "ChatOpenAI":
+        return self._registry.get(self._key)
+
+    def invoke(self, *args, **kwargs):
+        return self.client.invoke(*args, **kwargs)
+
+    async def ainvoke(self, *args, **kwargs):
+        return await self.client.ainvoke(*args, **kwargs)
+
+    def stream(self, *args, **kwargs):
+        return self.client.stream(*args, **kwargs)
+
+    def astream(self, *args, **kwargs):
+        return self.client.astream(*args, **kwargs)
+
+    def with_structured_output(self, *args, **kwargs):
+        return self.client.with_structured_output(*args, **kwargs)
+
+    def bind_tools(self, *args, **kwargs):
+        return self.client.bind_tools(*args, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def __repr__(self) -> str:
+        return f"LazyChatModel({self.model_name!r}, provider={self.provider!r})"
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._declared: dict[tuple, LazyChatModel] = {}
+        self._clients: dict[tuple, "ChatOpenAI"] = {}
+
+    def chat_model(self, model: str, provider: str = "openai", **params) -> LazyChatModel:
+        """Declares a chat model without building it; equal declarations share one client."""
+        lazy = LazyChatModel(self, model, provider, params)
+        with self._lock:
+            return self._declared.setdefault(lazy._key, lazy)
+
+    def get(self, key: tuple) -> "ChatOpenAI":
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = self._build(*key)
+            return self._clients[key]
+
+    def _build(self, provider: str, model: str, params: tuple) -> "ChatOpenAI":
+        try:
+            return _client_class()(
+                model=model,
+                http_client=get_http_client(provider),
+                http_async_client=get_async_http_client(provider),
+                **dict(params),
+            )
+        except Exception as e:
+            print(f"Error initializing ChatOpenAI model {model}: {e}")
+            raise
+
+    def stats(self) -> dict:
+        return {"declared": len(self._declared), "built": len(self._clients)}
+
+    # --- Pre-warming ---
+    def build_all(self) -> dict[str, tuple[str, dict]]:
+        """
+        Builds every declared client (skipping any that fail, which `_build` reports).
+        Returns each provider's models URL and auth headers for pre-warming.
+        """
+        targets = {}
+        for key, lazy in list(self._declared.items()):
+            try:
+                client = self.get(key)
+            except Exception:
+                continue
+            # The OpenAI SDK client resolves OPENAI_BASE_URL / OPENAI_API_KEY like the model calls do
+            sdk = client.root_async_client
+            base_url = str(sdk.base_url).rstrip("/")
+            targets.setdefault(lazy.provider, (f"{base_url}/models", {"Authorization": f"Bearer {sdk.api_key}"}))
+        return targets
+
+    async def aprewarm(self, connections: Optional[int] = None) -> int:
+        """
+        Builds every declared client in a thread (importing the client library
+        on the way), then opens `connections` (default MODEL_PREWARM) keep-alive
+        connections per provider on the async pool. Returns the number of
+        connections warmed. Nothing goes over the network when model calls come
+        from a cassette.
+        """
+        targets = await asyncio.to_thread(self.build_all)
+        connections = _connections() if connections is None else connections
+        if connections == 0 or get_cassette() is not None:
+            return 0
+        warmed = await asyncio.gather(*(
+            aprewarm_pool(url, connections, provider=provider, headers=headers)
+            for provider, (url, headers) in targets.items()
+        ))
+        print(f"Pre-warmed {sum(warmed)} connection(s) for {len(targets)} provider(s)")
+        return sum(warmed)
+
+    async def awarm_up(self) -> int:
+        """
+        `aprewarm` for interactive startup: started as a background task before
+        the first prompt, it runs while the user types instead of delaying the
+        first reply, and only warns if it fails.
+        """
+        try:
+            return await self.aprewarm()
+        except Exception as e:
+            print(f"Warning: model warm-up failed: {e}")
+            return 0
+
+
+def _connections() -> int:
+    return int(os.environ.get("MODEL_PREWARM", "0"))
+
+
+registry = ModelRegistry()
+chat_model = registry.chat_model
+aprewarm = registry.aprewarm
+awarm_up = registry.awarm_up
@@ -1,12 +1,24 @@
 import os
+import argparse
+import asyncio
+from functools import lru_cache
 from typing import Annotated, TypedDict, Literal
 
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, AIMessage
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 
+from history import build_history_compactor, with_summary
+from instrumentation import metrics_config
+from intent_router import build_recipe_router
+from metrics import dump_metrics
+from models import awarm_up, chat_model
+from response_cache import build_response_cache
+from speculation import build_speculator
+from streaming import print_token_stream
+
 # --- Configuration ---
 load_dotenv()
 
@@ -16,58 +28,100 @@ if not os.environ.get("OPENAI_API_KEY"):
 # --- State Definition ---
 class State(TypedDict):
     messages: Annotated[list[BaseMessage], add_messages]
+    summary: str # Running summary of the turns folded out of `messages`
 
 # --- LLM Setup ---
-try:
-    llm = ChatOpenAI(
-        model="gpt-3.5-turbo",
-        temperature=0.7,
-    )
-except Exception as e:
-    print(f"Error initializing ChatOpenAI: {e}")
-    llm = None
+# Declared here, built on first use on the shared HTTP pool (see models.py)
+llm = chat_model("gpt-3.5-turbo", temperature=0.7)
+
+# --- Conversation History ---
+# Older turns are folded into `summary` (by gpt-5-nano) so long sessions stay within HISTORY_MAX_TURNS / HISTORY_MAX_TOKENS.
+history = build_history_compactor()
+
+# --- Intent Router ---
+# Keyword rules + a small in-memory classifier; falls back to the LLM below LOCAL_ROUTER_THRESHOLD.
+intent_router = build_recipe_router()
+
+# --- Response Cache ---
+# Identical (or, with RESPONSE_CACHE_SIMILARITY, near-identical) requests reuse the master chef's recipe.
+response_cache = build_response_cache()
+
+# --- Speculative Chef ---
+# With SPECULATIVE_CHEF=1 the master chef starts while the LLM router is still deciding.
+speculator = build_speculator()
+
+CHEF_PROMPT = "You are a master chef. Provide a detailed recipe for the user's request."
 
 # --- Node Definitions ---
+# Every node has a sync and an async (ainvoke) implementation, registered together
+# so the compiled graph supports both invoke/stream and ainvoke/astream.
+
+ROUTER_PROMPT = "Is the following user input asking for a cooking recipe? Respond with 'YES' or 'NO'."
+
+def llm_route(text: str) -> str:
+    """
+    Asks the LLM whether the input is a recipe request. Only used when the local router is unsure.
+    """
+    response = llm.invoke([SystemMessage(content=ROUTER_PROMPT), HumanMessage(content=text)])
+    return "RECIPE" if "YES" in response.content.strip().upper() else "OTHER"
+
+async def allm_route(text: str) -> str:
+    response = await llm.ainvoke([SystemMessage(content=ROUTER_PROMPT), HumanMessage(content=text)])
+    return "RECIPE" if "YES" in response.content.strip().upper() else "OTHER"
 
 def route_request(state: State) -> Literal["chef", "general_chat"]:
-    if llm is None:
-        return "general_chat" # Fallback
-        
     messages = state["messages"]
     # Analyze the last message to determine intent
     last_message = messages[-1]
     
-    prompt = [
-        SystemMessage(content="Is the following user input asking for a cooking recipe? Respond with 'YES' or 'NO'."),
-        last_message
-    ]
-    response = llm.invoke(prompt)
-    
-    if "YES" in response.content.strip().upper():
+    decision = intent_router.route(last_message.content, llm_route)
+    if decision.label == "RECIPE":
         return "chef"
     return "general_chat"
 
-def chef_node(state: State):
-    if llm is None:
-        return {"messages": [SystemMessage(content="Error: LLM not initialized.")]}
+async def aroute_request(state: State) -> Literal["chef", "general_chat"]:
+    last_message = state["messages"][-1]
+    # Recipe requests are the common case, so speculate on the chef even when the local guess is OTHER
+    decision = await speculator.aroute(
+        intent_router, last_message, allm_route,
+        {"RECIPE": ("chef", lambda: acook(last_message))}, default_label="RECIPE",
+    )
+    if decision.label == "RECIPE":
+        return "chef"
+    return "general_chat"
 
+def chef_node(state: State):
     messages = state["messages"]
-    # The chef responds to the user's request
-    prompt = [
-        SystemMessage(content="You are a master chef. Provide a detailed recipe for the user's request."),
-        messages[-1]
-    ]
-    response = llm.invoke(prompt)
+    # The chef responds to the user's request, reusing a cached recipe when one exists
+    request = messages[-1]
+    recipe = response_cache.get_or_call(
+        "chef", llm.model_name, CHEF_PROMPT, request.content,
+        lambda: llm.invoke([SystemMessage(content=CHEF_PROMPT), request]).content,
+    )
     
     # Format the output to indicate who is speaking
-    content = f"**Master Chef:**\n{response.content}"
+    content = f"**Master Chef:**\n{recipe}"
     return {"messages": [AIMessage(content=content)]}
 
-def creative_chef_node(state: State):
-    if llm is None:
-        return {"messages": []}
+async def acook(request: BaseMessage) -> str:
+    """
+    Runs the master chef through the response cache, picking up a speculative call if the router started one.
+    """
+    speculated = await speculator.claim("chef", request)
+    if speculated is not None:
+        return speculated
 
-    messages = state["messages"]
+    async def call() -> str:
+        response = await llm.ainvoke([SystemMessage(content=CHEF_PROMPT), request])
+        return response.content
+
+    return await response_cache.aget_or_call("chef", llm.model_name, CHEF_PROMPT, request.content, call)
+
+async def achef_node(state: State):
+    recipe = await acook(state["messages"][-1])
+    return {"messages": [AIMessage(content=f"**Master Chef:**\n{recipe}")]}
+
+def creative_chef_prompt(messages: list[BaseMessage]) -> list[BaseMessage]:
     # messages[-1] is the Master Chef's recipe
     # messages[-2] is the User's request (assuming simple turn)
     # We pass the context to the creative chef
@@ -80,34 +134,51 @@ def creative_chef_node(state: State):
             user_request = msg.content
             break
             
-    prompt = [
+    return [
         SystemMessage(content="You are an experimental chef. The user asked for a recipe, and a master chef provided one. Your job is to suggest a creative, interesting variation or twist on that recipe. Be brief and focus on the modification."),
         HumanMessage(content=f"User Request: {user_request}\n\nOriginal Recipe: {original_recipe}")
     ]
-    response = llm.invoke(prompt)
+
+def creative_chef_node(state: State):
+    response = llm.invoke(creative_chef_prompt(state["messages"]))
     
     content = f"**Creative Chef:**\n{response.content}"
     return {"messages": [AIMessage(content=content)]}
 
+async def acreative_chef_node(state: State):
+    response = await llm.ainvoke(creative_chef_prompt(state["messages"]))
+    return {"messages": [AIMessage(content=f"**Creative Chef:**\n{response.content}")]}
+
 def general_chat_node(state: State):
-    if llm is None:
-        return {"messages": [SystemMessage(content="Error: LLM not initialized.")]}
-        
-    messages = state["messages"]
-    response = llm.invoke(messages)
+    response = llm.invoke(with_summary(state))
     return {"messages": [response]}
 
+async def ageneral_chat_node(state: State):
+    response = await llm.ainvoke(with_summary(state))
+    return {"messages": [response]}
+
+def compact_history_node(state: State):
+    """
+    Runs first on every turn: folds old turns into the running summary once the session is over budget.
+    """
+    return history.compact(state)
+
+async def acompact_history_node(state: State):
+    return await history.acompact(state)
+
 # --- Graph Construction ---
 graph_builder = StateGraph(State)
+graph_builder.add_node("compact_history", RunnableLambda(compact_history_node, afunc=acompact_history_node))
+graph_builder.add_edge(START, "compact_history")
 
-graph_builder.add_node("chef", chef_node)
-graph_builder.add_node("creative_chef", creative_chef_node)
-graph_builder.add_node("general_chat", general_chat_node)
+graph_builder.add_node("chef", RunnableLambda(chef_node, afunc=achef_node))
+graph_builder.add_node("creative_chef", RunnableLambda(creative_chef_node, afunc=acreative_chef_node))
+graph_builder.add_node("general_chat", RunnableLambda(general_chat_node, afunc=ageneral_chat_node))
 
-# Conditional routing from START
+# Conditional routing from compact_history
 graph_builder.add_conditional_edges(
-    START,
-    route_request,
+    "compact_history",
+    RunnableLambda(route_request, afunc=aroute_request),
     {
         "chef": "chef",
         "general_chat": "general_chat"
@@ -121,28 +192,53 @@ graph_builder.add_edge("chef", "creative_chef")
 graph_builder.add_edge("creative_chef", END)
 graph_builder.add_edge("general_chat", END)
 
-graph = graph_builder.compile()
+@lru_cache(maxsize=None)
+def get_graph():
+    """The compiled graph, built on first use like meal_agent's."""
+    return graph_builder.compile()
+
+def __getattr__(name: str):
+    # `recipe_agent.graph` (used by the runners) compiles on first access
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- Execution ---
-if __name__ == "__main__":
+async def main(stream_mode: str = "tokens"):
     print("Starting Recipe Agent...")
     print("Ask for a recipe to see the multi-agent interaction!")
     
     if not os.environ.get("OPENAI_API_KEY"):
         print("Please set OPENAI_API_KEY environment variable.")
 
+    # The model clients are built (and MODEL_PREWARM connections opened) while the user types the first prompt
+    warm_up = asyncio.create_task(awarm_up())
+
     while True:
         try:
-            user_input = input("\nUser: ")
+            user_input = await asyncio.to_thread(input, "\nUser: ")
+            # Done by the time the user has typed, usually; otherwise the turn waits for the clients it needs
+            await warm_up
             if user_input.lower() in ["quit", "exit", "q"]:
+                print(f"Router stats: {intent_router.stats()}")
+                print(f"Cache stats: {response_cache.stats()}")
+                if speculator.enabled:
+                    print(f"Speculation stats: {speculator.stats()}")
+                dump_metrics()
                 print("Goodbye!")
                 break
 
             # Stream the output
-            for event in graph.stream({"messages": [HumanMessage(content=user_input)]}):
+            inputs = {"messages": [HumanMessage(content=user_input)]}
+            if stream_mode == "tokens":
+                # Forward token deltas as they arrive, tagged with the producing node
+                await print_token_stream(get_graph(), inputs, metrics_config())
+                continue
+
+            async for event in get_graph().astream(inputs, metrics_config()):
                 for key, value in event.items():
                     # value["messages"] is a list of new messages
-                    for msg in value["messages"]:
+                    for msg in (value or {}).get("messages", []):
                         print(f"\n{msg.content}")
                     
         except KeyboardInterrupt:
@@ -151,3 +247,9 @@ if __name__ == "__main__":
         except Exception as e:
             print(f"An error occurred: {e}")
             break
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stream-mode", choices=["tokens", "nodes"], default="tokens",
+                        help="Print token deltas as they arrive (default) or whole node outputs")
+    asyncio.run(main(parser.parse_args().stream_mode))
@@ -0,0 +1,324 @@
+"""
+Response cache for chef nodes.
+
+Entries are keyed on (chef, model, system prompt hash, normalized request) and
+kept in a bounded in-memory LRU with a TTL. An optional SQLite file keeps them
+across restarts, and an optional embedding function lets near-duplicate
+requests ("pancakes for breakfast" / "breakfast pancakes please") share a hit.
+
+The chefs sample at a non-zero temperature, so a hit replays one recipe where
+a new call would give another: the cache is off unless RESPONSE_CACHE=1.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+# Recent request embeddings, so the `put` after a missed `get` does not embed the request again
+_RECENT_EMBEDDINGS = 64
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_request(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return _SPACE_RE.sub(" ", _PUNCTUATION_RE.sub(" ", text.lower())).strip()
+
+
+def _cosine(a: list[float], b: list[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+@dataclass
+class _Entry:
+    namespace: str
+    value: str
+    created: float
+    vector: Optional[list[float]] = None
+    size: int = field(default=0)
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache for generated responses.
+
+    Args:
+        max_entries: Maximum number of entries held in memory.
+        max_bytes: Approximate memory budget for keys, values and vectors.
+        ttl_seconds: Entries older than this are treated as misses.
+        path: Optional SQLite file that persists entries across restarts, capped at `max_entries` rows.
+        embed: Optional `text -> vector` function enabling near-duplicate lookups.
+        similarity: Minimum cosine similarity for a near-duplicate hit.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        max_bytes: int = 16 * 1024 * 1024,
+        ttl_seconds: float = 24 * 3600,
+        path: Optional[str] = None,
+        embed: Optional[Callable[[str], list[float]]] = None,
+        similarity: float = 0.92,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.embed = embed
+        self.similarity = similarity
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._embeddings: "OrderedDict[str, list[float]]" = OrderedDict()
+        self.counts = {"hits": 0, "semantic_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0, "embeddings": 0}
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, namespace TEXT, value TEXT, created REAL, vector TEXT)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+            self._prune_disk()
+            self._db.commit()
+            # Warm the LRU with the newest entries so near-duplicate lookups work after a restart
+            rows = self._db.execute(
+                "SELECT key, namespace, value, created, vector FROM responses ORDER BY created DESC LIMIT ?",
+                (max_entries,),
+            ).fetchall()
+            for key, namespace, value, created, vector in reversed(rows):
+                self._store(key, _Entry(namespace, value, created, json.loads(vector) if vector else None))
+
+    # --- Keys ---
+    @staticmethod
+    def namespace(chef: str, model: str, system_prompt: str) -> str:
+        prompt_hash = hashlib.sha256(system_prompt.encode()).hexdigest()[:16]
+        return f"{chef}|{model}|{prompt_hash}"
+
+    @staticmethod
+    def key(namespace: str, request: str) -> str:
+        return hashlib.sha256(f"{namespace}|{normalize_request(request)}".encode()).hexdigest()
+
+    # --- Lookup ---
+    def get(self, chef: str, model: str, system_prompt: str, request: str) -> Optional[str]:
+        namespace = self.namespace(chef, model, system_prompt)
+        key = self.key(namespace, request)
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                self.counts["hits"] += 1
+                return entry.value
+
+        if self.embed is not None:
+            vector = self._embed(request)
+            with self._lock:
+                entry = self._nearest(namespace, vector)
+                if entry is not None:
+                    self.counts["semantic_hits"] += 1
+                    return entry.value
+
+        with self._lock:
+            self.counts["misses"] += 1
+        return None
+
+    def _lookup(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if self._expired(entry):
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT namespace, value, created, vector FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        entry = _Entry(row[0], row[1], row[2], json.loads(row[3]) if row[3] else None)
+        if self._expired(entry):
+            return None
+        self.counts["disk_hits"] += 1
+        self._store(key, entry)
+        return entry
+
+    def _nearest(self, namespace: str, vector: list[float]) -> Optional[_Entry]:
+        best, best_score = None, self.similarity
+        for key, entry in list(self._entries.items()):
+            if entry.namespace != namespace or entry.vector is None:
+                continue
+            if self._expired(entry):
+                self._remove(key)
+                continue
+            score = _cosine(vector, entry.vector)
+            if score >= best_score:
+                best, best_score = key, score
+        if best is None:
+            return None
+        self._entries.move_to_end(best)
+        return self._entries[best]
+
+    # --- Storage ---
+    def put(self, chef: str, model: str, system_prompt: str, request: str, value: str):
+        namespace = self.namespace(chef, model, system_prompt)
+        key = self.key(namespace, request)
+        vector = self._embed(request) if self.embed is not None else None
+        entry = _Entry(namespace, value, time.time(), vector)
+        with self._lock:
+            self._store(key, entry)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    (key, namespace, value, entry.created, json.dumps(vector) if vector else None),
+                )
+                self._prune_disk()
+                self._db.commit()
+
+    def _embed(self, request: str) -> list[float]:
+        text = normalize_request(request)
+        with self._lock:
+            vector = self._embeddings.get(text)
+            if vector is not None:
+                self._embeddings.move_to_end(text)
+                return vector
+        vector = self.embed(text)
+        with self._lock:
+            self.counts["embeddings"] += 1
+            self._embeddings[text] = vector
+            while len(self._embeddings) > _RECENT_EMBEDDINGS:
+                self._embeddings.popitem(last=False)
+        return vector
+
+    def _prune_disk(self):
+        """Drops expired rows, then the oldest beyond `max_entries`. The caller commits."""
+        self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,))
+        removed = self._db.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        self.counts["disk_evictions"] += max(removed, 0)
+
+    def _store(self, key: str, entry: _Entry):
+        entry.size = len(key) + len(entry.value.encode()) + (len(entry.vector) * 8 if entry.vector else 0)
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.counts["evictions"] += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _expired(self, entry: _Entry) -> bool:
+        return time.time() - entry.created > self.ttl_seconds
+
+    # --- Helpers ---
+    def get_or_call(self, chef: str, model: str, system_prompt: str, request: str, call: Callable[[], str]) -> str:
+        """Return the cached response, or run `call()` and cache its result."""
+        cached = self.get(chef, model, system_prompt, request)
+        if cached is not None:
+            return cached
+        value = call()
+        self.put(chef, model, system_prompt, request, value)
+        return value
+
+    async def aget(self, chef: str, model: str, system_prompt: str, request: str) -> Optional[str]:
+        """`get` in a worker thread, since the embedding call and the SQLite reads block."""
+        return await asyncio.to_thread(self.get, chef, model, system_prompt, request)
+
+    async def aput(self, chef: str, model: str, system_prompt: str, request: str, value: str):
+        """`put` in a worker thread, since the embedding call and the SQLite writes block."""
+        await asyncio.to_thread(self.put, chef, model, system_prompt, request, value)
+
+    async def aget_or_call(
+        self, chef: str, model: str, system_prompt: str, request: str, call: Callable[[], Awaitable[str]]
+    ) -> str:
+        """Async variant of `get_or_call`; the lookups run off the event loop."""
+        cached = await self.aget(chef, model, system_prompt, request)
+        if cached is not None:
+            return cached
+        value = await call()
+        await self.aput(chef, model, system_prompt, request, value)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.counts["hits"] + self.counts["semantic_hits"]
+            total = hits + self.counts["misses"]
+            return {
+                **self.counts,
+                "hit_rate": hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+class NullCache(ResponseCache):
+    """Drop-in cache that never stores anything (the default, unless RESPONSE_CACHE=1)."""
+
+    def get(self, chef, model, system_prompt, request):
+        self.counts["misses"] += 1
+        return None
+
+    def put(self, chef, model, system_prompt, request, value):
+        pass
+
+    # Nothing blocks, so no worker thread
+    async def aget(self, chef, model, system_prompt, request):
+        return self.get(chef, model, system_prompt, request)
+
+    async def aput(self, chef, model, system_prompt, request, value):
+        pass
+
+
+def openai_embedder(model: str = "text-embedding-3-small") -> Callable[[str], list[float]]:
+    """
+    Embedding function backed by the OpenAI embeddings endpoint. The client sits on the shared
+    HTTP pool like the chat models, so it reuses their connections and cassettes record it too.
+    """
+    from openai import OpenAI
+
+    from http_pool import get_http_client
+
+    client = OpenAI(http_client=get_http_client("openai"))
+
+    def embed(text: str) -> list[float]:
+        return client.embeddings.create(model=model, input=text).data[0].embedding
+
+    return embed
+
+
+def build_response_cache() -> ResponseCache:
+    """
+    Builds the cache from environment variables:
+    RESPONSE_CACHE=1 enables it (it is off by default), RESPONSE_CACHE_PATH persists it to SQLite,
+    RESPONSE_CACHE_TTL / RESPONSE_CACHE_MAX_ENTRIES / RESPONSE_CACHE_MAX_BYTES bound it,
+    and RESPONSE_CACHE_SIMILARITY (e.g. 0.92) turns on embedding lookups.
+    """
+    if os.environ.get("RESPONSE_CACHE", "0") != "1":
+        return NullCache()
+    similarity = os.environ.get("RESPONSE_CACHE_SIMILARITY")
+    return ResponseCache(
+        max_entries=int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "512")),
+        max_bytes=int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+        ttl_seconds=float(os.environ.get("RESPONSE_CACHE_TTL", str(24 * 3600))),
+        path=os.environ.get("RESPONSE_CACHE_PATH"),
+        embed=openai_embedder() if similarity else None,
+        similarity=float(similarity) if similarity else 0.92,
+    )
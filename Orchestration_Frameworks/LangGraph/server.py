@@ -0,0 +1,187 @@
+"""
+HTTP front-end for the compiled graphs.
+
+Each graph is compiled with a LangGraph checkpointer, so a client only sends
+the new message plus a thread id and the conversation history is kept on the
+server. Checkpoints live in memory by default, or in SQLite when
+CHECKPOINT_DB is set.
+
+Endpoints:
+    GET  /graphs                          List the available graphs.
+    POST /graphs/{name}/invoke            {"message": "...", "thread_id": "..."} -> JSON reply.
+    POST /graphs/{name}/stream            Same body, replies with Server-Sent Events per node update,
+                                          or per token delta with {"mode": "tokens"}.
+    GET  /graphs/{name}/threads/{thread_id}  State size metrics for one conversation.
+    GET  /metrics                         Latency, token and cost histograms (Prometheus text).
+    GET  /metrics/summary                 The same as JSON with p50/p95/p99 per node and model.
+
+Usage:
+    uv run uvicorn server:app --port 8000
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 uv run uvicorn server:app   # against the local stub model server
+"""
+import contextlib
+import importlib
+import json
+import os
+import uuid
+
+from langchain_core.messages import BaseMessage, HumanMessage, RemoveMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from history import state_size
+from instrumentation import metrics_config
+from metrics import metrics
+from models import aprewarm
+from streaming import stream_tokens
+
+# --- Configuration ---
+GRAPH_MODULES = {
+    "chat": "agent",
+    "recipe": "recipe_agent",
+    "meal": "meal_agent",
+    "multi-model": "meal_agent_multi_model",
+    "no-butter": "meal_agent_no_butter",
+}
+
+# Values of "mode" in a /stream body: one event per node update, or per token delta
+STREAM_MODES = ("updates", "tokens")
+
+graphs = {}
+
+# --- Helpers ---
+def serialize_message(message: BaseMessage) -> dict:
+    return {"type": message.type, "content": message.content, "name": message.name}
+
+def thread_config(name: str, thread_id: str) -> dict:
+    """
+    The checkpointer config for a thread of one graph. All graphs share one checkpointer keyed on
+    thread_id, so the graph name is part of the key; otherwise the same thread id on two graphs
+    would share one conversation.
+    """
+    return {"configurable": {"thread_id": f"{name}:{thread_id}"}}
+
+async def parse_request(request: Request):
+    name = request.path_params["name"]
+    if name not in graphs:
+        return None, JSONResponse({"error": f"Unknown graph '{name}'", "graphs": list(graphs)}, status_code=404)
+    try:
+        body = await request.json()
+    except ValueError:
+        return None, JSONResponse({"error": "The body must be JSON"}, status_code=400)
+    if not isinstance(body, dict):
+        return None, JSONResponse({"error": "The body must be a JSON object"}, status_code=400)
+    if not body.get("message") or not isinstance(body["message"], str):
+        return None, JSONResponse({"error": "'message' is required"}, status_code=400)
+    # A missing thread id starts a new conversation; anything else must name one
+    thread_id = body.get("thread_id")
+    if thread_id is None:
+        thread_id = str(uuid.uuid4())
+    elif not isinstance(thread_id, str) or not thread_id.strip():
+        return None, JSONResponse({"error": "'thread_id' must be a non-empty string"}, status_code=400)
+    mode = body.get("mode", "updates")
+    if mode not in STREAM_MODES:
+        return None, JSONResponse({"error": f"'mode' must be one of {', '.join(STREAM_MODES)}"}, status_code=400)
+    return (name, body["message"], thread_id, mode), None
+
+async def node_updates(name: str, message: str, thread_id: str):
+    """
+    Yields (node, new messages) for every node update of one turn.
+    """
+    graph = graphs[name]
+    config = metrics_config(thread_config(name, thread_id))
+    async for event in graph.astream({"messages": [HumanMessage(content=message)]}, config):
+        for node, value in event.items():
+            messages = (value or {}).get("messages", [])
+            # History compaction removes old turns from the state; those are not replies
+            yield node, [serialize_message(m) for m in messages if not isinstance(m, RemoveMessage)]
+
+# --- Endpoints ---
+async def list_graphs(request: Request):
+    return JSONResponse({"graphs": list(graphs)})
+
+async def thread_stats(request: Request):
+    """
+    State size of one session: message and turn counts, approximate tokens, bytes and summary length.
+    """
+    name = request.path_params["name"]
+    if name not in graphs:
+        return JSONResponse({"error": f"Unknown graph '{name}'", "graphs": list(graphs)}, status_code=404)
+    snapshot = await graphs[name].aget_state(thread_config(name, request.path_params["thread_id"]))
+    if not snapshot.values:
+        return JSONResponse({"error": "Unknown thread"}, status_code=404)
+    return JSONResponse({"thread_id": request.path_params["thread_id"], **state_size(snapshot.values)})
+
+async def invoke(request: Request):
+    parsed, error = await parse_request(request)
+    if error:
+        return error
+    name, message, thread_id, _ = parsed
+
+    replies = []
+    async for node, messages in node_updates(name, message, thread_id):
+        replies.extend({"node": node, **m} for m in messages)
+    return JSONResponse({"thread_id": thread_id, "messages": replies})
+
+async def stream(request: Request):
+    parsed, error = await parse_request(request)
+    if error:
+        return error
+    name, message, thread_id, mode = parsed
+
+    async def events():
+        yield f"event: thread\ndata: {json.dumps({'thread_id': thread_id})}\n\n"
+        try:
+            if mode == "tokens":
+                inputs = {"messages": [HumanMessage(content=message)]}
+                config = metrics_config(thread_config(name, thread_id))
+                async for node, step, delta in stream_tokens(graphs[name], inputs, config):
+                    yield f"event: token\ndata: {json.dumps({'node': node, 'step': step, 'delta': delta})}\n\n"
+            else:
+                async for node, messages in node_updates(name, message, thread_id):
+                    yield f"event: update\ndata: {json.dumps({'node': node, 'messages': messages})}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+async def prometheus_metrics(request: Request):
+    return PlainTextResponse(metrics.prometheus(), media_type="text/plain; version=0.0.4")
+
+async def metrics_summary(request: Request):
+    return JSONResponse({"metrics": metrics.summary()})
+
+# --- Application ---
+@contextlib.asynccontextmanager
+async def lifespan(app: Starlette):
+    async with contextlib.AsyncExitStack() as stack:
+        db_path = os.environ.get("CHECKPOINT_DB")
+        if db_path:
+            from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+            checkpointer = await stack.enter_async_context(AsyncSqliteSaver.from_conn_string(db_path))
+        else:
+            checkpointer = InMemorySaver()
+
+        for name, module_name in GRAPH_MODULES.items():
+            module = importlib.import_module(module_name)
+            graphs[name] = module.graph_builder.compile(checkpointer=checkpointer)
+        # Every graph module is imported now, so this warms the clients of all of them
+        await aprewarm()
+        yield
+        graphs.clear()
+
+app = Starlette(
+    routes=[
+        Route("/graphs", list_graphs, methods=["GET"]),
+        Route("/metrics", prometheus_metrics, methods=["GET"]),
+        Route("/metrics/summary", metrics_summary, methods=["GET"]),
+        Route("/graphs/{name}/invoke", invoke, methods=["POST"]),
+        Route("/graphs/{name}/stream", stream, methods=["POST"]),
+        Route("/graphs/{name}/threads/{thread_id}", thread_stats, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
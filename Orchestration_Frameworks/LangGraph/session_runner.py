@@ -0,0 +1,134 @@
+"""
+Concurrent session runner.
+
+Drives many independent conversations through one of the compiled graphs at
+once, using the async node implementations and the shared HTTP pool. The
+concurrency limit caps the number of in-flight graph runs; keep
+HTTP_MAX_CONNECTIONS at least as large.
+
+Usage:
+    uv run session_runner.py meal_agent --sessions 200 --concurrency 50 --prompt "Pancakes for breakfast"
+    uv run session_runner.py recipe_agent --input sessions.jsonl --concurrency 20
+
+--json writes the summary, the metrics rows and the peak RSS to a file; the
+benchmark driver (benchmarks/run_benchmarks.py) reads it.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import resource
+import statistics
+import sys
+import time
+import uuid
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from cassette import get_cassette
+from instrumentation import metrics_config
+from metrics import metrics
+from models import aprewarm
+
+
+async def run_session(graph, turns: list[str], semaphore: asyncio.Semaphore) -> dict:
+    """
+    Runs one conversation turn by turn on its own checkpointer thread, like the HTTP server,
+    so the whole state carries over between turns: the messages, and the running summary the
+    history compactor folds old turns into.
+    """
+    thread_id = str(uuid.uuid4())
+    config = metrics_config({"configurable": {"thread_id": thread_id}})
+    latencies = []
+    state = {}
+    try:
+        for turn in turns:
+            queued_at = time.perf_counter()
+            async with semaphore:
+                # Time spent waiting for the semaphore is recorded as the turn's queue time
+                with metrics.span("turn", "session", queued_at=queued_at):
+                    start = time.perf_counter()
+                    state = await graph.ainvoke({"messages": [HumanMessage(content=turn)]}, config)
+                    latencies.append(time.perf_counter() - start)
+    finally:
+        await graph.checkpointer.adelete_thread(thread_id)
+    messages = state.get("messages", [])
+    return {"latencies": latencies, "reply": messages[-1].content if messages else ""}
+
+
+async def run_sessions(graph, sessions: list[list[str]], concurrency: int = 50) -> list:
+    """
+    Runs every session concurrently with at most `concurrency` graph runs in flight.
+    Failed sessions are returned as exceptions instead of cancelling the others.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(
+        *(run_session(graph, turns, semaphore) for turns in sessions),
+        return_exceptions=True,
+    )
+
+
+def max_rss_mb() -> float:
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(results: list, wall_time: float) -> dict:
+    latencies = [l for r in results if isinstance(r, dict) for l in r["latencies"]]
+    errors = [r for r in results if isinstance(r, BaseException)]
+    summary = {
+        "sessions": len(results),
+        "turns": len(latencies),
+        "errors": len(errors),
+        "wall_time_s": round(wall_time, 3),
+        "turns_per_s": round(len(latencies) / wall_time, 2) if wall_time else 0.0,
+        "max_rss_mb": max_rss_mb(),
+    }
+    if len(latencies) >= 2:
+        cuts = statistics.quantiles(latencies, n=100)
+        summary.update(p50_s=round(cuts[49], 3), p95_s=round(cuts[94], 3), p99_s=round(cuts[98], 3))
+    if errors:
+        summary["first_error"] = repr(errors[0])
+    return summary
+
+
+def load_sessions(args) -> list[list[str]]:
+    if args.input:
+        with open(args.input) as f:
+            return [json.loads(line)["turns"] for line in f if line.strip()]
+    return [list(args.prompt) for _ in range(args.sessions)]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run many graph sessions concurrently")
+    parser.add_argument("module", help="Agent module exposing `graph_builder` (e.g. agent, recipe_agent, meal_agent)")
+    parser.add_argument("--sessions", type=int, default=10, help="Number of sessions when using --prompt")
+    parser.add_argument("--prompt", action="append", default=None, help="A turn sent by every session (repeatable)")
+    parser.add_argument("--input", help='JSONL file with one {"turns": [...]} object per session')
+    parser.add_argument("--concurrency", type=int, default=50, help="Maximum graph runs in flight")
+    parser.add_argument("--json", help="Also write the summary and metrics rows to this file")
+    args = parser.parse_args()
+    if not args.input and not args.prompt:
+        parser.error("either --prompt or --input is required")
+
+    # Sessions are kept by a checkpointer, each on its own thread, and dropped when they end
+    graph = importlib.import_module(args.module).graph_builder.compile(checkpointer=InMemorySaver())
+    sessions = load_sessions(args)
+    await aprewarm()
+
+    start = time.perf_counter()
+    results = await run_sessions(graph, sessions, args.concurrency)
+    summary = summarize(results, time.perf_counter() - start)
+    print(json.dumps(summary, indent=2))
+    print(metrics.report())
+    if get_cassette() is not None:
+        print(f"Cassette stats: {get_cassette().stats()}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary, "metrics": metrics.summary()}, f)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
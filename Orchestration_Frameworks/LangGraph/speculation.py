@@ -0,0 +1,140 @@
+"""
+Speculative chef execution.
+
+Most requests are recipe requests, so when the local intent router is unsure
+and the LLM router has to be asked, the most likely chef is started at the
+same time. If the router agrees, the chef node picks up the call that is
+already in flight; otherwise the speculative call is cancelled. Hit rate and
+wasted tokens are counted so the tradeoff can be judged.
+
+Opt-in with SPECULATIVE_CHEF=1. Only async graph runs (ainvoke/astream)
+speculate; requests the local router decides on its own never need to.
+"""
+import asyncio
+import os
+from collections import Counter
+from typing import Any, Awaitable, Callable, Mapping, Optional
+
+from langchain_core.callbacks import get_usage_metadata_callback
+from langchain_core.messages import BaseMessage
+
+# A zero-argument coroutine factory that runs one chef, e.g. `lambda: acook(...)`
+ChefCall = Callable[[], Awaitable[Any]]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) for calls cancelled before any usage came back."""
+    return max(1, len(text) // 4)
+
+
+class Speculator:
+    def __init__(self, enabled: bool = False, max_pending: int = 1024):
+        self.enabled = enabled
+        self.max_pending = max_pending
+        self.counts = Counter()
+        self.wasted_tokens = 0
+        self._pending: dict[tuple[str, str], asyncio.Task] = {}
+
+    @staticmethod
+    def _key(chef: str, message: BaseMessage) -> tuple[str, str]:
+        # add_messages gives every message an id, so concurrent sessions never share a key
+        return chef, message.id or message.content
+
+    async def _run(self, call: ChefCall) -> tuple[Any, dict]:
+        with get_usage_metadata_callback() as usage:
+            result = await call()
+        return result, usage.usage_metadata
+
+    def _discard(self, task: asyncio.Task, message: BaseMessage):
+        """Cancels a losing speculation and books its tokens as wasted."""
+        self.counts["misses"] += 1
+        if task.done() and not task.cancelled() and task.exception() is None:
+            _, usage = task.result()
+            self.wasted_tokens += sum(u.get("total_tokens", 0) for u in usage.values())
+        else:
+            task.cancel()
+            # The prompt is billed as soon as the request is sent
+            self.wasted_tokens += estimate_tokens(message.content)
+
+    def _keep(self, key: tuple[str, str], task: asyncio.Task):
+        self._pending[key] = task
+        # A run that failed before reaching its chef would leave the task behind; drop the oldest
+        while len(self._pending) > self.max_pending:
+            stale = self._pending.pop(next(iter(self._pending)))
+            stale.cancel()
+
+    async def aroute(
+        self,
+        router,
+        message: BaseMessage,
+        fallback: Optional[Callable[[str], Awaitable[str]]],
+        chefs: Mapping[str, tuple[str, ChefCall]],
+        default_label: Optional[str] = None,
+    ):
+        """
+        Routes `message` with `router.aroute`. If the LLM fallback is needed, the
+        chef for the local router's best guess (or `default_label` when the guess
+        has no chef) runs alongside it. `chefs` maps a route label to
+        (chef node name, chef call).
+        """
+        if not self.enabled or fallback is None:
+            return await router.aroute(message.content, fallback)
+
+        speculation = None
+
+        async def speculative_fallback(text: str) -> str:
+            nonlocal speculation
+            guess = router.predict(text).label
+            if guess not in chefs:
+                guess = default_label
+            if guess in chefs:
+                chef, call = chefs[guess]
+                speculation = (guess, chef, asyncio.create_task(self._run(call)))
+                self.counts["started"] += 1
+            return await fallback(text)
+
+        try:
+            decision = await router.aroute(message.content, speculative_fallback)
+        except BaseException:
+            if speculation:
+                self._discard(speculation[2], message)
+            raise
+
+        if speculation:
+            label, chef, task = speculation
+            if label == decision.label:
+                self.counts["hits"] += 1
+                self._keep(self._key(chef, message), task)
+            else:
+                self._discard(task, message)
+        return decision
+
+    async def claim(self, chef: str, message: BaseMessage) -> Optional[Any]:
+        """
+        Returns the speculative result for this chef and request, or None when
+        there is none (or it failed) and the chef should run normally.
+        """
+        task = self._pending.pop(self._key(chef, message), None)
+        if task is None:
+            return None
+        try:
+            result, _ = await task
+            return result
+        except Exception as e:
+            print(f"Speculative {chef} call failed, running it again: {e}")
+            return None
+
+    def stats(self) -> dict:
+        """Speculation counters; hit_rate is over the speculations actually started."""
+        started = self.counts["started"]
+        return {
+            "started": started,
+            "hits": self.counts["hits"],
+            "misses": self.counts["misses"],
+            "hit_rate": self.counts["hits"] / started if started else 0.0,
+            "wasted_tokens": self.wasted_tokens,
+        }
+
+
+def build_speculator() -> Speculator:
+    return Speculator(enabled=os.environ.get("SPECULATIVE_CHEF", "0") == "1")
@@ -0,0 +1,56 @@
+"""
+Token-level streaming for the compiled graphs.
+
+Uses LangGraph's `messages` stream mode to forward LLM token deltas as they
+arrive, tagged with the node (and graph step) that produced them. Nodes that answer without
+streaming (e.g. a response-cache hit) are forwarded as one complete delta.
+
+Token streaming relies on callback propagation inside async nodes, which
+needs Python 3.11+.
+"""
+from typing import AsyncIterator, Iterable, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+# Nodes whose model output is internal (history summaries, inspection) rather than user-facing,
+# or only reaches the user through a join node (the concurrent full-day plan courses)
+DEFAULT_SKIP_NODES = ("compact_history", "inspector", "course_chef")
+
+
+async def stream_tokens(
+    graph,
+    inputs: dict,
+    config: Optional[dict] = None,
+    skip_nodes: Iterable[str] = DEFAULT_SKIP_NODES,
+) -> AsyncIterator[tuple[str, int, str]]:
+    """
+    Yields (node, step, delta) for one graph run. The step distinguishes
+    repeated visits to the same node, e.g. a chef revising its recipe.
+    """
+    skip = set(skip_nodes)
+    streamed_nodes = set()
+    async for message, metadata in graph.astream(inputs, config, stream_mode="messages"):
+        node = metadata.get("langgraph_node", "")
+        step = metadata.get("langgraph_step", 0)
+        if node.startswith("__") or node in skip or not isinstance(message, AIMessage):
+            continue
+        if isinstance(message, AIMessageChunk):
+            if message.content:
+                streamed_nodes.add((node, step))
+                yield node, step, message.content
+        elif (node, step) not in streamed_nodes and message.content:
+            # A whole message from a node that made no streamed model call
+            yield node, step, message.content
+
+
+async def print_token_stream(graph, inputs: dict, config: Optional[dict] = None, **kwargs):
+    """
+    Prints deltas as they arrive, with a header whenever the producing node changes.
+    """
+    current = None
+    async for node, step, delta in stream_tokens(graph, inputs, config, **kwargs):
+        if (node, step) != current:
+            print(f"\n\n[{node}]")
+            current = (node, step)
+        print(delta, end="", flush=True)
+    print()
@@ -0,0 +1,21 @@
+"""
+A stand-in agent module for the batch runner tests: `graph` echoes the request after a
+delay that varies per request, so runs finish out of input order as real model calls do.
+"""
+import asyncio
+import zlib
+
+from langchain_core.messages import AIMessage
+from langgraph.graph import START, MessagesState, StateGraph
+
+
+async def echo(state: MessagesState):
+    text = state["messages"][-1].content
+    await asyncio.sleep(0.01 + zlib.crc32(text.encode()) % 8 * 0.01)
+    return {"messages": [AIMessage(content=f"echo: {text}")]}
+
+
+builder = StateGraph(MessagesState)
+builder.add_node("echo", echo)
+builder.add_edge(START, "echo")
+graph = builder.compile()
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+import batch
+from batch import BatchRun, Checkpoint
+
+PROJECT = Path(__file__).resolve().parents[1]
+
+
+class Crash(Exception):
+    """Stands in for the process dying at a given point."""
+
+
+def write_requests(path: Path, count: int, blank_every: int = 0) -> list[int]:
+    """Writes `count` requests; returns the input line numbers that hold one."""
+    lines, requests = [], []
+    for n in range(1, count + 1):
+        if blank_every and n % blank_every == 0:
+            lines.append("")
+            continue
+        lines.append(json.dumps({"id": f"r{n}", "prompt": f"request {n}"}))
+        requests.append(n)
+    path.write_text("\n".join(lines) + "\n")
+    return requests
+
+
+def results(path: Path) -> list[dict]:
+    return [json.loads(line) for line in path.read_bytes().splitlines()]
+
+
+def assert_each_once(path: Path, requests: list[int]):
+    lines = [r["line"] for r in results(path)]
+    assert sorted(lines) == requests, "results missing or duplicated"
+    assert all(r["reply"] == f"echo: request {r['line']}" for r in results(path))
+
+
+class Handler:
+    """Echoes requests; later lines finish first within each group, like uneven model calls."""
+
+    def __init__(self, slow: frozenset = frozenset()):
+        self.slow = slow
+        self.calls: list[int] = []
+
+    async def __call__(self, record: dict) -> dict:
+        line = int(record["prompt"].split()[-1])
+        self.calls.append(line)
+        await asyncio.sleep(0.05 if line in self.slow else 0.001 * (10 - line % 10))
+        return {"reply": f"echo: {record['prompt']}"}
+
+
+def crash_after_saves(monkeypatch, saves: int, where: str = "save"):
+    """
+    Makes the `saves`-th checkpoint fail, before it is written or (`where="replace"`) mid-write.
+    Every later save fails too: the other workers may still write results before the run stops, as a dying process would.
+    """
+    count = {"n": 0}
+    real_save, real_replace = Checkpoint.save, os.replace
+
+    def save(self, state):
+        count["n"] += 1
+        if where == "save" and count["n"] >= saves:
+            raise Crash()
+        real_save(self, state)
+
+    def replace(src, dst):
+        if where == "replace" and count["n"] >= saves:
+            raise Crash()
+        real_replace(src, dst)
+
+    monkeypatch.setattr(Checkpoint, "save", save)
+    monkeypatch.setattr(batch.os, "replace", replace)
+
+
+def run(handler, tmp_path, resume: bool = True, concurrency: int = 4) -> dict:
+    run = BatchRun(handler, tmp_path / "in.jsonl", tmp_path / "out.jsonl", concurrency=concurrency, progress_every=0)
+    return asyncio.run(run.run(resume=resume))
+
+
+# --- Crash and resume, in process ---
+def test_result_written_after_the_last_checkpoint_is_truncated(tmp_path, monkeypatch):
+    requests = write_requests(tmp_path / "in.jsonl", 30)
+    with monkeypatch.context() as m:
+        crash_after_saves(m, 12)
+        with pytest.raises(Crash):
+            run(Handler(), tmp_path)
+
+    state = json.loads((tmp_path / "out.jsonl.checkpoint").read_text())
+    # The 12th result reached the output, but its checkpoint did not
+    assert len(results(tmp_path / "out.jsonl")) >= 12
+    assert state["line"] + len(state["done"]) == 11
+    assert state["output_bytes"] < (tmp_path / "out.jsonl").stat().st_size
+
+    sizes = []
+
+    async def watching(record):
+        sizes.append((tmp_path / "out.jsonl").stat().st_size)
+        return await Handler()(record)
+
+    summary = run(watching, tmp_path)
+    # The resumed run starts from the checkpointed bytes, not after the orphaned result
+    assert sizes[0] == state["output_bytes"]
+    assert_each_once(tmp_path / "out.jsonl", requests)
+    assert summary["done"] == 30 - 11 and summary["lines"] == 30
+
+
+def test_lines_finished_out_of_order_are_not_run_again(tmp_path, monkeypatch):
+    requests = write_requests(tmp_path / "in.jsonl", 40)
+    with monkeypatch.context() as m:
+        crash_after_saves(m, 9)
+        with pytest.raises(Crash):
+            run(Handler(slow=frozenset({1, 2})), tmp_path)
+
+    state = json.loads((tmp_path / "out.jsonl.checkpoint").read_text())
+    # Lines 1 and 2 were still running: the watermark is stuck before them, the later lines are kept as done
+    assert state["line"] == 0 and len(state["done"]) == 8
+
+    handler = Handler()
+    summary = run(handler, tmp_path)
+    assert not set(handler.calls) & set(state["done"])
+    assert {1, 2} <= set(handler.calls) and len(handler.calls) == 40 - 8
+    assert summary["resumed_from_line"] == 0
+    assert_each_once(tmp_path / "out.jsonl", requests)
+
+
+def test_crash_while_writing_the_checkpoint_keeps_the_previous_one(tmp_path, monkeypatch):
+    requests = write_requests(tmp_path / "in.jsonl", 20, blank_every=7)
+    with monkeypatch.context() as m:
+        crash_after_saves(m, 6, where="replace")
+        with pytest.raises(Crash):
+            run(Handler(), tmp_path)
+
+    checkpoint = tmp_path / "out.jsonl.checkpoint"
+    # The new state only reached the .tmp file; the checkpoint is the whole previous one
+    state = json.loads(checkpoint.read_text())
+    output = (tmp_path / "out.jsonl").read_bytes()
+    assert state["complete"] is False and output[:state["output_bytes"]].endswith(b"\n")
+    assert state["output_bytes"] < len(output)
+    assert checkpoint.with_suffix(".checkpoint.tmp").exists()
+
+    run(Handler(), tmp_path)
+    assert_each_once(tmp_path / "out.jsonl", requests)
+    assert json.loads(checkpoint.read_text())["complete"] is True
+
+
+def test_completed_run_is_not_repeated_and_restart_starts_over(tmp_path):
+    requests = write_requests(tmp_path / "in.jsonl", 10)
+    run(Handler(), tmp_path)
+
+    handler = Handler()
+    assert run(handler, tmp_path)["note"].startswith("already complete")
+    assert handler.calls == []
+
+    run(handler, tmp_path, resume=False)
+    assert sorted(handler.calls) == requests
+    assert_each_once(tmp_path / "out.jsonl", requests)
+
+
+def test_checkpoint_of_another_input_is_refused(tmp_path):
+    write_requests(tmp_path / "in.jsonl", 5)
+    run(Handler(), tmp_path)
+    write_requests(tmp_path / "other.jsonl", 5)
+    other = BatchRun(Handler(), tmp_path / "other.jsonl", tmp_path / "out.jsonl", progress_every=0)
+    with pytest.raises(ValueError, match="belongs to"):
+        asyncio.run(other.run())
+
+
+def test_errors_are_recorded_once(tmp_path):
+    (tmp_path / "in.jsonl").write_text('{"prompt": "request 1"}\nnot json\n{"prompt": "request 3"}\n')
+    summary = run(Handler(), tmp_path)
+    by_line = {r["line"]: r for r in results(tmp_path / "out.jsonl")}
+    assert sorted(by_line) == [1, 2, 3] and "error" in by_line[2]
+    assert summary["errors"] == 1
+
+
+# --- Killed runner process ---
+def runner(tmp_path: Path) -> list[str]:
+    return [sys.executable, "batch_runner.py", "slow_echo", str(tmp_path / "in.jsonl"), str(tmp_path / "out.jsonl"),
+            "--concurrency", "6", "--progress", "0"]
+
+
+def test_killed_runner_resumes_without_duplicates(tmp_path):
+    requests = write_requests(tmp_path / "in.jsonl", 120, blank_every=13)
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(PROJECT / "tests"), str(PROJECT)]),
+           "OPENAI_API_KEY": "unused", "METRICS": "0"}
+    output = tmp_path / "out.jsonl"
+
+    process = subprocess.Popen(runner(tmp_path), cwd=PROJECT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline and process.poll() is None:
+        if output.exists() and output.read_bytes().count(b"\n") >= 30:
+            break
+        time.sleep(0.01)
+    assert process.poll() is None, f"the runner finished before it could be killed: {process.stderr.read().decode()}"
+    process.kill()
+    process.wait()
+    killed_at = output.read_bytes().count(b"\n")
+    assert killed_at < len(requests)
+
+    resumed = subprocess.run(runner(tmp_path), cwd=PROJECT, env=env, capture_output=True, text=True, timeout=120)
+    assert resumed.returncode == 0, resumed.stderr
+    assert '"resumed_from_line": 0' not in resumed.stdout
+    assert_each_once(output, requests)
@@ -0,0 +1,60 @@
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage
+from langgraph.graph.message import add_messages
+
+from history import HistoryCompactor, state_size, transcript, turn_starts
+
+
+def no_butter_turn(n: int, revisions: int) -> list:
+    """One turn of the no-butter graph: the request, the first draft, then feedback and a new draft per revision."""
+    messages = [HumanMessage(content=f"Recipe request {n}", id=f"user-{n}"), AIMessage(content=f"Draft {n}.0 with butter", id=f"chef-{n}-0")]
+    for r in range(1, revisions + 1):
+        messages += [
+            HumanMessage(content="The inspector found butter in your recipe. Please rewrite the recipe WITHOUT using butter.",
+                         name="inspector", id=f"inspector-{n}-{r}"),
+            AIMessage(content=f"Draft {n}.{r}", id=f"chef-{n}-{r}"),
+        ]
+    return messages
+
+
+def history(*revisions: int) -> list:
+    return [m for n, r in enumerate(revisions) for m in no_butter_turn(n, r)]
+
+
+def test_inspector_feedback_does_not_start_a_turn():
+    messages = history(2, 0, 3)
+    assert turn_starts(messages) == [0, 6, 8]
+    assert state_size({"messages": messages})["turns"] == 3
+
+
+def test_compaction_keeps_whole_turns_with_their_revisions():
+    messages = history(3, 0, 2, 1)
+    compactor = HistoryCompactor(max_turns=3, keep_turns=2, max_tokens=100_000)
+
+    update = compactor.compact({"messages": messages})
+
+    removed = {m.id for m in update["messages"] if isinstance(m, RemoveMessage)}
+    kept = add_messages(messages, update["messages"])
+    # The two oldest turns go as a whole, revisions included; the kept history starts at a user request
+    assert removed == {m.id for m in history(3, 0)}
+    assert kept[0].id == "user-2" and not kept[0].name
+    assert [m.id for m in kept] == [m.id for m in messages[len(removed):]]
+    assert compactor.stats() == {"folds": 1, "folded_messages": len(removed)}
+
+
+def test_revisions_alone_never_trigger_a_fold():
+    # One request revised many times is still a single turn, and the current turn is always kept
+    compactor = HistoryCompactor(max_turns=2, keep_turns=1, max_tokens=100_000)
+    assert compactor.compact({"messages": history(6)}) == {}
+    assert compactor.compact({"messages": history(1, 6)}) == {}
+
+
+def test_summary_transcript_names_the_inspector():
+    folded = history(1)
+    assert transcript(folded).splitlines()[2].startswith("Inspector: The inspector found butter")
+
+    model = GenericFakeChatModel(messages=iter([AIMessage(content="The user asked for a recipe without butter.")]))
+    compactor = HistoryCompactor(model=model, max_turns=1, keep_turns=1, max_tokens=100_000)
+    update = compactor.compact({"messages": history(1, 1), "summary": ""})
+    assert update["summary"] == "The user asked for a recipe without butter."
+    assert len(update["messages"]) == 4
@@ -0,0 +1,127 @@
+"""
+A small labelled regression set for the local routers, held out from the seed examples. Chat
+that mentions food must never reach a chef without the LLM, and most plain meal requests should
+be decided locally; the rates are printed with `pytest -s`.
+"""
+import pytest
+
+from intent_router import (
+    KEYWORD_CONFIDENCE,
+    MEAL_KEYWORDS,
+    MEAL_LABELS,
+    LocalIntentRouter,
+    build_meal_router,
+    build_recipe_router,
+)
+
+MEAL_REQUESTS = [
+    ("what can I make for breakfast", "BREAKFAST"),
+    ("pancakes for breakfast please", "BREAKFAST"),
+    ("give me a quick omelette recipe", "BREAKFAST"),
+    ("I need a healthy breakfast before my run", "BREAKFAST"),
+    ("suggest a brunch for six people", "BREAKFAST"),
+    ("how do I make fluffy waffles", "BREAKFAST"),
+    ("something warm with oats for the morning", "BREAKFAST"),
+    ("an easy lunch I can take to work", "LUNCH"),
+    ("what should I have for lunch", "LUNCH"),
+    ("give me a sandwich idea", "LUNCH"),
+    ("I want a light lunch with chickpeas", "LUNCH"),
+    ("a packed lunch for my kids please", "LUNCH"),
+    ("a light salad to bring to the office", "LUNCH"),
+    ("what should I cook for dinner", "DINNER"),
+    ("a romantic dinner for two please", "DINNER"),
+    ("can you suggest a vegetarian supper", "DINNER"),
+    ("what's for dinner tonight", "DINNER"),
+    ("how to make a sunday roast", "DINNER"),
+    ("a warming stew for tonight", "DINNER"),
+    ("a cosy pasta dish for this evening", "DINNER"),
+]
+
+# Chat, half of it about food
+MEAL_CHAT = [
+    "I had dinner with friends last night, how was your day?",
+    "I skipped lunch",
+    "breakfast was great thanks",
+    "my brother is coming for dinner on friday",
+    "we ate pancakes this morning and then went hiking",
+    "lunch meeting ran late again",
+    "my dinner party was a disaster",
+    "I love waffles",
+    "is brunch a real meal?",
+    "I forgot my lunchbox at home",
+    "who invented the sandwich",
+    "hey, how's it going",
+    "tell me something funny",
+    "what is the capital of spain",
+    "thanks, that helped",
+    "how do I fix my bike",
+    "help me write a cover letter",
+    "anything good on tv tonight",
+    "good morning",
+    "how do I reset my router",
+]
+
+RECIPE_REQUESTS = [
+    "give me a recipe for banana bread",
+    "I want to bake cookies this weekend",
+    "how do I make a chicken curry",
+    "what ingredients do I need for pesto",
+]
+
+RECIPE_CHAT = [
+    "I lost my grandmother's recipe book",
+    "that bake sale was fun",
+    "the ingredients list on this shampoo is long",
+    "how do I make friends in a new city",
+]
+
+
+def run(router: LocalIntentRouter, labelled: list[tuple[str, str]]) -> list[tuple[str, str, str]]:
+    """Routes every request with an oracle LLM; returns (text, expected, label) for the local decisions."""
+    truth = dict(labelled)
+    local = []
+    for text, expected in labelled:
+        decision = router.route(text, fallback=lambda t: truth[t])
+        if decision.source != "llm":
+            local.append((text, expected, decision.label))
+    return local
+
+
+def test_food_chat_never_reaches_a_chef_locally():
+    router = build_meal_router()
+    local = run(router, [(text, "OTHER") for text in MEAL_CHAT])
+    assert [(text, label) for text, _, label in local if label != "OTHER"] == []
+    # The food mentions go to the LLM; most plain chat is still answered locally
+    food = {text for text in MEAL_CHAT if any(word in text.lower() for words in MEAL_KEYWORDS.values() for word in words)}
+    assert food and not food & {text for text, _, _ in local}
+    assert router.stats()["hit_rate"] >= 0.35
+    print(f"\nmeal chat: {router.stats()}")
+
+
+def test_meal_requests_are_mostly_decided_locally():
+    router = build_meal_router()
+    local = run(router, MEAL_REQUESTS)
+    assert [(text, label) for text, expected, label in local if label != expected] == []
+    assert router.stats()["hit_rate"] >= 0.9
+    print(f"\nmeal requests: {router.stats()}")
+
+
+def test_recipe_router_regression_set():
+    router = build_recipe_router()
+    labelled = [(text, "RECIPE") for text in RECIPE_REQUESTS] + [(text, "OTHER") for text in RECIPE_CHAT]
+    local = run(router, labelled)
+    assert [(text, label) for text, expected, label in local if label != expected] == []
+    assert router.stats()["hit_rate"] >= 0.5
+
+
+@pytest.mark.parametrize("text", ["I had dinner with friends last night, how was your day?", "I skipped lunch"])
+def test_uncued_keyword_is_below_the_threshold(text):
+    decision = build_meal_router().predict(text)
+    assert decision.source == "rules" and decision.confidence < 0.6
+
+
+def test_keyword_confidence_goes_through_the_threshold():
+    strict = LocalIntentRouter(MEAL_LABELS, MEAL_KEYWORDS, threshold=KEYWORD_CONFIDENCE + 0.01)
+    calls = []
+    decision = strict.route("pancakes for breakfast", fallback=lambda t: calls.append(t) or "BREAKFAST")
+    assert decision.source == "llm" and calls == ["pancakes for breakfast"]
@@ -0,0 +1,65 @@
+import asyncio
+import json
+import threading
+
+from metrics import Metrics
+
+
+def lines(path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_jsonl_records_are_written_by_the_writer_thread(tmp_path, monkeypatch):
+    path = tmp_path / "metrics.jsonl"
+    registry = Metrics(jsonl_path=str(path))
+    callers = set()
+    opened = []
+    real_open = open
+
+    def tracking_open(*args, **kwargs):
+        opened.append(threading.current_thread().name)
+        return real_open(*args, **kwargs)
+
+    monkeypatch.setattr("builtins.open", tracking_open)
+
+    async def run():
+        callers.add(threading.current_thread().name)
+        for i in range(20):
+            registry.record("node", f"step-{i}", 0.01, model="gpt-5-nano", input_tokens=10, output_tokens=5)
+
+    asyncio.run(run())
+    registry.flush()
+
+    assert [r["name"] for r in lines(path)] == [f"step-{i}" for i in range(20)]
+    # The file is never opened on the recording thread (the event loop here)
+    assert opened and not set(opened) & callers
+    assert set(opened) == {"metrics-jsonl"}
+
+
+def test_concurrent_records_are_all_written_whole(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    registry = Metrics(jsonl_path=str(path))
+
+    def worker(n: int):
+        for i in range(200):
+            registry.record("tool", f"worker-{n}", 0.001, input_tokens=i)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    registry.flush()
+
+    records = lines(path)
+    assert len(records) == 1600
+    assert sum(r["name"] == "worker-3" for r in records) == 200
+    assert {row["calls"] for row in registry.summary()} == {200}
+
+
+def test_no_writer_without_a_jsonl_path():
+    registry = Metrics()
+    registry.record("node", "chef", 0.1)
+    registry.flush()
+    assert registry._writer is None
+    assert registry.summary()[0]["calls"] == 1
@@ -0,0 +1,106 @@
+import asyncio
+import itertools
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.graph import START, StateGraph
+
+import instrumentation
+import meal_agent_no_butter
+from meal_agent_no_butter import astream_chef, stream_chef, usage_entry
+
+PROMPT = [SystemMessage(content="You are a specialist Dinner Chef."), HumanMessage(content="A quick pasta for two, please.")]
+
+BUTTERY = "Ingredients:\n- 200g pasta\n- 2 tbsp butter\n- 1 clove garlic\nMethod: boil the pasta.\n"
+CLEAN = "Ingredients:\n- 200g pasta\n- 2 tbsp olive oil\n"
+
+
+def chef(text: str) -> GenericFakeChatModel:
+    return GenericFakeChatModel(messages=iter([AIMessage(content=text)]))
+
+
+class Recorder:
+    def __init__(self):
+        self.records = []
+
+    def record(self, kind, name, wall_s, **fields):
+        self.records.append({"kind": kind, "name": name, **fields})
+
+
+# --- Stopped drafts ---
+def test_stopped_draft_estimates_the_billed_prompt():
+    response, violation = stream_chef(chef(BUTTERY), PROMPT)
+    assert violation == "2 tbsp butter"
+    assert "garlic" not in response.content
+    usage = response.usage_metadata
+    # The whole prompt was sent before the stream was closed
+    assert usage["input_tokens"] == count_tokens_approximately(PROMPT) > 0
+    assert 0 < usage["output_tokens"] < count_tokens_approximately([AIMessage(content=BUTTERY)])
+    assert usage["total_tokens"] == usage["input_tokens"] + usage["output_tokens"]
+
+    entry = usage_entry(1, "dinner_chef", response)
+    assert entry["estimated"] is True and entry["input_tokens"] == usage["input_tokens"]
+
+
+def test_async_stopped_draft_matches_the_sync_one():
+    response, violation = asyncio.run(astream_chef(chef(BUTTERY), PROMPT))
+    sync_response, _ = stream_chef(chef(BUTTERY), PROMPT)
+    assert violation == "2 tbsp butter"
+    assert response.usage_metadata == sync_response.usage_metadata
+
+
+def test_finished_draft_keeps_the_provider_usage():
+    response, violation = stream_chef(chef(CLEAN), PROMPT)
+    assert violation is None and response.content == CLEAN
+    assert usage_entry(0, "dinner_chef", response)["estimated"] is False
+
+
+# --- Metrics ---
+def test_closed_stream_reports_estimated_tokens_to_its_node(monkeypatch):
+    recorder = Recorder()
+    monkeypatch.setattr(instrumentation, "metrics", recorder)
+
+    def dinner_chef(state: dict):
+        response, _ = stream_chef(chef(BUTTERY), PROMPT)
+        return {"draft": response.content}
+
+    builder = StateGraph(dict)
+    builder.add_node("dinner_chef", dinner_chef)
+    builder.add_edge(START, "dinner_chef")
+    builder.compile().invoke({"draft": ""}, {"callbacks": [instrumentation.MetricsCallback()]})
+
+    llm = next(r for r in recorder.records if r["kind"] == "llm")
+    node = next(r for r in recorder.records if r["kind"] == "node")
+    # The closed stream errors out, but its tokens are still counted, for the call and for its node
+    assert llm["error"] and llm["input_tokens"] == count_tokens_approximately(PROMPT)
+    assert llm["output_tokens"] > 0
+    assert node["name"] == "dinner_chef"
+    assert (node["input_tokens"], node["output_tokens"]) == (llm["input_tokens"], llm["output_tokens"])
+
+
+# --- Revision cap ---
+def test_revisions_stop_at_the_cap(monkeypatch):
+    monkeypatch.setattr(meal_agent_no_butter, "INSPECTION_MODE", "streaming")
+    monkeypatch.setattr(meal_agent_no_butter, "MAX_REVISIONS", 2)
+    # A chef that never learns: every draft uses butter
+    monkeypatch.setattr(meal_agent_no_butter, "llm_mini", GenericFakeChatModel(messages=itertools.cycle([AIMessage(content=BUTTERY)])))
+    prompts = []
+
+    def spying_stream_chef(model, messages):
+        prompts.append(messages)
+        return stream_chef(model, messages)
+
+    monkeypatch.setattr(meal_agent_no_butter, "stream_chef", spying_stream_chef)
+    state = meal_agent_no_butter.get_graph().invoke({"messages": [HumanMessage(content="croissants for breakfast please")]})
+
+    # The first draft and one per revision, then the loop gives up instead of asking again
+    assert state["revisions"] == 2 and len(prompts) == 3
+    assert state["messages"][-1].content.startswith("**Inspector:**")
+    assert "2 tbsp butter after 2 revisions" in state["messages"][-1].content
+    # Revisions only resend the request, the last draft and the critique
+    assert [len(p) for p in prompts] == [2, 4, 4]
+    assert prompts[2][1].content == "croissants for breakfast please"
+    assert [(u["iteration"], u["node"], u["estimated"]) for u in state["usage"]] == [
+        (0, "breakfast_chef", True), (1, "breakfast_chef", True), (2, "breakfast_chef", True),
+    ]
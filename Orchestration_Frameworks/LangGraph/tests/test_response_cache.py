@@ -0,0 +1,76 @@
+import asyncio
+import sqlite3
+import time
+
+from response_cache import ResponseCache
+
+ARGS = ("dinner_chef", "gpt-4o-mini", "You are a specialist Dinner Chef.")
+
+
+class Embedder:
+    """A fake embedding endpoint: near-duplicates of a request share a vector, and calls are counted."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, text: str) -> list[float]:
+        self.calls.append(text)
+        return [1.0, 0.0] if "pancake" in text else [0.0, 1.0]
+
+
+def rows(path) -> int:
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+# --- Embeddings ---
+def test_miss_then_put_embeds_the_request_once():
+    embed = Embedder()
+    cache = ResponseCache(embed=embed)
+
+    assert cache.get_or_call(*ARGS, "Pancakes for breakfast!", lambda: "recipe") == "recipe"
+    assert embed.calls == ["pancakes for breakfast"]
+    assert cache.stats()["embeddings"] == 1
+
+
+def test_split_async_get_and_put_share_the_embedding():
+    embed = Embedder()
+    cache = ResponseCache(embed=embed)
+
+    async def run():
+        assert await cache.aget(*ARGS, "pancakes for breakfast") is None
+        await cache.aput(*ARGS, "pancakes for breakfast", "recipe")
+        return await cache.aget(*ARGS, "breakfast pancakes please")
+
+    assert asyncio.run(run()) == "recipe"
+    # The near-duplicate is a new text, so it is embedded; the put reused the get's vector
+    assert embed.calls == ["pancakes for breakfast", "breakfast pancakes please"]
+    assert cache.stats()["semantic_hits"] == 1
+
+
+# --- SQLite ---
+def test_disk_is_capped_at_max_entries(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = ResponseCache(max_entries=3, path=str(path))
+    for n in range(10):
+        cache.put(*ARGS, f"request {n}", f"recipe {n}")
+
+    assert rows(path) == 3
+    assert cache.stats()["disk_evictions"] == 7
+    # The newest entries survive a restart, the evicted ones are gone from disk too
+    reopened = ResponseCache(max_entries=3, path=str(path))
+    assert reopened.get(*ARGS, "request 9") == "recipe 9"
+    assert reopened.get(*ARGS, "request 0") is None
+
+
+def test_expired_rows_are_pruned_on_put(tmp_path, monkeypatch):
+    path = tmp_path / "cache.sqlite"
+    cache = ResponseCache(ttl_seconds=60, path=str(path))
+    cache.put(*ARGS, "old request", "old recipe")
+
+    now = time.time()
+    monkeypatch.setattr("response_cache.time.time", lambda: now + 120)
+    cache.put(*ARGS, "new request", "new recipe")
+
+    assert rows(path) == 1
+    assert cache.get(*ARGS, "old request") is None
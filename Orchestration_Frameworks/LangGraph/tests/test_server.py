@@ -0,0 +1,52 @@
+import pytest
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import START, MessagesState, StateGraph
+from starlette.testclient import TestClient
+
+import server
+
+
+def echo(state: MessagesState):
+    return {"messages": [AIMessage(content=f"echo: {state['messages'][-1].content}")]}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    builder = StateGraph(MessagesState)
+    builder.add_node("echo", echo)
+    builder.add_edge(START, "echo")
+    # Without the lifespan, so no agent graph is compiled and no client is built
+    monkeypatch.setattr(server, "graphs", {"echo": builder.compile(checkpointer=InMemorySaver())})
+    return TestClient(server.app)
+
+
+@pytest.mark.parametrize("thread_id", [123, 0, "", "   ", ["a"], {"id": "a"}, True])
+def test_thread_id_must_be_a_non_empty_string(client, thread_id):
+    response = client.post("/graphs/echo/invoke", json={"message": "hi", "thread_id": thread_id})
+    assert response.status_code == 400
+    assert "thread_id" in response.json()["error"]
+
+
+@pytest.mark.parametrize("mode", ["token", "values", None, 1])
+def test_unknown_mode_is_rejected(client, mode):
+    response = client.post("/graphs/echo/stream", json={"message": "hi", "thread_id": "t", "mode": mode})
+    assert response.status_code == 400
+    assert "mode" in response.json()["error"]
+
+
+def test_missing_thread_id_starts_a_conversation(client):
+    first = client.post("/graphs/echo/invoke", json={"message": "hi"}).json()
+    assert first["thread_id"] and first["messages"][-1]["content"] == "echo: hi"
+
+    client.post("/graphs/echo/invoke", json={"message": "again", "thread_id": first["thread_id"]})
+    stats = client.get(f"/graphs/echo/threads/{first['thread_id']}").json()
+    assert stats["messages"] == 4
+
+
+def test_stream_updates(client):
+    response = client.post("/graphs/echo/stream", json={"message": "hi", "thread_id": "t", "mode": "updates"})
+    assert response.status_code == 200
+    assert [line for line in response.text.splitlines() if line.startswith("event:")] == [
+        "event: thread", "event: update", "event: done",
+    ]
@@ -0,0 +1,23 @@
+"""
+Some modules are shared with other projects in this repository as verbatim copies, so each
+project stays runnable on its own. These checks fail as soon as a copy drifts: change the
+module here and copy it over in the same commit.
+"""
+from pathlib import Path
+
+import pytest
+
+HERE = Path(__file__).resolve().parents[1]
+REPO = HERE.parents[1]
+
+# module -> the projects holding a copy of it
+SHARED = {
+    module: ["CodeFirst_Libraries/PydanticAI"]
+    for module in ("batch.py", "cassette.py", "http_pool.py", "intent_router.py", "metrics.py", "response_cache.py")
+}
+
+
+@pytest.mark.parametrize("module, project", [(m, p) for m, projects in SHARED.items() for p in projects])
+def test_copy_is_identical(module, project):
+    copy = REPO / project / module
+    assert copy.read_bytes() == (HERE / module).read_bytes(), f"{project}/{module} differs from the LangGraph copy"
@@ -0,0 +1,37 @@
+"""
+Startup budget: every CLI module of this project must import within its budget in
+benchmarks/startup_benchmark.py, scaled to the speed of the machine. Each target is
+imported in a fresh interpreter a few times, so this takes about a minute.
+"""
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "benchmarks"))
+
+import startup_benchmark as bench
+
+TARGETS = [name for name in bench.TARGETS if name.startswith("langgraph/")]
+
+
+@pytest.fixture(scope="module")
+def scale() -> float:
+    return bench.reference_scale(runs=9)[1]
+
+
+@pytest.mark.parametrize("target", TARGETS)
+def test_import_time_is_within_budget(target, scale):
+    budget = round(bench.TARGETS[target][2] * scale, 1)
+    result = bench.run_target(target, runs=3, budget_ms=budget)
+    slowest = ", ".join(f"{row['module']} {row['cumulative_ms']} ms" for row in result["slowest"])
+    assert result["import_ms"] <= budget, f"{target} imports in {result['import_ms']} ms, over its {budget} ms budget ({slowest})"
+
+
+@pytest.mark.parametrize("module", ["agent", "recipe_agent", "meal_agent", "meal_agent_multi_model", "meal_agent_no_butter"])
+def test_graph_compiles_on_first_use(module):
+    # Compiling at import would be paid by every importer, the server and the runners included
+    module = importlib.import_module(module)
+    assert "graph" not in vars(module)
+    assert module.graph is module.get_graph()
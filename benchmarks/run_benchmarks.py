@@ -0,0 +1,284 @@
+"""
+Offline benchmark suite.
+
+Starts the stub model server, drives every agent through its project's
+session runner at each requested concurrency, and reports per target:
+
+- throughput (turns/s) and turn latency p50/p95/p99
+- framework overhead per hop: the mean wall time of every graph node, edge,
+  agent run and model call minus the time the stub spent serving the model
+  requests made inside it
+- peak RSS of the runner process
+
+Each target runs in its own process (`uv run session_runner.py ...` in its
+project folder) so RSS and import costs are not shared. With
+--cassette-mode record the model calls are saved per target; --cassette-mode
+replay then serves them back without the network (see cassette.py). Results can be saved
+with --output and compared against a previous run with --baseline; the exit
+code is 1 when throughput, p95 or per-hop overhead regress by more than
+--tolerance.
+
+Usage:
+    python run_benchmarks.py --sessions 50 --turns 2 --concurrency 1,10,50 --output baseline.json
+    python run_benchmarks.py --targets langgraph/meal_agent --latency-dist lognormal --jitter 0.4 --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+from typing import Optional
+
+from stub_openai_server import add_latency_arguments
+
+ROOT = Path(__file__).resolve().parent.parent
+LANGGRAPH = ROOT / "Orchestration_Frameworks" / "LangGraph"
+PYDANTIC_AI = ROOT / "CodeFirst_Libraries" / "PydanticAI"
+
+# name -> (project folder, runner module argument, prompt sent on every turn)
+TARGETS = {
+    "langgraph/agent": (LANGGRAPH, "agent", "Hello, what can you help me with?"),
+    "langgraph/recipe_agent": (LANGGRAPH, "recipe_agent", "Give me a recipe for pancakes"),
+    "langgraph/meal_agent": (LANGGRAPH, "meal_agent", "Pancakes for breakfast"),
+    "langgraph/meal_agent_multi_model": (LANGGRAPH, "meal_agent_multi_model", "Pancakes for breakfast"),
+    "langgraph/meal_agent_no_butter": (LANGGRAPH, "meal_agent_no_butter", "Pancakes for breakfast"),
+    "langgraph/meal_agent_no_butter_streaming": (LANGGRAPH, "meal_agent_no_butter", "Pancakes for breakfast"),
+    "pydanticai/agent": (PYDANTIC_AI, "agent", "Hello, what can you help me with?"),
+    "pydanticai/meal_agent": (PYDANTIC_AI, "meal_agent", "Pancakes for breakfast"),
+    "pydanticai/meal_agent_two_step": (PYDANTIC_AI, "meal_agent", "Pancakes for breakfast"),
+    "pydanticai/meal_agent_single": (PYDANTIC_AI, "meal_agent", "Pancakes for breakfast"),
+}
+
+# Extra environment for targets that run a variant of an agent. The PydanticAI routing variants turn
+# the local intent router off so every turn goes through the model routing path being compared.
+TARGET_ENV = {
+    "langgraph/meal_agent_no_butter_streaming": {"INSPECTION_MODE": "streaming"},
+    "pydanticai/meal_agent_two_step": {"LOCAL_ROUTER": "0", "MEAL_ROUTING": "two-step"},
+    "pydanticai/meal_agent_single": {"LOCAL_ROUTER": "0", "MEAL_ROUTING": "single"},
+}
+
+# Metric kinds that are hops of a turn; "turn" rows are the turns themselves
+HOP_KINDS = ("node", "edge", "agent", "llm", "tool")
+
+
+# --- Stub Server ---
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub(args) -> tuple[subprocess.Popen, str]:
+    port = free_port()
+    command = [
+        sys.executable, str(Path(__file__).with_name("stub_openai_server.py")), "--port", str(port),
+        "--latency", str(args.latency), "--latency-dist", args.latency_dist, "--jitter", str(args.jitter),
+        "--tokens-per-second", str(args.tokens_per_second),
+    ]
+    if args.seed is not None:
+        command += ["--seed", str(args.seed)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}/v1"
+    for _ in range(100):
+        try:
+            stub_stats(base_url)
+            return process, base_url
+        except OSError:
+            time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError("stub model server did not start")
+
+
+def stub_stats(base_url: str) -> dict:
+    with urllib.request.urlopen(f"{base_url}/stats", timeout=5) as response:
+        return json.load(response)
+
+
+# --- Runs ---
+def launcher() -> list[str]:
+    """`uv run` when uv is installed, else the current interpreter (which then needs the project's dependencies)."""
+    return ["uv", "run"] if shutil.which("uv") else [sys.executable]
+
+
+def run_target(name: str, concurrency: int, args, base_url: Optional[str]) -> dict:
+    folder, module, prompt = TARGETS[name]
+    env = dict(os.environ, METRICS="1", **TARGET_ENV.get(name, {}))
+    if base_url is not None:
+        env.update(
+            OPENAI_BASE_URL=base_url,
+            OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "stub") if args.base_url else "stub",
+        )
+    if not args.cache:
+        env["RESPONSE_CACHE"] = "0"
+    if args.cassette_mode:
+        env.update(
+            CASSETTE_MODE=args.cassette_mode,
+            CASSETTE_PATH=str(Path(args.cassette_dir).resolve() / f"{name.replace('/', '-')}-c{concurrency}.jsonl.gz"),
+            CASSETTE_TIMING=args.cassette_timing,
+        )
+    with tempfile.TemporaryDirectory() as tmp:
+        result_path = Path(tmp) / "result.json"
+        command = launcher() + [
+            "session_runner.py", module, "--sessions", str(args.sessions), "--concurrency", str(concurrency),
+            "--json", str(result_path),
+        ]
+        for _ in range(args.turns):
+            command += ["--prompt", prompt]
+        # Replayed runs make no model requests, so there is no stub time to subtract
+        before = stub_stats(base_url) if base_url else {"requests": 0, "service_s": 0.0}
+        completed = subprocess.run(command, cwd=folder, env=env, capture_output=True, text=True, timeout=args.timeout)
+        after = stub_stats(base_url) if base_url else before
+        if completed.returncode != 0 or not result_path.exists():
+            tail = (completed.stderr or completed.stdout).strip().splitlines()[-5:]
+            return {"target": name, "concurrency": concurrency, "failed": "\n".join(tail)}
+        result = json.loads(result_path.read_text())
+
+    requests = after["requests"] - before["requests"]
+    stub_mean = (after["service_s"] - before["service_s"]) / requests if requests else 0.0
+    return {
+        "target": name,
+        "concurrency": concurrency,
+        **result["summary"],
+        "model_requests": requests,
+        "stub_mean_s": round(stub_mean, 4),
+        "hops": hop_overheads(result["metrics"], stub_mean),
+    }
+
+
+def hop_overheads(rows: list[dict], stub_mean: float) -> list[dict]:
+    """
+    Mean wall time per hop minus the stub time of the model requests it made. Model
+    call rows are attributed to the node, edge or agent that made them (same name);
+    an agent run without its own model rows is counted as one model request.
+    """
+    requests = {}
+    for row in rows:
+        if row["kind"] == "llm":
+            requests[row["name"]] = requests.get(row["name"], 0) + row["calls"]
+    hops = []
+    for row in rows:
+        if row["kind"] not in HOP_KINDS or not row["calls"]:
+            continue
+        if row["kind"] == "llm":
+            per_call = 1.0
+        elif row["kind"] == "agent":
+            per_call = requests.get(row["name"], row["calls"]) / row["calls"]
+        else:
+            per_call = requests.get(row["name"], 0) / row["calls"]
+        mean = row["total_s"] / row["calls"]
+        hops.append({
+            "kind": row["kind"], "name": row["name"], "calls": row["calls"],
+            "mean_ms": round(mean * 1000, 2),
+            "overhead_ms": round((mean - per_call * stub_mean) * 1000, 2),
+        })
+    return hops
+
+
+# --- Report ---
+def print_report(results: list[dict]):
+    print(f"\n{'target':<42} {'conc':>5} {'turns':>6} {'err':>4} {'turns/s':>8} {'p50_s':>7} {'p95_s':>7} {'p99_s':>7} {'rss_mb':>7}")
+    for r in results:
+        if "failed" in r:
+            print(f"{r['target']:<42} {r['concurrency']:>5} FAILED: {r['failed']}")
+            continue
+        print(
+            f"{r['target']:<42} {r['concurrency']:>5} {r['turns']:>6} {r['errors']:>4} {r['turns_per_s']:>8.2f} "
+            f"{r.get('p50_s', 0):>7.3f} {r.get('p95_s', 0):>7.3f} {r.get('p99_s', 0):>7.3f} {r['max_rss_mb']:>7.1f}"
+        )
+    print("\nFramework overhead per hop (mean wall minus stub time), ms")
+    print(f"{'target':<42} {'conc':>5} {'kind':<6} {'name':<24} {'calls':>6} {'mean':>9} {'overhead':>9}")
+    for r in results:
+        for hop in r.get("hops", []):
+            print(
+                f"{r['target']:<42} {r['concurrency']:>5} {hop['kind']:<6} {hop['name'][:24]:<24} {hop['calls']:>6} "
+                f"{hop['mean_ms']:>9.2f} {hop['overhead_ms']:>9.2f}"
+            )
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float, min_delta_ms: float = 2.0) -> list[str]:
+    """Regressions against a previous run of the same targets and concurrency."""
+    previous = {(r["target"], r["concurrency"]): r for r in baseline if "failed" not in r}
+    regressions = []
+    for r in results:
+        old = previous.get((r["target"], r["concurrency"]))
+        if old is None or "failed" in r:
+            continue
+        key = f"{r['target']} @ {r['concurrency']}"
+        if r["turns_per_s"] < old["turns_per_s"] * (1 - tolerance):
+            regressions.append(f"{key}: throughput {old['turns_per_s']} -> {r['turns_per_s']} turns/s")
+        if r.get("p95_s", 0) > old.get("p95_s", 0) * (1 + tolerance) and old.get("p95_s"):
+            regressions.append(f"{key}: p95 {old['p95_s']} -> {r['p95_s']} s")
+        old_hops = {(h["kind"], h["name"]): h for h in old.get("hops", [])}
+        for hop in r.get("hops", []):
+            before = old_hops.get((hop["kind"], hop["name"]))
+            # Overheads of a few milliseconds are mostly scheduling noise, hence the absolute floor
+            if before and hop["overhead_ms"] > max(before["overhead_ms"] * (1 + tolerance), before["overhead_ms"] + min_delta_ms):
+                regressions.append(f"{key}: {hop['kind']} {hop['name']} overhead {before['overhead_ms']} -> {hop['overhead_ms']} ms")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark every agent against the stub model server")
+    parser.add_argument("--targets", default=",".join(TARGETS), help=f"Comma-separated subset of: {', '.join(TARGETS)}")
+    parser.add_argument("--sessions", type=int, default=20, help="Sessions per target and concurrency")
+    parser.add_argument("--turns", type=int, default=1, help="Turns per session")
+    parser.add_argument("--concurrency", default="1,10", help="Comma-separated concurrency levels")
+    parser.add_argument("--base-url", help="Use an already running (stub) server instead of starting one")
+    parser.add_argument("--cache", action="store_true", help="Keep the response cache on (off by default so every turn reaches the model)")
+    parser.add_argument("--cassette-mode", choices=("record", "replay"),
+                        help="Record the model calls of every run, or replay them without the network")
+    parser.add_argument("--cassette-dir", default="cassettes", help="Folder with one cassette per target and concurrency")
+    parser.add_argument("--cassette-timing", choices=("recorded", "zero"), default="recorded",
+                        help="Replay with the recorded latencies or none (hop wall time is then pure overhead)")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds allowed per target run")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare against results saved with --output")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative regression against the baseline")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="Per-hop overhead increases below this are ignored")
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+
+    targets = [t.strip() for t in args.targets.split(",") if t.strip()]
+    unknown = [t for t in targets if t not in TARGETS]
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(unknown)}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    stub: Optional[subprocess.Popen] = None
+    base_url = args.base_url
+    if base_url is None and args.cassette_mode != "replay":
+        stub, base_url = start_stub(args)
+    try:
+        results = []
+        for name in targets:
+            for concurrency in levels:
+                print(f"Running {name} at concurrency {concurrency}...", flush=True)
+                results.append(run_target(name, concurrency, args, base_url))
+    finally:
+        if stub is not None:
+            stub.terminate()
+            stub.wait()
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_delta_ms)
+        print("\nRegressions against the baseline:" if regressions else "\nNo regressions against the baseline.")
+        for line in regressions:
+            print(f"  {line}")
+        if regressions:
+            return 1
+    return 1 if any("failed" in r for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
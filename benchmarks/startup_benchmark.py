@@ -0,0 +1,182 @@
+"""
+Startup benchmark.
+
+Measures how long each CLI takes to start, from `python -X importtime`: every
+target runs in its project folder (`uv run python ...`) several times, and the
+median total import time (the sum of the cumulative times of the top-level
+imports made after interpreter startup) is compared with the target's startup
+budget. The process wall time is
+reported as well, but not budgeted: it includes interpreter and `uv run`
+overhead, which vary more between machines.
+
+Import time follows the speed of the machine, so the budgets are scaled to
+it: a fixed set of standard-library imports (the reference) is timed the same
+way, and every budget is multiplied by its median over REFERENCE_MS, what it
+took on the machine the budgets were set on. --no-scale compares with the
+budgets as written.
+
+The exit code is 1 when any target is over its budget, so the script can run
+as a check in CI (.github/workflows/startup-budget.yml). The LangGraph tests
+also run the langgraph targets (Orchestration_Frameworks/LangGraph/tests/test_startup.py).
+
+Usage:
+    python startup_benchmark.py
+    python startup_benchmark.py --targets langgraph/meal_agent --runs 10 --budget langgraph/meal_agent=800
+    python startup_benchmark.py --json startup.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+LANGGRAPH = ROOT / "Orchestration_Frameworks" / "LangGraph"
+PYDANTIC_AI = ROOT / "CodeFirst_Libraries" / "PydanticAI"
+GMAIL_SKILL = ROOT / "MCP_and_tools" / "Skills_and_Tools" / "GmailSkill"
+
+# name -> (project folder, python arguments, import-time budget in ms). The budgets are about 20% over
+# the medians measured where REFERENCE_MS was, so a regression of that size fails the check
+TARGETS = {
+    "langgraph/agent": (LANGGRAPH, ["-c", "import agent"], 2600),
+    "langgraph/recipe_agent": (LANGGRAPH, ["-c", "import recipe_agent"], 2550),
+    "langgraph/meal_agent": (LANGGRAPH, ["-c", "import meal_agent"], 2650),
+    "langgraph/meal_agent_multi_model": (LANGGRAPH, ["-c", "import meal_agent_multi_model"], 2450),
+    "langgraph/meal_agent_no_butter": (LANGGRAPH, ["-c", "import meal_agent_no_butter"], 2800),
+    "langgraph/server": (LANGGRAPH, ["-c", "import server"], 2400),
+    "pydanticai/meal_agent": (PYDANTIC_AI, ["-c", "import meal_agent"], 5850),
+    "gmail-skill/manage_emails": (GMAIL_SKILL, ["scripts/manage_emails.py", "--help"], 47),
+}
+
+# Standard-library imports timed to scale the budgets, and their import time where the budgets were set
+REFERENCE = ["-c", "import argparse, asyncio, email.parser, http.client, json, sqlite3"]
+REFERENCE_MS = 80.0
+
+
+def interpreter() -> list[str]:
+    """The project's interpreter through `uv run` when uv is installed, else the current one."""
+    return ["uv", "run", "python"] if shutil.which("uv") else [sys.executable]
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int, int]]:
+    """(module, depth, self µs, cumulative µs) for every `import time:` line."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def measure(folder: Path, arguments: list[str]) -> dict:
+    env = {**os.environ, "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "startup-benchmark")}
+    start = time.perf_counter()
+    process = subprocess.run(
+        interpreter() + ["-X", "importtime"] + arguments,
+        cwd=folder, env=env, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1] if process.stderr.strip() else f"exit code {process.returncode}")
+    # Top-level imports (depth 0) made after interpreter startup, which ends with `site`;
+    # their cumulative times add up to the CLI's own import time
+    rows = parse_importtime(process.stderr)
+    startup = max((i for i, row in enumerate(rows) if row[:2] == ("site", 0)), default=-1)
+    top = [row for row in rows[startup + 1:] if row[1] == 0]
+    return {
+        "import_ms": sum(row[3] for row in top) / 1000,
+        "wall_ms": wall * 1000,
+        "top": sorted(top, key=lambda row: row[3], reverse=True),
+    }
+
+
+def run_target(name: str, runs: int, budget_ms: float) -> dict:
+    folder, arguments, _ = TARGETS[name]
+    # The first run writes the bytecode caches; it is not counted
+    measure(folder, arguments)
+    samples = [measure(folder, arguments) for _ in range(runs)]
+    median = sorted(samples, key=lambda s: s["import_ms"])[len(samples) // 2]
+    return {
+        "target": name,
+        "import_ms": round(statistics.median(s["import_ms"] for s in samples), 1),
+        "wall_ms": round(statistics.median(s["wall_ms"] for s in samples), 1),
+        "budget_ms": budget_ms,
+        "slowest": [{"module": row[0], "cumulative_ms": round(row[3] / 1000, 1)} for row in median["top"][:5]],
+    }
+
+
+def reference_scale(runs: int) -> tuple[float, float]:
+    """The median import time of REFERENCE on this machine, and the factor the budgets are scaled by."""
+    # Like the targets, after an uncounted run that writes the bytecode caches. It takes well under a second,
+    # so it gets extra runs: any noise in it moves every budget
+    measure(ROOT, REFERENCE)
+    reference_ms = statistics.median(measure(ROOT, REFERENCE)["import_ms"] for _ in range(max(runs, 9)))
+    return reference_ms, reference_ms / REFERENCE_MS
+
+
+def print_report(results: list[dict]):
+    print(f"{'target':34} {'import_ms':>10} {'budget_ms':>10} {'wall_ms':>9}  status")
+    for r in results:
+        if "error" in r:
+            print(f"{r['target']:34} {'-':>10} {r['budget_ms']:>10} {'-':>9}  ERROR {r['error']}")
+            continue
+        status = "ok" if r["import_ms"] <= r["budget_ms"] else "OVER BUDGET"
+        print(f"{r['target']:34} {r['import_ms']:>10.1f} {r['budget_ms']:>10} {r['wall_ms']:>9.1f}  {status}")
+        for row in r["slowest"]:
+            print(f"{'':36}{row['cumulative_ms']:>8.1f}  {row['module']}")
+
+
+def parse_budgets(values: list[str]) -> dict[str, float]:
+    budgets = {}
+    for value in values:
+        name, _, ms = value.partition("=")
+        if name not in TARGETS or not ms:
+            raise SystemExit(f"--budget expects TARGET=MS with a known target, got {value!r}")
+        budgets[name] = float(ms)
+    return budgets
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure CLI startup import time against a budget")
+    parser.add_argument("--targets", default=",".join(TARGETS), help="Comma-separated targets to measure")
+    parser.add_argument("--runs", type=int, default=5, help="Measured runs per target (the median is reported)")
+    parser.add_argument("--budget", action="append", default=[], help="Override a budget: TARGET=MS (repeatable)")
+    parser.add_argument("--no-scale", action="store_true", help="Compare with the budgets as written, not scaled to this machine")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    budgets = {name: budget for name, (_, _, budget) in TARGETS.items()}
+    budgets.update(parse_budgets(args.budget))
+    names = args.targets.split(",")
+    unknown = [name for name in names if name not in TARGETS]
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(unknown)} (choose from {', '.join(TARGETS)})")
+    if not args.no_scale:
+        reference_ms, scale = reference_scale(args.runs)
+        print(f"Reference imports: {reference_ms:.1f} ms ({REFERENCE_MS:.1f} ms where the budgets were set), budgets x{scale:.2f}")
+        # Explicit --budget values are taken as they are
+        overridden = set(parse_budgets(args.budget))
+        budgets = {name: budget if name in overridden else round(budget * scale, 1) for name, budget in budgets.items()}
+    results = []
+    for name in names:
+        try:
+            results.append(run_target(name, args.runs, budgets[name]))
+        except RuntimeError as e:
+            results.append({"target": name, "budget_ms": budgets[name], "error": str(e)})
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    failed = [r for r in results if "error" in r or r["import_ms"] > r["budget_ms"]]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
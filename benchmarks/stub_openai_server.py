@@ -0,0 +1,442 @@
+"""
+Local OpenAI-compatible stub model server.
+
+Answers /v1/chat/completions and /v1/responses (plain and streaming) with
+canned output, so the agents can be load-tested without paying for API calls.
+Point any agent at it with OPENAI_BASE_URL.
+
+- Latency: the time to the first token is drawn from a distribution (fixed,
+  uniform, normal, lognormal or exponential); after that tokens are emitted at
+  --tokens-per-second (0 sends them all at once).
+- Structured output: when the request carries a JSON schema (response_format /
+  text.format) or asks for a tool call (tool_choice, or a PydanticAI
+  `final_result` output tool), the reply is generated from the schema. Enum
+  values mentioned in the last user message are preferred, so routers pick the
+  category the prompt names.
+- GET /stats reports the requests served and the time spent serving them, which
+  the benchmark driver subtracts from the client-side timings.
+
+Usage:
+    python stub_openai_server.py --port 8001 --latency 0.2 --latency-dist lognormal --jitter 0.3 --tokens-per-second 200
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=stub uv run meal_agent.py
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+CANNED_REPLY = (
+    "Hi, I'm your chef. Here is a simple recipe.\n"
+    "Ingredients:\n- 2 eggs\n- 1 cup flour\n- 1 cup milk\n- olive oil\n"
+    "Instructions:\n1. Whisk everything together.\n2. Cook in a hot pan until golden."
+)
+
+# Values for well-known field names in generated structured output; anything else gets a placeholder
+CANNED_FIELDS = {
+    "greeting": "Hi, I'm your chef.",
+    "recipe_name": "Golden Pancakes",
+    "ingredients": ["2 eggs", "1 cup flour", "1 cup milk", "olive oil"],
+    "instructions": ["Whisk everything together.", "Cook in a hot pan until golden."],
+    "energy_level": "High",
+    "passed": True,
+    "reason": "No butter found.",
+}
+
+DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+
+
+# --- Latency ---
+class LatencyModel:
+    """
+    Time to first token and per-token delay. `mean` is the mean (the median for
+    lognormal); `jitter` is the half-width (uniform), standard deviation (normal)
+    or sigma of the underlying normal (lognormal).
+    """
+
+    def __init__(self, dist: str = "fixed", mean: float = 0.2, jitter: float = 0.0,
+                 tokens_per_second: float = 0.0, seed: Optional[int] = None):
+        if dist not in DISTRIBUTIONS:
+            raise ValueError(f"unknown latency distribution {dist!r}")
+        self.dist = dist
+        self.mean = mean
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def first_token(self) -> float:
+        with self._lock:
+            if self.dist == "uniform":
+                value = self._random.uniform(self.mean - self.jitter, self.mean + self.jitter)
+            elif self.dist == "normal":
+                value = self._random.gauss(self.mean, self.jitter)
+            elif self.dist == "lognormal":
+                value = self._random.lognormvariate(math.log(self.mean), self.jitter) if self.mean > 0 else 0.0
+            elif self.dist == "exponential":
+                value = self._random.expovariate(1 / self.mean) if self.mean > 0 else 0.0
+            else:
+                value = self.mean
+        return max(0.0, value)
+
+    def per_token(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+
+class Stats:
+    def __init__(self):
+        self.requests = 0
+        self.service_s = 0.0
+        self.output_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, service_s: float, output_tokens: int):
+        with self._lock:
+            self.requests += 1
+            self.service_s += service_s
+            self.output_tokens += output_tokens
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "service_s": round(self.service_s, 6), "output_tokens": self.output_tokens}
+
+
+# --- Canned Output ---
+def sample_value(schema: dict, defs: dict, name: str = "", hint: str = ""):
+    """A value that validates against a JSON schema (the subset Pydantic and PydanticAI emit)."""
+    if "$ref" in schema:
+        schema = defs.get(schema["$ref"].split("/")[-1], {})
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"] or schema[key]
+            return sample_value(options[0], defs, name, hint)
+    if "const" in schema:
+        return schema["const"]
+    if "enum" in schema:
+        mentioned = [v for v in schema["enum"] if isinstance(v, str) and v.lower() in hint.lower()]
+        return (mentioned or schema["enum"])[0]
+    if name in CANNED_FIELDS:
+        return CANNED_FIELDS[name]
+    kind = schema.get("type", "object" if "properties" in schema else "string")
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "string")
+    if kind == "object":
+        return {key: sample_value(value, defs, key, hint) for key, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        items = schema.get("items", {"type": "string"})
+        return [sample_value(items, defs, name, hint) for _ in range(max(schema.get("minItems", 0), 2))]
+    if kind == "integer":
+        return max(schema.get("minimum", 1), 1)
+    if kind == "number":
+        return float(max(schema.get("minimum", 1.0), 1.0))
+    if kind == "boolean":
+        return True
+    return f"stub {name or 'text'}"
+
+
+def schema_json(schema: dict, hint: str) -> str:
+    return json.dumps(sample_value(schema, schema.get("$defs", schema.get("definitions", {})), hint=hint))
+
+
+def text_of(content) -> str:
+    """Text of a message content: a string or a list of text parts (either API)."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(p.get("text", "") for p in content if isinstance(p, dict))
+    return ""
+
+
+def plan_reply(tools: dict, tool_choice, schema: Optional[dict], after_tool: bool, hint: str, reply: str) -> dict:
+    """
+    Decides what to answer: {"text": ...} or {"tool": name, "arguments": json}.
+    A forced or required tool is called; otherwise an output tool (PydanticAI's
+    `final_result*`) is called, and other tools are only answered in text so
+    tool loops end after one round.
+    """
+    forced = None
+    if isinstance(tool_choice, dict):
+        forced = tool_choice.get("name") or (tool_choice.get("function") or {}).get("name")
+    output_tools = [n for n in tools if n.startswith("final_result")]
+    if forced in tools:
+        name = forced
+    elif output_tools:
+        name = output_tools[0]
+    elif tool_choice == "required" and tools and not after_tool:
+        name = next(iter(tools))
+    else:
+        name = None
+    if name is not None:
+        return {"tool": name, "arguments": schema_json(tools[name] or {}, hint)}
+    if schema is not None:
+        return {"text": schema_json(schema, hint)}
+    return {"text": reply}
+
+
+def reply_tokens(planned: dict) -> list[str]:
+    """The reply split into the chunks that are streamed (about one token each)."""
+    if "tool" in planned:
+        arguments = planned["arguments"]
+        return [arguments[i:i + 8] for i in range(0, len(arguments), 8)] or [""]
+    words = planned["text"].split(" ")
+    return [w + " " for w in words[:-1]] + words[-1:]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; without TCP_NODELAY, Nagle's algorithm adds ~40ms per response
+    disable_nagle_algorithm = True
+    latency = LatencyModel()
+    stats = Stats()
+    reply = CANNED_REPLY
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            self.send_json(self.stats.snapshot())
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        if path.endswith("/chat/completions"):
+            handler = self.chat_completion
+        elif path.endswith("/responses"):
+            handler = self.response
+        else:
+            self.send_error(404)
+            return
+        started = time.perf_counter()
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(self.latency.first_token())
+        output_tokens = handler(body)
+        self.stats.add(time.perf_counter() - started, output_tokens)
+
+    def emit(self, chunks: list[str], send) -> None:
+        """Sends every chunk through `send`, paced at the configured token rate."""
+        delay = self.latency.per_token()
+        for chunk in chunks:
+            if delay:
+                time.sleep(delay)
+            send(chunk)
+
+    # --- Chat Completions ---
+    def chat_completion(self, body: dict) -> int:
+        messages = body.get("messages", [])
+        tools = {t["function"]["name"]: t["function"].get("parameters") for t in body.get("tools", []) if "function" in t}
+        response_format = body.get("response_format") or {}
+        schema = (response_format.get("json_schema") or {}).get("schema") if response_format.get("type") == "json_schema" else None
+        users = [m for m in messages if m.get("role") == "user"]
+        planned = plan_reply(
+            tools, body.get("tool_choice"), schema,
+            after_tool=bool(messages) and messages[-1].get("role") == "tool",
+            hint=text_of(users[-1].get("content")) if users else "",
+            reply=self.reply,
+        )
+        chunks = reply_tokens(planned)
+        usage = {
+            "prompt_tokens": sum(len(text_of(m.get("content")).split()) for m in messages),
+            "completion_tokens": len(chunks),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if body.get("stream"):
+            self.stream_chat(body, planned, chunks, usage)
+        else:
+            if self.latency.per_token():
+                time.sleep(len(chunks) * self.latency.per_token())
+            self.send_json(self.completion(body, planned, usage))
+        return len(chunks)
+
+    def completion(self, body: dict, planned: dict, usage: dict) -> dict:
+        if "tool" in planned:
+            message = {"role": "assistant", "content": None, "tool_calls": [{
+                "id": f"call_{uuid.uuid4().hex[:24]}", "type": "function",
+                "function": {"name": planned["tool"], "arguments": planned["arguments"]},
+            }]}
+            finish_reason = "tool_calls"
+        else:
+            message = {"role": "assistant", "content": planned["text"]}
+            finish_reason = "stop"
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": usage,
+        }
+
+    def stream_chat(self, body: dict, planned: dict, chunks: list[str], usage: dict):
+        self.start_stream()
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        def send(delta: dict, finish_reason=None, **extra):
+            self.send_event({
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+                **extra,
+            })
+
+        if "tool" in planned:
+            call_id = f"call_{uuid.uuid4().hex[:24]}"
+            send({"role": "assistant", "tool_calls": [{
+                "index": 0, "id": call_id, "type": "function", "function": {"name": planned["tool"], "arguments": ""},
+            }]})
+            self.emit(chunks, lambda c: send({"tool_calls": [{"index": 0, "function": {"arguments": c}}]}))
+            send({}, "tool_calls")
+        else:
+            self.emit(chunks, lambda c: send({"content": c}))
+            send({}, "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            send(None, usage=usage)
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.write_chunk(b"")
+
+    # --- Responses ---
+    def response(self, body: dict) -> int:
+        items = body.get("input", [])
+        if isinstance(items, str):
+            items = [{"role": "user", "content": items}]
+        tools = {t["name"]: t.get("parameters") for t in body.get("tools", []) if t.get("type") == "function"}
+        text_format = (body.get("text") or {}).get("format") or {}
+        schema = text_format.get("schema") if text_format.get("type") == "json_schema" else None
+        users = [i for i in items if i.get("role") == "user"]
+        planned = plan_reply(
+            tools, body.get("tool_choice"), schema,
+            after_tool=bool(items) and items[-1].get("type") == "function_call_output",
+            hint=text_of(users[-1].get("content")) if users else "",
+            reply=self.reply,
+        )
+        chunks = reply_tokens(planned)
+        input_tokens = len(text_of(body.get("instructions")).split()) + sum(
+            len(text_of(i.get("content", i.get("output", ""))).split()) for i in items
+        )
+        usage = {
+            "input_tokens": input_tokens, "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": len(chunks), "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + len(chunks),
+        }
+        if body.get("stream"):
+            self.stream_response(body, planned, chunks, usage)
+        else:
+            if self.latency.per_token():
+                time.sleep(len(chunks) * self.latency.per_token())
+            self.send_json(self.response_object(body, [self.output_item(planned)], usage))
+        return len(chunks)
+
+    def output_item(self, planned: dict, done: bool = True, item_id: Optional[str] = None) -> dict:
+        status = "completed" if done else "in_progress"
+        if "tool" in planned:
+            return {
+                "type": "function_call", "id": item_id or f"fc_{uuid.uuid4().hex}", "call_id": f"call_{uuid.uuid4().hex[:24]}",
+                "name": planned["tool"], "arguments": planned["arguments"] if done else "", "status": status,
+            }
+        content = [{"type": "output_text", "text": planned["text"], "annotations": []}] if done else []
+        return {"type": "message", "id": item_id or f"msg_{uuid.uuid4().hex}", "role": "assistant", "status": status, "content": content}
+
+    def response_object(self, body: dict, output: list, usage: Optional[dict], status: str = "completed", response_id: Optional[str] = None) -> dict:
+        return {
+            "id": response_id or f"resp_{uuid.uuid4().hex}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "status": status,
+            "model": body.get("model", "stub"),
+            "output": output,
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": usage,
+        }
+
+    def stream_response(self, body: dict, planned: dict, chunks: list[str], usage: dict):
+        self.start_stream()
+        response_id = f"resp_{uuid.uuid4().hex}"
+        item = self.output_item(planned, done=False)
+        sequence = iter(range(1_000_000))
+
+        def send(kind: str, **payload):
+            self.send_event({"type": kind, "sequence_number": next(sequence), **payload}, event=kind)
+
+        send("response.created", response=self.response_object(body, [], None, "in_progress", response_id))
+        send("response.output_item.added", output_index=0, item=item)
+        if "tool" in planned:
+            self.emit(chunks, lambda c: send("response.function_call_arguments.delta", item_id=item["id"], output_index=0, delta=c))
+            send("response.function_call_arguments.done", item_id=item["id"], output_index=0, arguments=planned["arguments"])
+            done = dict(item, arguments=planned["arguments"], status="completed")
+        else:
+            part = {"type": "output_text", "text": "", "annotations": []}
+            send("response.content_part.added", item_id=item["id"], output_index=0, content_index=0, part=part)
+            self.emit(chunks, lambda c: send(
+                "response.output_text.delta", item_id=item["id"], output_index=0, content_index=0, delta=c, logprobs=[],
+            ))
+            send("response.output_text.done", item_id=item["id"], output_index=0, content_index=0, text=planned["text"], logprobs=[])
+            part = dict(part, text=planned["text"])
+            send("response.content_part.done", item_id=item["id"], output_index=0, content_index=0, part=part)
+            done = dict(item, content=[part], status="completed")
+        send("response.output_item.done", output_index=0, item=done)
+        send("response.completed", response=self.response_object(body, [done], usage, response_id=response_id))
+        self.write_chunk(b"")
+
+    # --- Transport ---
+    def send_json(self, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def start_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def send_event(self, payload: dict, event: Optional[str] = None):
+        prefix = f"event: {event}\n" if event else ""
+        self.write_chunk(f"{prefix}data: {json.dumps(payload)}\n\n".encode())
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def add_latency_arguments(parser: argparse.ArgumentParser):
+    """The stub's latency options, shared with the benchmark driver."""
+    parser.add_argument("--latency", type=float, default=0.2, help="Mean seconds to the first token (median for lognormal)")
+    parser.add_argument("--latency-dist", choices=DISTRIBUTIONS, default="fixed", help="Distribution of the time to the first token")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="Spread: half-width (uniform), stddev (normal) or sigma (lognormal)")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Output token rate after the first token (0 = instant)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the latency distribution")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub model server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--reply-file", help="File with the canned text reply")
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+
+    StubHandler.latency = LatencyModel(args.latency_dist, args.latency, args.jitter, args.tokens_per_second, args.seed)
+    if args.reply_file:
+        with open(args.reply_file) as f:
+            StubHandler.reply = f.read()
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.daemon_threads = True
+    print(f"Stub model server listening on http://{args.host}:{args.port}/v1", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()